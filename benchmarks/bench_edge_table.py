@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+"""
+Memory and garbage collection cost of the edges extracted from a synthetic response: the columnar EdgeTable built
+by extracting_drug_fda_publ_date, against the same edges as a DataFrame with a list of publications per row (the
+former representation, rebuilt here with EdgeTable.to_frame). No lookup is made. Reports the extraction time, the
+memory held by each representation (tracemalloc) and the time of a full gc.collect() while it is alive.
+
+    python benchmarks/bench_edge_table.py --results 50000
+"""
+
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(HERE, '..', 'src'))
+
+
+def held(build):
+    # (the object built, the Python memory it holds, in MB)
+    gc.collect()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    value = build()
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return value, (after - before) / 2 ** 20
+
+
+def collect_time(repeat=5):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        gc.collect()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Columnar edge table vs a DataFrame of per-edge lists')
+    parser.add_argument('--results', type=int, default=50000)
+    args = parser.parse_args()
+
+    os.environ['NOVELTY_CACHE_DIR'] = ''
+    from synthetic import make_response
+    from message_index import MessageIndex
+    from novelty_score_calculation import extracting_drug_fda_publ_date
+
+    response = make_response(args.results)
+    index = MessageIndex(response)
+    start = time.perf_counter()
+    table, _ = extracting_drug_fda_publ_date(response, index.unknown, index=index, lookup_publications=False)
+    print(f"{len(table)} edges extracted in {time.perf_counter() - start:.2f}s")
+    table = None
+
+    baseline = collect_time()
+    columns = ['edge', 'edge_id', 'drug', 'fda status', 'publications', 'number_of_publ']
+    table, table_mb = held(lambda: extracting_drug_fda_publ_date(response, index.unknown, index=index,
+                                                                 lookup_publications=False)[0])
+    table_gc = collect_time()
+    frame, frame_mb = held(lambda: table.to_frame(columns))
+    table = None
+    frame_gc = collect_time()
+    print(f"{'EdgeTable':<26} {table_mb:8.1f} MB  gc.collect {1000 * (table_gc - baseline):7.1f} ms")
+    print(f"{'DataFrame of lists':<26} {frame_mb:8.1f} MB  gc.collect {1000 * (frame_gc - baseline):7.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
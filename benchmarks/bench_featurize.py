@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+"""
+Times the featurization (SMILES parsing and packed Morgan fingerprints) of a batch of molecules in the calling
+process and over a pool of workers writing to shared memory, and checks that both give the same fingerprints
+and report the same invalid molecules.
+
+    python benchmarks/bench_featurize.py --molecules 100000 --workers 8
+"""
+
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(HERE, '..', 'src'))
+
+from rdkit import RDLogger
+from featurize import featurize
+from synthetic import SMILES_POOL
+
+
+def molecules(count, seed):
+    # Variations of the pool molecules (with a small alkane fragment), about 1 in 1000 of them invalid
+    rng = np.random.default_rng(seed)
+    smiles = {}
+    for i in range(count):
+        base = SMILES_POOL[rng.integers(len(SMILES_POOL))]
+        smiles[f'M{i}'] = f"{base}.{'C' * int(rng.integers(1, 5))}" if rng.random() > 0.001 else base + '('
+    return smiles
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--molecules', type=int, default=100000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    RDLogger.DisableLog('rdApp.*')
+
+    smiles = molecules(args.molecules, args.seed)
+    timings = {}
+    results = {}
+    for workers in sorted({1, args.workers}):
+        start = time.perf_counter()
+        results[workers] = featurize(smiles, workers=workers)
+        timings[workers] = time.perf_counter() - start
+        print(f"{workers:>3} workers: {timings[workers]:8.2f} s  {args.molecules / timings[workers]:10.0f} molecules/s  "
+              f"{len(results[workers][3])} invalid")
+    keys, fps, counts, invalid = results[1]
+    other = results[args.workers]
+    assert keys == other[0] and np.array_equal(fps, other[1]) and np.array_equal(counts, other[2])
+    assert invalid == other[3]
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+"""
+Start-up cost of the scorer: the import time of its entry modules, each in a fresh interpreter (median of --repeat
+runs), with the heavy dependencies the import loaded, then the wall time of short scoring jobs, one process per
+small response file like the per-PK jobs, against the stub services and a warm cache.
+
+    python benchmarks/bench_import.py --repeat 5 --results 200
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(HERE, '..', 'src')
+sys.path.insert(0, HERE)
+
+MODULES = ['novelty_score_calculation', 'stream', 'incremental', 'service', 'mol_similarity', 'edge_table']
+HEAVY = ['pandas', 'rdkit', 'bs4', 'requests', 'numpy']
+
+IMPORT = """
+import sys, time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start, ' '.join(name for name in {heavy!r} if name in sys.modules))
+"""
+
+
+def import_time(module, repeat):
+    times = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', IMPORT.format(module=module, heavy=HEAVY)], cwd=SRC,
+                             capture_output=True, text=True, check=True).stdout.split(maxsplit=1)
+        times.append(float(out[0]))
+    return statistics.median(times), out[1].strip() if len(out) > 1 else ''
+
+
+def job_time(args, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, 'novelty_score_calculation.py'] + args, cwd=SRC, capture_output=True,
+                       check=True)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import time and short job wall time of the scorer')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--results', type=int, default=200, help='results of the response of each short job')
+    args = parser.parse_args()
+
+    print(f"{'module':<28} {'import':>8}  heavy modules loaded")
+    for module in MODULES:
+        seconds, loaded = import_time(module, args.repeat)
+        print(f"{module:<28} {seconds:7.3f}s  {loaded}")
+
+    from synthetic import make_response
+    from stubs import StubServices
+    with tempfile.TemporaryDirectory() as directory, StubServices():
+        os.environ['NOVELTY_CACHE_DIR'] = os.path.join(directory, 'cache')
+        path = os.path.join(directory, 'response.json')
+        with open(path, 'w') as f:
+            json.dump(make_response(args.results), f)
+        # Warms the cache, the jobs then only pay the start-up and the scoring
+        job_time([path], 1)
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', 'pass'], check=True)
+        print(f"\nshort jobs, {args.results} results, warm cache (bare interpreter "
+              f"{time.perf_counter() - start:.3f}s)")
+        for name, job in [('scores (DataFrame, JSON)', [path]), ('--stream (NDJSON)', [path, '--stream'])]:
+            print(f"{name:<28} {job_time(job, args.repeat):7.3f}s")
+
+
+if __name__ == '__main__':
+    main()
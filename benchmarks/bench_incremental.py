@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+
+"""
+Rescoring of a growing merged response: a large first version followed by small deltas, scored by an
+IncrementalScorer and from scratch by score_response, against the stub services and without persistent cache
+(NOVELTY_CACHE_DIR is emptied), so that the full rescoring pays its lookups again as it did before. Checks that
+both give the same scores and reports the time and the upstream requests of each version.
+
+    python benchmarks/bench_incremental.py --first 10000 --delta 200 --versions 5 --latency 0.02
+"""
+
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(HERE, '..', 'src'))
+
+
+def same_scores(a, b):
+    a = a.sort_values(['drug', 'novelty_score']).reset_index(drop=True)
+    b = b.sort_values(['drug', 'novelty_score']).reset_index(drop=True)
+    return a['drug'].tolist() == b['drug'].tolist() and np.allclose(a['novelty_score'], b['novelty_score'],
+                                                                     equal_nan=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Incremental vs full rescoring of a growing response')
+    parser.add_argument('--first', type=int, default=5000, help='results of the first version')
+    parser.add_argument('--delta', type=int, default=100, help='results added by each later version')
+    parser.add_argument('--versions', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds added to each stub answer')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    os.environ['NOVELTY_CACHE_DIR'] = ''
+    from synthetic import make_response
+    from stubs import StubServices
+    from novelty_score_calculation import score_response
+    from incremental import IncrementalScorer
+
+    largest = args.first + args.delta * (args.versions - 1)
+    # Same pools for every version, so that each one is the previous one plus its new results
+    pools = dict(n_drugs=max(1, largest // 10), n_publications=2 * largest, seed=args.seed)
+    scorer = IncrementalScorer()
+    print(f"{'results':>8} {'incremental s':>14} {'requests':>9} {'full s':>8} {'requests':>9} {'same':>5}")
+    with StubServices(latency=args.latency) as stubs:
+        for version in range(args.versions):
+            response = make_response(args.first + args.delta * version, **pools)
+            measures = []
+            for score in (scorer.update, score_response):
+                before = sum(value for key, value in stubs.requests.items() if key != 'throttled')
+                start = time.perf_counter()
+                df = score(response)
+                elapsed = time.perf_counter() - start
+                measures.append((df, elapsed, sum(value for key, value in stubs.requests.items()
+                                                  if key != 'throttled') - before))
+            (incremental, t_incremental, r_incremental), (full, t_full, r_full) = measures
+            print(f"{len(response['fields']['data']['message']['results']):>8} {t_incremental:>14.3f} "
+                  f"{r_incremental:>9} {t_full:>8.3f} {r_full:>9} {str(same_scores(incremental, full)):>5}")
+
+
+if __name__ == '__main__':
+    main()
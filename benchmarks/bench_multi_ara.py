@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+
+"""
+Scoring of the responses of several ARAs to the same query: each response on its own with score_response, then
+all of them together with score_responses, against the stub services and without persistent cache
+(NOVELTY_CACHE_DIR is emptied). The synthetic ARAs draw their drugs and publications from the same pools, so
+that they overlap as in real queries. Reports the upstream requests and lookups of both and checks that the
+scores are the same.
+
+    python benchmarks/bench_multi_ara.py --aras 10 --results 2000 --latency 0.02
+"""
+
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(HERE, '..', 'src'))
+
+
+def same_scores(a, b):
+    if a.empty or b.empty:
+        return a.empty and b.empty
+    a = a.sort_values(['drug', 'novelty_score']).reset_index(drop=True)
+    b = b.sort_values(['drug', 'novelty_score']).reset_index(drop=True)
+    return a['drug'].tolist() == b['drug'].tolist() and np.allclose(a['novelty_score'], b['novelty_score'],
+                                                                     equal_nan=True)
+
+
+def lookups(stages):
+    return {name: stages[name]['items'] for name in ('publications', 'smiles') if name in stages}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-ARA vs shared lookups of the responses to a query')
+    parser.add_argument('--aras', type=int, default=10)
+    parser.add_argument('--results', type=int, default=1000, help='results per ARA')
+    parser.add_argument('--drugs', type=int, default=None, help='pool of drugs shared by the ARAs')
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds added to each stub answer')
+    args = parser.parse_args()
+
+    os.environ['NOVELTY_CACHE_DIR'] = ''
+    from synthetic import make_response
+    from stubs import StubServices
+    from metrics import Metrics, use_metrics
+    from novelty_score_calculation import score_response, score_responses
+
+    pools = dict(n_drugs=args.drugs or max(1, args.results // 5), n_publications=2 * args.results)
+    responses = {f'ara{i}': make_response(args.results, seed=i, **pools) for i in range(args.aras)}
+
+    with StubServices(latency=args.latency) as stubs:
+        metrics = Metrics()
+        start = time.perf_counter()
+        with use_metrics(metrics):
+            separate = {name: score_response(response) for name, response in responses.items()}
+        t_separate = time.perf_counter() - start
+        r_separate = sum(value for key, value in stubs.requests.items() if key != 'throttled')
+        stages_separate = metrics.as_dict()
+
+        start = time.perf_counter()
+        together, stages_together = score_responses(responses, return_metrics=True)
+        t_together = time.perf_counter() - start
+        r_together = sum(value for key, value in stubs.requests.items() if key != 'throttled') - r_separate
+
+    print(f"{args.aras} ARAs x {args.results} results")
+    print(f"  score_response per ARA: {t_separate:.2f}s, {r_separate} requests, lookups {lookups(stages_separate)}")
+    print(f"  score_responses:        {t_together:.2f}s, {r_together} requests, lookups {lookups(stages_together)}")
+    print(f"  same scores: {all(same_scores(separate[name], together[name]) for name in responses)}")
+
+
+if __name__ == '__main__':
+    main()
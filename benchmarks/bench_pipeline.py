@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+
+"""
+Offline end to end benchmark of compute_novelty: synthetic responses of 1k / 10k / 100k results are scored
+against the in-process stub services (see stubs.py), so nothing leaves the machine. Each size runs in its own
+process with an empty cache directory, so that the peak memory (max RSS) and the timings of one size do not
+leak into the next one. A second, warm run measures the scoring with every lookup answered by the cache.
+
+    python benchmarks/bench_pipeline.py --sizes 1000 10000 100000 --latency 0.02 --json results.json
+"""
+
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(HERE, '..', 'src'))
+
+
+def run_size(n_results, latency, edges_per_result, pubs_per_edge, known_fraction, seed):
+    """ Runs in the child process: generates the response, scores it cold then warm, returns the measures. """
+    from synthetic import make_response
+    from stubs import StubServices
+    from novelty_score_calculation import compute_novelty
+
+    response = make_response(n_results, edges_per_result=edges_per_result, pubs_per_edge=pubs_per_edge,
+                             known_fraction=known_fraction, seed=seed)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'response.json')
+        with open(path, 'w') as f:
+            json.dump(response, f)
+        size_bytes = os.path.getsize(path)
+        del response
+
+        measures = {'results': n_results, 'response_bytes': size_bytes}
+        with StubServices(latency=latency) as stubs:
+            for run in ('cold', 'warm'):
+                start = time.perf_counter()
+                df, stages = compute_novelty(path, return_metrics=True)
+                elapsed = time.perf_counter() - start
+                measures[run] = {
+                    'wall_time': elapsed,
+                    'results_per_s': n_results / elapsed if elapsed else float('inf'),
+                    'rows': len(df),
+                    'stages': stages,
+                }
+            measures['stub_requests'] = dict(stubs.requests)
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    measures['peak_rss_mb'] = max_rss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    return measures
+
+
+def run_in_child(args, n_results):
+    cache_dir = tempfile.mkdtemp(prefix='novelty_bench_cache_')
+    env = dict(os.environ, NOVELTY_CACHE_DIR=cache_dir)
+    command = [sys.executable, os.path.abspath(__file__), '--child', str(n_results), '--latency', str(args.latency),
+               '--edges-per-result', str(args.edges_per_result), '--pubs-per-edge', str(args.pubs_per_edge),
+               '--known-fraction', str(args.known_fraction), '--seed', str(args.seed)]
+    try:
+        completed = subprocess.run(command, env=env, capture_output=True, text=True)
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    if completed.returncode != 0:
+        print(completed.stderr, file=sys.stderr)
+        raise SystemExit(f'benchmark of {n_results} results failed')
+    # The measures are the last line, the scorer may print before it
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def report(measures):
+    print(f"{measures['results']:>8} results  {measures['response_bytes'] / 1e6:8.1f} MB  "
+          f"peak RSS {measures['peak_rss_mb']:8.1f} MB  stub requests {measures['stub_requests']}")
+    for run in ('cold', 'warm'):
+        entry = measures[run]
+        print(f"    {run:<5} {entry['wall_time']:8.2f} s  {entry['results_per_s']:10.0f} results/s  {entry['rows']} rows")
+        for name, stage in entry['stages'].items():
+            print(f"        {name:<16} {stage['wall_time']:8.3f} s  http {stage.get('http_requests', 0):>5}  "
+                  f"cache hits {stage.get('cache_hits', 0):>7}  misses {stage.get('cache_misses', 0):>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds per stub request')
+    parser.add_argument('--edges-per-result', type=int, default=2)
+    parser.add_argument('--pubs-per-edge', type=float, default=3)
+    parser.add_argument('--known-fraction', type=float, default=0.3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='also write the measures to this file')
+    parser.add_argument('--child', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        measures = run_size(args.child, args.latency, args.edges_per_result, args.pubs_per_edge,
+                            args.known_fraction, args.seed)
+        print(json.dumps(measures))
+        return
+
+    all_measures = []
+    for n_results in args.sizes:
+        measures = run_in_child(args, n_results)
+        report(measures)
+        all_measures.append(measures)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(all_measures, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
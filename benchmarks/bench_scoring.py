@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+
+"""
+Times the row-wise df.apply of the scalar scoring functions against the vectorized path, on random columns with
+NaNs included. That both give the same scores is checked by tests/test_scoring.py.
+
+    python benchmarks/bench_scoring.py --rows 50000
+"""
+
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(HERE, '..', 'src'))
+
+from novelty_score_calculation import (recency_function_exp, recency_function_exp_vec, novelty_score,
+                                       novelty_score_vec)
+from synthetic import random_columns
+
+
+def scalar_scores(df):
+    df = df.copy()
+    df['recency'] = df.apply(lambda row: recency_function_exp(row['number_of_publ'], row['age_oldest_pub'], 100, 50), axis=1)
+    df['novelty_score'] = df.apply(lambda row: novelty_score(row['fda status'], row['recency'], row['similarity']), axis=1)
+    return df
+
+
+def vector_scores(df):
+    df = df.copy()
+    df['recency'] = recency_function_exp_vec(df['number_of_publ'].to_numpy(), df['age_oldest_pub'].to_numpy(), 100, 50)
+    df['novelty_score'] = novelty_score_vec(df['fda status'].to_numpy(dtype=float), df['recency'].to_numpy(),
+                                            df['similarity'].to_numpy(dtype=float))
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    df = random_columns(args.rows, np.random.default_rng(args.seed))
+    for name, fn in [('df.apply', scalar_scores), ('vectorized', vector_scores)]:
+        start = time.perf_counter()
+        fn(df)
+        seconds = time.perf_counter() - start
+        print(f"{name:>12}: {seconds:8.3f} s for {args.rows} rows")
+
+
+if __name__ == '__main__':
+    main()
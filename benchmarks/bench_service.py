@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+
+"""
+Offline benchmark of the scoring service (src/service.py): the service runs against the stub upstreams and is
+sent synthetic responses, from a few concurrent clients. The first requests find the caches of the workers
+cold, the following ones mostly warm, as in production where the same drugs and publications come back.
+
+    python benchmarks/bench_service.py --requests 40 --results 2000 --workers 2 --clients 4
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+import numpy as np
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(HERE, '..', 'src'))
+
+from synthetic import make_response
+from stubs import StubServices
+
+
+def start_service(workers):
+    from service import NoveltyService
+    ready = threading.Event()
+    holder = {}
+
+    def run():
+        async def main():
+            holder['service'] = await NoveltyService(workers=workers).start('127.0.0.1', 0)
+            holder['loop'] = asyncio.get_running_loop()
+            ready.set()
+            await holder['service'].serve_forever()
+        try:
+            asyncio.run(main())
+        except asyncio.CancelledError:
+            pass
+
+    threading.Thread(target=run, daemon=True).start()
+    ready.wait()
+    return holder
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=40)
+    parser.add_argument('--results', type=int, default=2000, help='results per response')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds per stub request')
+    args = parser.parse_args()
+
+    # Responses of the same query from different runs: the drugs and publications overlap
+    bodies = [json.dumps(make_response(args.results, seed=i, n_drugs=max(1, args.results // 10),
+                                       n_publications=2 * args.results)).encode() for i in range(args.requests)]
+    with StubServices(latency=args.latency) as stubs:
+        start = time.perf_counter()
+        holder = start_service(args.workers)
+        print(f"service started in {time.perf_counter() - start:.2f}s")
+        url = f"http://127.0.0.1:{holder['service'].port}/score"
+
+        latencies = [None] * len(bodies)
+        next_body = iter(range(len(bodies)))
+        lock = threading.Lock()
+
+        def client():
+            session = requests.Session()
+            while True:
+                with lock:
+                    i = next(next_body, None)
+                if i is None:
+                    return
+                t = time.perf_counter()
+                answer = session.post(url, data=bodies[i], headers={'Content-Type': 'application/json'})
+                answer.raise_for_status()
+                latencies[i] = time.perf_counter() - t
+
+        start = time.perf_counter()
+        clients = [threading.Thread(target=client) for _ in range(args.clients)]
+        for thread in clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        first = np.array(latencies[:args.clients])
+        rest = np.array(latencies[args.clients:]) if len(latencies) > args.clients else first
+        print(f"{len(bodies)} requests of {args.results} results in {elapsed:.2f}s, {len(bodies) / elapsed:.1f} requests/s")
+        print(f"first {args.clients} requests: median {np.median(first):.3f}s")
+        print(f"following requests: median {np.median(rest):.3f}s  p95 {np.percentile(rest, 95):.3f}s")
+        print(f"stub requests {stubs.requests}")
+        print(requests.get(url.replace('/score', '/metrics')).text.count('\n'), 'metric lines')
+        holder['loop'].call_soon_threadsafe(lambda: [task.cancel() for task in asyncio.all_tasks(holder['loop'])])
+
+
+if __name__ == '__main__':
+    main()
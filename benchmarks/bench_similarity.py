@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+
+"""
+Compares the exhaustive top-k Tanimoto search (FingerprintLibrary) with the bound-pruned search
+(PrunedLibrary, optionally sharded over processes) on a synthetic library, and checks that both
+return exactly the same neighbors. Ties and k beyond the library size are covered by tests/test_fp_library.py.
+
+    python benchmarks/bench_similarity.py --size 200000 --queries 500 --workers 4
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from fp_library import FingerprintLibrary, PrunedLibrary, NBITS
+
+
+def synthetic_library(base, size, seed):
+    """
+    Writes a library of random fingerprints with a bit count distribution close to the one of
+    Morgan fingerprints of drugs (20 to 120 bits out of 2048), sorted by bit count as build_library does.
+    """
+    rng = np.random.default_rng(seed)
+    counts = np.clip(rng.normal(55, 18, size).astype(np.int64), 20, 120)
+    bits = np.zeros((size, NBITS), dtype=np.uint8)
+    for i, count in enumerate(counts):
+        bits[i, rng.choice(NBITS, count, replace=False)] = 1
+    fps = np.packbits(bits, axis=1).view(np.uint64)
+    counts = np.bitwise_count(fps).sum(axis=1).astype(np.uint16)
+    order = np.argsort(counts, kind='stable')
+    np.save(f'{base}.fps.npy', fps[order])
+    np.save(f'{base}.counts.npy', counts[order])
+    with open(f'{base}.ids.txt', 'w') as f:
+        f.write(''.join(f'MOL:{i}\n' for i in order))
+
+
+def synthetic_queries(library, n, seed):
+    """ Library fingerprints with a few bits flipped, so that every query has close neighbors. """
+    rng = np.random.default_rng(seed + 1)
+    rows = np.asarray(library.fps[rng.choice(len(library), n)])
+    bits = np.unpackbits(rows.view(np.uint8), axis=1)
+    for row in bits:
+        row[rng.choice(NBITS, 8, replace=False)] ^= 1
+    return list(np.packbits(bits, axis=1).view(np.uint64))
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--neighbors', type=int, default=1)
+    parser.add_argument('--cutoff', type=float, default=0.0)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        base = os.path.join(tmp, 'library')
+        synthetic_library(base, args.size, args.seed)
+        library = FingerprintLibrary(base)
+        pruned = PrunedLibrary(library)
+        queries = synthetic_queries(library, args.queries, args.seed)
+
+        exhaustive, t_exhaustive = timed(lambda: library.search_many(queries, args.cutoff, args.neighbors))
+        single, t_single = timed(lambda: pruned.search_many(queries, args.cutoff, args.neighbors))
+        sharded, t_sharded = timed(lambda: pruned.search_many(queries, args.cutoff, args.neighbors,
+                                                              workers=args.workers, chunk_size=32))
+
+    assert single == exhaustive, 'pruned search differs from the exhaustive search'
+    assert sharded == exhaustive, 'sharded search differs from the exhaustive search'
+    print(f"library: {args.size} fingerprints, {args.queries} queries, k={args.neighbors}, cutoff={args.cutoff}")
+    for name, seconds in [('exhaustive', t_exhaustive), ('pruned', t_single),
+                          (f'pruned, {args.workers} workers', t_sharded)]:
+        print(f"{name:>24}: {seconds:8.3f} s  {args.queries / seconds:10.1f} queries/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+"""
+Scoring with the offline factor store as first lookup tier: a store is built from bulk files covering the drugs
+and publications of the synthetic responses (the same SMILES and years as the stub services answer), then a
+response is scored without the store and with it, against the stub services and without persistent cache
+(NOVELTY_CACHE_DIR is emptied). Reports the build time, the upstream requests and the scoring times, and checks
+that the scores are the same.
+
+    python benchmarks/bench_store.py --results 10000 --latency 0.02
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(HERE, '..', 'src'))
+
+
+def write_bulk_files(directory, n_drugs, n_publications):
+    from synthetic import smiles_for, year_for
+    paths = {name: os.path.join(directory, f'{name}.tsv') for name in ('smiles', 'years')}
+    with open(paths['smiles'], 'w') as f:
+        for i in range(n_drugs):
+            curie = f'CHEBI:{i}'
+            f.write(f"{curie}\t{smiles_for(curie) or ''}\n")
+    with open(paths['years'], 'w') as f:
+        for i in range(n_publications):
+            pub_id = f'PMID:{i}'
+            # The stub EFetch knows the publications the stub Text Mining Provider does not
+            f.write(f"{pub_id}\t{year_for(pub_id) or 1950 + i % 70}\n")
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Scoring with and without the offline factor store')
+    parser.add_argument('--results', type=int, default=5000)
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds added to each stub answer')
+    args = parser.parse_args()
+
+    os.environ['NOVELTY_CACHE_DIR'] = ''
+    from synthetic import make_response
+    from stubs import StubServices
+    from novelty_score_calculation import score_response
+    from factor_store import build_store, use_store
+    from mol_similarity import morgan_fingerprint
+
+    n_drugs, n_publications = max(1, args.results // 10), 2 * args.results
+    response = make_response(args.results, n_drugs=n_drugs, n_publications=n_publications)
+    with tempfile.TemporaryDirectory() as directory, StubServices(latency=args.latency) as stubs:
+        paths = write_bulk_files(directory, n_drugs, n_publications)
+        start = time.perf_counter()
+        counts = build_store(os.path.join(directory, 'store', 'factors'), paths['smiles'], paths['years'])
+        print(f"store built in {time.perf_counter() - start:.2f}s: {counts}")
+
+        measures = {}
+        for name, base in [('live lookups', None), ('factor store', os.path.join(directory, 'store', 'factors'))]:
+            use_store(base)
+            morgan_fingerprint.cache_clear()
+            before = sum(value for key, value in stubs.requests.items() if key != 'throttled')
+            start = time.perf_counter()
+            df, stages = score_response(response, return_metrics=True)
+            elapsed = time.perf_counter() - start
+            requests = sum(value for key, value in stubs.requests.items() if key != 'throttled') - before
+            hits = sum(entry['store_hits'] for entry in stages.values())
+            measures[name] = df
+            print(f"{name:<14} {elapsed:7.2f}s  {requests:5} requests  {hits:7} store hits")
+        use_store(None)
+
+    a, b = (df.sort_values(['drug', 'novelty_score']).reset_index(drop=True) for df in measures.values())
+    print(f"same scores: {a['drug'].tolist() == b['drug'].tolist() and np.allclose(a['novelty_score'], b['novelty_score'])}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+"""
+Time to the first score and peak memory of the streaming scores (stream.iter_scores into an NDJSON file, or into a
+TopK) compared with score_response followed by to_json, on a synthetic response scored against the stub services
+without persistent cache (NOVELTY_CACHE_DIR is emptied). The peak is the one of the Python allocations made while
+scoring (tracemalloc), the response itself excluded.
+
+    python benchmarks/bench_stream.py --results 20000 --latency 0.02 --top 100
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(HERE, '..', 'src'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Streaming vs whole table scoring')
+    parser.add_argument('--results', type=int, default=10000)
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds added to each stub answer')
+    parser.add_argument('--top', type=int, default=100)
+    args = parser.parse_args()
+
+    os.environ['NOVELTY_CACHE_DIR'] = ''
+    from synthetic import make_response
+    from stubs import StubServices
+    from novelty_score_calculation import score_response
+    from stream import iter_scores, write_ndjson, TopK
+
+    response = make_response(args.results)
+    out = os.devnull
+
+    def table():
+        score_response(response).to_json(out, orient='values')
+
+    def ndjson():
+        write_ndjson(iter_scores(response), out)
+
+    def top():
+        TopK(args.top).extend(iter_scores(response)).items()
+
+    def first():
+        records = iter_scores(response)
+        next(records, None)
+        records.close()
+
+    with StubServices(latency=args.latency):
+        # Warm up the imports and the fingerprint memo, so that every mode starts from the same state
+        score_response(make_response(100))
+        for name, fn in [('score_response + to_json', table), ('iter_scores -> NDJSON', ndjson),
+                         (f'iter_scores -> TopK({args.top})', top), ('iter_scores, first record', first)]:
+            # Timed without tracing, which slows the allocations down, then traced for the peak
+            start = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - start
+            tracemalloc.start()
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"{name:<28} {elapsed:8.2f}s  peak {peak / 2 ** 20:8.1f} MB")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+
+"""
+In-process stand-ins for the external services of the novelty score, with tunable latency:
+    MolePro             POST /molecular_data_provider/compound/by_id, GET /molecular_data_provider/collection/<id>
+    Text Mining Pubs    GET  /publications?pubids=...
+    NCBI EUtils         GET/POST /entrez/eutils/efetch.fcgi
+The answers are deterministic functions of the IDs (see synthetic.smiles_for / year_for).
+
+    with StubServices(latency=0.05) as stubs:
+        compute_novelty(...)   # the scorer modules are pointed at the stubs while the block runs
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import smiles_for, year_for
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type='application/json', headers=None):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up waiting, e.g. its latency budget ran out
+            pass
+
+    def _params(self):
+        url = urllib.parse.urlparse(self.path)
+        params = {key: values[0] for key, values in urllib.parse.parse_qs(url.query).items()}
+        length = int(self.headers.get('Content-Length', 0) or 0)
+        body = self.rfile.read(length) if length else b''
+        if body and 'application/x-www-form-urlencoded' in self.headers.get('Content-Type', ''):
+            params.update({key: values[0] for key, values in urllib.parse.parse_qs(body.decode()).items()})
+        return url.path, params, body
+
+    def _handle(self):
+        services = self.server.services
+        path, params, body = self._params()
+        services.count(path)
+        if services.fails(path):
+            return self._send(400, {'error': 'failing'})
+        if not services.admit():
+            return self._send(429, {'error': 'rate limit'}, headers={'Retry-After': '1'})
+        if services.latency:
+            time.sleep(services.latency)
+        if path.endswith('/compound/by_id'):
+            ids = json.loads(body)
+            collection = services.add_collection(ids)
+            host = f'http://{self.server.server_address[0]}:{self.server.server_address[1]}'
+            return self._send(200, {'url': f'{host}/molecular_data_provider/collection/{collection}', 'size': len(ids)})
+        if '/collection/' in path:
+            ids = services.collections.get(path.rsplit('/', 1)[1], [])
+            elements = []
+            for curie in ids:
+                smiles = smiles_for(curie)
+                elements.append({'id': curie, 'identifiers': {'smiles': smiles} if smiles else {}})
+            return self._send(200, {'size': len(elements), 'elements': elements})
+        if path.endswith('/publications'):
+            ids = [x for x in params.get('pubids', '').split(',') if x]
+            results = {x: {'pub_year': str(year_for(x))} for x in ids if year_for(x)}
+            not_found = [x for x in ids if not year_for(x)]
+            return self._send(200, {'_meta': {'n_results': len(results), 'not_found': not_found}, 'results': results})
+        if path.endswith('/efetch.fcgi'):
+            ids = [x for x in params.get('id', '').split(',') if x]
+            if params.get('db') == 'pmc':
+                articles = ''.join(f'<article><front><article-meta><article-id pub-id-type="pmc">{x}</article-id>'
+                                   f'<pub-date><year>{year_for("PMC:PMC" + x) or 2000}</year></pub-date>'
+                                   '</article-meta></front></article>' for x in ids)
+                xml = f'<?xml version="1.0"?><pmc-articleset>{articles}</pmc-articleset>'
+            else:
+                # EUtils knows every PubMed article, with a year close to the one of the Text Mining Provider
+                articles = ''.join(f'<PubmedArticle><MedlineCitation><PMID>{x}</PMID><Article><Journal><JournalIssue>'
+                                   f'<PubDate><Year>{1950 + int(x) % 70}</Year></PubDate>'
+                                   '</JournalIssue></Journal></Article></MedlineCitation></PubmedArticle>' for x in ids)
+                xml = f'<?xml version="1.0"?><PubmedArticleSet>{articles}</PubmedArticleSet>'
+            return self._send(200, xml.encode(), 'text/xml')
+        return self._send(404, {'error': path})
+
+    do_GET = _handle
+    do_POST = _handle
+
+
+class StubServices:
+    """
+    Args:
+        latency: float: seconds each request waits before being answered
+        rate_limit: float: requests per second answered, the ones beyond are answered 429 with a Retry-After,
+            like NCBI does; None for no limit
+        failing: Iterable of the services answering every request with an error (400, not retried), by the names
+            counted in requests, e.g. 'efetch.fcgi'
+    """
+
+    def __init__(self, latency=0.0, rate_limit=None, failing=()):
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.failing = set(failing)
+        self._window = []
+        self.collections = {}
+        self.requests = {}
+        self._lock = threading.Lock()
+        self._server = None
+        self._saved = []
+
+    @staticmethod
+    def _key(path):
+        return path.rsplit('/', 1)[-1] if '/collection/' not in path else 'collection'
+
+    def count(self, path):
+        with self._lock:
+            key = self._key(path)
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+    def fails(self, path):
+        return self._key(path) in self.failing
+
+    def admit(self):
+        # Sliding one second window of the requests answered
+        if not self.rate_limit:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            self._window = [t for t in self._window if now - t < 1.0]
+            if len(self._window) >= self.rate_limit:
+                self.requests['throttled'] = self.requests.get('throttled', 0) + 1
+                return False
+            self._window.append(now)
+            return True
+
+    def add_collection(self, ids):
+        with self._lock:
+            key = str(len(self.collections))
+            self.collections[key] = ids
+        return key
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def urls(self):
+        return {
+            'NOVELTY_MOLEPRO_URL': f'{self.url}/molecular_data_provider/compound/by_id',
+            'NOVELTY_PUBLICATIONS_URL': f'{self.url}/publications',
+            'NOVELTY_EFETCH_URL': f'{self.url}/entrez/eutils/efetch.fcgi',
+        }
+
+    def start(self):
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self._server.daemon_threads = True
+        self._server.services = self
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        self._point_scorer_at_stubs()
+        return self
+
+    def _point_scorer_at_stubs(self):
+        # Modules already imported read the URLs from their globals, processes started later from the environment
+        urls = self.urls()
+        os.environ.update(urls)
+        targets = [('extr_smile_molpro_by_id', 'MOLEPRO_URL', 'NOVELTY_MOLEPRO_URL'),
+                   ('novelty_score_calculation', 'PUBLICATIONS_URL', 'NOVELTY_PUBLICATIONS_URL'),
+                   ('eutils', 'EFETCH_URL', 'NOVELTY_EFETCH_URL')]
+        for module_name, attribute, variable in targets:
+            module = sys.modules.get(module_name)
+            if module is not None:
+                self._saved.append((module, attribute, getattr(module, attribute)))
+                setattr(module, attribute, urls[variable])
+
+    def stop(self):
+        for module, attribute, value in self._saved:
+            setattr(module, attribute, value)
+        self._saved = []
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+
+"""
+Synthetic merged TRAPI responses (as returned by the ARS) for the benchmarks: a disease -> chemical 1-hop query
+with a configurable number of results, edges per result, publications per edge, share of known results and
+pool of SMILES. Drugs and publications are drawn from bounded pools so that they repeat across edges, as in
+real responses. Also random columns of the scoring factors, for the checks and timings of the scoring functions.
+"""
+
+import hashlib
+import random
+import numpy as np
+
+SMILES_POOL = [
+    'CC(=O)Oc1ccccc1C(=O)O', 'CC(C)Cc1ccc(cc1)C(C)C(=O)O', 'CN1C=NC2=C1C(=O)N(C(=O)N2C)C', 'CC(=O)Nc1ccc(O)cc1',
+    'CN1CCC[C@H]1c1cccnc1', 'OC(=O)CCc1ccccc1', 'CCN(CC)CCOC(=O)c1ccc(N)cc1', 'COc1ccc2[nH]cc(CCNC(C)=O)c2c1',
+    'CC(C)NCC(O)c1ccc(O)c(O)c1', 'Clc1ccc(cc1)C(c1ccccc1)N1CCNCC1', 'CCOC(=O)C1=C(C)NC(C)=C(C1c1cccc(c1)[N+]([O-])=O)C(=O)OC',
+    'NC(=O)c1cnccn1', 'CC12CCC3C(CCC4=CC(=O)CCC34C)C1CCC2O', 'OC[C@H]1OC(O)[C@H](O)[C@@H](O)[C@@H]1O',
+    'CN(C)C(=N)NC(N)=N', 'CC(C)(C)NCC(O)c1ccc(O)c(CO)c1', 'O=C(O)c1ccccc1O', 'CCCCC(CC)COC(=O)c1ccccc1C(=O)OCC(CC)CCCC',
+    'Nc1ccc(cc1)S(=O)(=O)Nc1ccccn1', 'CC1=C(C(=O)N(N1C)c1ccccc1)N(C)CS(=O)(=O)O',
+]
+KNOWN_SOURCES = ['infores:chembl', 'infores:drugcentral', 'infores:ctd']
+INFERRING_SOURCES = ['infores:aragorn', 'infores:arax', 'infores:improving-agent', 'infores:robokop']
+
+
+def stable_hash(text):
+    return int(hashlib.md5(text.encode()).hexdigest()[:8], 16)
+
+
+def smiles_for(curie, smiles_pool=SMILES_POOL):
+    """ SMILES the stub MolePro returns for a drug; about 1 drug in 20 has none. """
+    h = stable_hash(curie)
+    return None if h % 20 == 0 else smiles_pool[h % len(smiles_pool)]
+
+
+def year_for(pub_id):
+    """ Publication year the stub services return; about 1 publication in 10 is unknown. """
+    h = stable_hash(pub_id)
+    return None if h % 10 == 0 else 1960 + h % 64
+
+
+def make_response(n_results=1000, edges_per_result=2, pubs_per_edge=3, known_fraction=0.3, n_drugs=None,
+                  n_publications=None, fda_fraction=0.5, seed=0):
+    """
+    Args:
+        n_results: int: number of results
+        edges_per_result: int: edges bound to the query edge of each result
+        pubs_per_edge: int: average number of publications per edge
+        known_fraction: float: share of results whose edges come from a non inferring (known) source
+        n_drugs: int: number of distinct drugs, default n_results / 10
+        n_publications: int: number of distinct publications, default 2 * n_results
+        fda_fraction: float: share of edges with an FDA approval status attribute
+        seed: int
+
+    Returns:
+        Dict: merged response
+    """
+    rng = random.Random(seed)
+    n_drugs = n_drugs or max(1, n_results // 10)
+    n_publications = n_publications or max(1, 2 * n_results)
+    edges = {}
+    results = []
+    for idres in range(n_results):
+        drug = f'CHEBI:{rng.randrange(n_drugs)}'
+        known = rng.random() < known_fraction
+        bindings = []
+        for ide in range(edges_per_result):
+            edge_id = f'e{idres}_{ide}'
+            attributes = [{'attribute_type_id': 'biolink:knowledge_level', 'value': 'knowledge_assertion'}]
+            n_pubs = max(0, int(rng.expovariate(1 / pubs_per_edge))) if pubs_per_edge else 0
+            if n_pubs:
+                # Skewed draw, so that a few publications are shared by many edges
+                pubs = [f'PMID:{int(n_publications * rng.random() ** 2)}' for _ in range(n_pubs)]
+                attributes.append({'attribute_type_id': 'biolink:publications', 'value': pubs})
+            if rng.random() < fda_fraction:
+                attributes.append({'attribute_type_id': 'biolink:FDA_approval_status',
+                                   'value': rng.choice(['FDA Approval', 'FDA Clinical Research Phase 2'])})
+            source = rng.choice(KNOWN_SOURCES if known else INFERRING_SOURCES)
+            edges[edge_id] = {
+                'subject': drug, 'object': 'MONDO:0005148', 'predicate': 'biolink:treats',
+                'sources': [{'resource_id': source, 'resource_role': 'primary_knowledge_source'},
+                            {'resource_id': 'infores:aragorn', 'resource_role': 'aggregator_knowledge_source'}],
+                'attributes': attributes,
+            }
+            bindings.append({'id': edge_id, 'attributes': []})
+        results.append({
+            'node_bindings': {'sn': [{'id': drug, 'attributes': []}], 'on': [{'id': 'MONDO:0005148', 'attributes': []}]},
+            'analyses': [{'resource_id': 'infores:ars', 'edge_bindings': {'t_edge': bindings}, 'score': rng.random()}],
+        })
+    nodes = {f'CHEBI:{i}': {'name': f'drug {i}', 'categories': ['biolink:SmallMolecule']} for i in range(n_drugs)}
+    nodes['MONDO:0005148'] = {'name': 'type 2 diabetes mellitus', 'categories': ['biolink:Disease']}
+    return {'fields': {'status': 'Done', 'data': {'message': {
+        'query_graph': {'nodes': {'on': {'ids': ['MONDO:0005148'], 'categories': ['biolink:Disease']},
+                                  'sn': {'categories': ['biolink:ChemicalEntity']}},
+                        'edges': {'t_edge': {'subject': 'sn', 'object': 'on', 'predicates': ['biolink:treats']}}},
+        'knowledge_graph': {'nodes': nodes, 'edges': edges},
+        'results': results,
+    }}}}
+
+
+def random_columns(rows, rng):
+    """
+    Columns of a scoring DataFrame, with NaN / None in every column and boundary values of similarity.
+
+    Args:
+        rows: int
+        rng: np.random.Generator
+
+    Returns:
+        pd.DataFrame: fda status, number_of_publ, age_oldest_pub and similarity columns
+    """
+    import pandas as pd
+
+    def with_nan(values, fraction):
+        values = values.astype(float)
+        values[rng.random(rows) < fraction] = np.nan
+        return values
+
+    similarity = rng.choice([0.0, 0.5, 1.0, np.nan], rows)
+    similarity = np.where(rng.random(rows) < 0.5, rng.random(rows), similarity)
+    fda = rng.choice(np.array([0.0, 1.0, None], dtype=object), rows)
+    return pd.DataFrame({
+        'fda status': fda,
+        'number_of_publ': with_nan(rng.integers(0, 300, rows), 0.2),
+        'age_oldest_pub': with_nan(rng.integers(0, 80, rows), 0.3),
+        'similarity': similarity,
+    })
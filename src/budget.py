@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+
+"""
+Latency budget of a scoring call.
+
+A Budget is activated with use_budget(); the external lookups then take the timeout of each request from
+call_timeout(), which never goes beyond the time left in the budget, and requests that time out are retried
+while time is left. Once the budget is spent, call_timeout() raises BudgetExhausted (a requests Timeout, so the
+existing error handling of the lookups applies) and nothing more is sent. The lookups that could not be made
+record the factor and the keys they leave unresolved with degrade(); those are scored with the NaN fallbacks of
+novelty_score, and the output reports them. Like the metrics collector, the active budget is carried into worker
+threads by metrics.in_context().
+
+Factors: similarity (keys are drug IDs), recency (keys are publication IDs)
+"""
+
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+import requests
+
+# Timeout of each request when no budget is active, so that a stalled upstream can not block forever
+DEFAULT_CALL_TIMEOUT = 60.0
+# Below this, a request has no chance to complete and is not sent
+MIN_CALL_TIMEOUT = 0.05
+
+_active = contextvars.ContextVar('novelty_budget', default=None)
+
+
+class BudgetExhausted(requests.exceptions.Timeout):
+    pass
+
+
+class Budget:
+    """
+    Args:
+        seconds: float: total time allowed for the scoring, lookups included, None for no limit: the budget then
+            only records the unresolved lookups
+        retries: int: number of times a timed out or failed request is sent again, within the budget
+        call_timeout: float: cap on the timeout of each request, by default the budget split over the attempts,
+            so that a stalled first attempt leaves time for a retry
+    """
+
+    def __init__(self, seconds, retries=1, call_timeout=None):
+        self.seconds = seconds
+        self.retries = retries
+        if call_timeout is not None:
+            self.max_call_timeout = call_timeout
+        else:
+            self.max_call_timeout = seconds / (retries + 1) if seconds is not None else DEFAULT_CALL_TIMEOUT
+        self.deadline = time.monotonic() + seconds if seconds is not None else None
+        self.unresolved = {}
+        self._lock = threading.Lock()
+
+    def remaining(self):
+        if self.deadline is None:
+            return float('inf')
+        return max(0.0, self.deadline - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= MIN_CALL_TIMEOUT
+
+    def call_timeout(self):
+        """
+        Returns: float: timeout of the next request
+
+        Raises: BudgetExhausted when there is no time left for a request
+        """
+        remaining = self.remaining()
+        if remaining <= MIN_CALL_TIMEOUT:
+            raise BudgetExhausted(f'latency budget of {self.seconds}s exhausted')
+        return min(self.max_call_timeout, remaining)
+
+    def degrade(self, factor, keys=()):
+        with self._lock:
+            self.unresolved.setdefault(factor, set()).update(keys)
+
+    @property
+    def degraded(self):
+        """ Returns: sorted List of the factors with unresolved lookups """
+        with self._lock:
+            return sorted(self.unresolved)
+
+    def is_unresolved(self, factor, key):
+        return key in self.unresolved.get(factor, ())
+
+
+def current_budget():
+    return _active.get()
+
+
+@contextmanager
+def use_budget(budget):
+    """ Makes budget (a Budget, or None for no budget) the active one while the block runs. """
+    token = _active.set(budget)
+    try:
+        yield budget
+    finally:
+        _active.reset(token)
+
+
+def call_timeout():
+    """ Returns: the timeout of the next request, under the active budget if any (see Budget.call_timeout) """
+    budget = _active.get()
+    if budget is None:
+        return DEFAULT_CALL_TIMEOUT
+    return budget.call_timeout()
+
+
+def degrade(factor, keys=()):
+    """ Records that the lookups of keys failed, so factor is scored with its fallback. No-op without budget. """
+    budget = _active.get()
+    if budget is not None:
+        budget.degrade(factor, keys)
@@ -0,0 +1,312 @@
+#!/usr/bin/env python
+
+"""
+Persistent key/value caches for the external lookups of the novelty score (publication years, SMILES, ...).
+
+Every cache is a table in a SQLite database stored in NOVELTY_CACHE_DIR (default ~/.cache/novelty_score).
+The database runs in WAL mode so that many scoring processes can read and write it at the same time.
+Negative entries (the lookup was done but nothing was found) are stored as NULL and expire after
+negative_ttl seconds, positive entries never expire. When a table grows beyond max_entries the least
+recently used entries are evicted; the access times used for that are only kept to ACCESS_GRANULARITY, and
+the rows are only counted again when the approximate count goes beyond the limit. Setting NOVELTY_CACHE_DIR to
+an empty string disables the caches.
+
+Long running processes (see service) can keep the entries in memory as well, in front of the database, with
+use_memory_caches() or NOVELTY_MEMORY_CACHE_ENTRIES. The negative entries are kept in memory too, and expire from
+memory when they expire from the database: negative_ttl seconds after they were created.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from metrics import incr
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.environ.get('NOVELTY_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'novelty_score'))
+CACHE_FILE = 'novelty_cache.sqlite'
+# Entries kept in memory per cache, 0 to go to the database for every lookup
+MEMORY_ENTRIES = int(os.environ.get('NOVELTY_MEMORY_CACHE_ENTRIES', 0) or 0)
+
+# SQLite limits the number of host parameters per statement
+_MAX_PARAMS = 500
+# The access time of an entry is only written again once it is older than this, so that most reads do not write
+ACCESS_GRANULARITY = 3600
+
+
+class SQLiteCache:
+    """
+    Args:
+        path: str: SQLite database file
+        table: str: name of the table holding this cache
+        negative_ttl: float: seconds a negative entry stays valid
+        max_entries: int: number of entries above which the least recently used ones are evicted
+    """
+
+    def __init__(self, path, table, negative_ttl=7 * 24 * 3600, max_entries=1000000):
+        self.path = path
+        self.table = table
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._local = threading.local()
+        # Approximate number of rows: counted once, then increased by the rows written (replacements included), it
+        # is counted again only when it goes beyond max_entries
+        self._count = None
+        self._count_lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(f'CREATE TABLE IF NOT EXISTS "{table}" '
+                         '(key TEXT PRIMARY KEY, value TEXT, created REAL NOT NULL, accessed REAL NOT NULL)')
+            conn.execute(f'CREATE INDEX IF NOT EXISTS "{table}_accessed" ON "{table}" (accessed)')
+
+    def _connection(self):
+        # sqlite3 connections can not be shared between threads, keep one per thread
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, keys):
+        """
+        Args: Iterable of keys
+
+        Returns:
+            Dict: key -> value for every key found in the cache, negative entries have the value None.
+            Keys missing from the result have to be looked up.
+        """
+        return {key: value for key, (value, _) in self.get_entries(keys).items()}
+
+    def get_entries(self, keys):
+        """
+        Args: Iterable of keys
+
+        Returns: Dict: key -> (value, time the entry was created), as get_many
+        """
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        now = time.time()
+        try:
+            conn = self._connection()
+            stale = []
+            for i in range(0, len(keys), _MAX_PARAMS):
+                chunk = keys[i:i + _MAX_PARAMS]
+                marks = ','.join('?' * len(chunk))
+                rows = conn.execute(f'SELECT key, value, created, accessed FROM "{self.table}" '
+                                    f'WHERE key IN ({marks})', chunk).fetchall()
+                for key, value, created, accessed in rows:
+                    if value is None:
+                        if now - created > self.negative_ttl:
+                            continue
+                        found[key] = (None, created)
+                    else:
+                        found[key] = (json.loads(value), created)
+                    if now - accessed > ACCESS_GRANULARITY:
+                        stale.append(key)
+            if stale:
+                # A single write transaction per call, for the hits whose access time is out of date
+                with conn:
+                    for i in range(0, len(stale), _MAX_PARAMS - 1):
+                        chunk = stale[i:i + _MAX_PARAMS - 1]
+                        marks = ','.join('?' * len(chunk))
+                        conn.execute(f'UPDATE "{self.table}" SET accessed = ? WHERE key IN ({marks})', [now] + chunk)
+        except sqlite3.Error:
+            # The cache is an optimization only, a broken cache must not break the scoring
+            pass
+        incr('cache_hits', len(found))
+        incr('cache_misses', len(keys) - len(found))
+        return found
+
+    def get(self, key, default=None):
+        return self.get_many([key]).get(key, default)
+
+    def set_many(self, items):
+        """
+        Args: Dict: key -> value, a value of None stores a negative entry
+        """
+        if not items:
+            return
+        now = time.time()
+        rows = [(key, None if value is None else json.dumps(value), now, now) for key, value in items.items()]
+        try:
+            conn = self._connection()
+            with conn:
+                conn.executemany(f'INSERT OR REPLACE INTO "{self.table}" (key, value, created, accessed) '
+                                 'VALUES (?, ?, ?, ?)', rows)
+            self._evict(conn, len(rows))
+        except sqlite3.Error:
+            pass
+
+    def set(self, key, value):
+        self.set_many({key: value})
+
+    def _count_rows(self, conn):
+        return conn.execute(f'SELECT COUNT(*) FROM "{self.table}"').fetchone()[0]
+
+    def _evict(self, conn, written):
+        with self._count_lock:
+            if self._count is None:
+                self._count = self._count_rows(conn)
+            else:
+                self._count += written
+            if self._count <= self.max_entries:
+                return
+            count = self._count_rows(conn)
+            if count > self.max_entries:
+                # Evict down to 90% of the limit, so that eviction does not run on every write
+                excess = count - int(self.max_entries * 0.9)
+                with conn:
+                    conn.execute(f'DELETE FROM "{self.table}" WHERE key IN '
+                                 f'(SELECT key FROM "{self.table}" ORDER BY accessed LIMIT ?)', (excess,))
+                count -= excess
+            self._count = count
+
+    def clear(self):
+        with self._connection() as conn:
+            conn.execute(f'DELETE FROM "{self.table}"')
+        with self._count_lock:
+            self._count = 0
+
+
+class NullCache:
+    """ Cache used when caching is disabled: nothing is ever found. """
+
+    def get_many(self, keys):
+        incr('cache_misses', len(set(keys)))
+        return {}
+
+    def get_entries(self, keys):
+        return self.get_many(keys)
+
+    def get(self, key, default=None):
+        return default
+
+    def set_many(self, items):
+        pass
+
+    def set(self, key, value):
+        pass
+
+    def clear(self):
+        pass
+
+
+class MemoryCache:
+    """
+    In-memory LRU layer in front of another cache. It keeps the negative entries as well as the positive ones; a
+    negative entry expires from memory negative_ttl seconds after it was created, as in the SQLiteCache behind,
+    so reading it from the database does not extend its life.
+
+    Args:
+        backend: SQLiteCache / NullCache
+        max_entries: int: number of entries kept in memory
+    """
+
+    def __init__(self, backend, max_entries):
+        self.backend = backend
+        self.max_entries = max_entries
+        self.negative_ttl = getattr(backend, 'negative_ttl', 7 * 24 * 3600)
+        # key -> (value, expiry time of a negative entry or None)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, items, created=None):
+        # created: Dict: key -> creation time of the entries read from the backend, the others are new
+        now = time.time()
+        created = created or {}
+        with self._lock:
+            for key, value in items.items():
+                expires = created.get(key, now) + self.negative_ttl if value is None else None
+                self._entries[key] = (value, expires)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_many(self, keys):
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        now = time.time()
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                value, expires = entry
+                if expires is not None and now > expires:
+                    del self._entries[key]
+                    continue
+                self._entries.move_to_end(key)
+                found[key] = value
+        incr('cache_hits', len(found))
+        missing = [key for key in keys if key not in found]
+        if missing:
+            entries = self.backend.get_entries(missing)
+            from_backend = {key: value for key, (value, _) in entries.items()}
+            self._remember(from_backend, {key: created for key, (_, created) in entries.items()})
+            found.update(from_backend)
+        return found
+
+    def get(self, key, default=None):
+        return self.get_many([key]).get(key, default)
+
+    def set_many(self, items):
+        self._remember(items)
+        self.backend.set_many(items)
+
+    def set(self, key, value):
+        self.set_many({key: value})
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        self.backend.clear()
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def use_memory_caches(max_entries):
+    """
+    Keeps up to max_entries entries of every cache of the process in memory, 0 turns the memory layer off.
+    """
+    global MEMORY_ENTRIES
+    with _caches_lock:
+        MEMORY_ENTRIES = max_entries
+        for table, cache in list(_caches.items()):
+            backend = cache.backend if isinstance(cache, MemoryCache) else cache
+            _caches[table] = MemoryCache(backend, max_entries) if max_entries else backend
+
+
+def get_cache(table, **kwargs):
+    """
+    Returns the process wide cache stored in the table of the shared cache database.
+
+    Args:
+        table: str: e.g. 'publication_year'
+        **kwargs: negative_ttl / max_entries, see SQLiteCache
+
+    Returns:
+        SQLiteCache, or NullCache when NOVELTY_CACHE_DIR is empty or the database can not be opened,
+        behind a MemoryCache when the memory layer is on
+    """
+    with _caches_lock:
+        if table not in _caches:
+            if not CACHE_DIR:
+                cache = NullCache()
+            else:
+                try:
+                    cache = SQLiteCache(os.path.join(CACHE_DIR, CACHE_FILE), table, **kwargs)
+                except (OSError, sqlite3.Error) as e:
+                    logger.warning("Cache %s disabled: %s", table, e)
+                    cache = NullCache()
+            _caches[table] = MemoryCache(cache, MEMORY_ENTRIES) if MEMORY_ENTRIES else cache
+        return _caches[table]
@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+
+"""
+Columnar table of the edges of a response: one typed NumPy array per factor instead of a Python tuple and a list
+of publications per edge. The drug of each row is an integer code into the distinct drug IDs, and the publications
+of all the rows are codes into the distinct publication IDs, stored end to end in one array: the publications of
+row i are pub_codes[pub_offsets[i]:pub_offsets[i + 1]]. Each drug and publication ID is therefore held once per
+table, however many edges it appears on.
+
+The scoring steps (publication ages, aggregation by drug, recency, novelty score) work on the arrays; a DataFrame
+is only built at the output, with to_frame(), which is also when pandas is imported.
+"""
+
+from array import array
+import numpy as np
+from message_index import publication_key
+
+
+class Interner:
+    """ Integer codes of distinct values, given in the order the values are first seen """
+
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def __len__(self):
+        return len(self.values)
+
+    def code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def array(self):
+        """ Returns: the values as an object ndarray, indexed by their codes """
+        values = np.empty(len(self.values), dtype=object)
+        values[:] = self.values
+        return values
+
+
+class EdgeTableBuilder:
+    """ Appends the rows of an EdgeTable one at a time, into typed buffers (see EdgeTable) """
+
+    def __init__(self):
+        self.drugs = Interner()
+        self.publications = Interner()
+        self.edge = array('q')
+        self.edge_id = []
+        self.drug_codes = array('i')
+        self.fda_status = array('d')
+        self.pub_offsets = array('q', [0])
+        self.pub_codes = array('i')
+
+    def add(self, edge, edge_id, drug, fda_status, publications):
+        """
+        Args:
+            edge: int: position of the edge among the extracted ones
+            edge_id: str: knowledge graph ID of the edge
+            drug: str: drug ID
+            fda_status: float: 0.0 (FDA approved), 1.0 or NaN when unknown
+            publications: Iterable of the publication IDs of the edge
+        """
+        self.edge.append(edge)
+        self.edge_id.append(edge_id)
+        self.drug_codes.append(self.drugs.code(drug))
+        self.fda_status.append(fda_status)
+        self.pub_codes.extend(self.publications.code(x) for x in publications)
+        self.pub_offsets.append(len(self.pub_codes))
+
+    def build(self):
+        pub_offsets = np.frombuffer(self.pub_offsets, dtype=np.int64)
+        edge_id = np.empty(len(self.edge_id), dtype=object)
+        edge_id[:] = self.edge_id
+        columns = {'edge': np.frombuffer(self.edge, dtype=np.int64), 'edge_id': edge_id,
+                   'fda status': np.frombuffer(self.fda_status, dtype=np.float64),
+                   'number_of_publ': np.diff(pub_offsets).astype(np.float64)}
+        return EdgeTable(columns, np.frombuffer(self.drug_codes, dtype=np.int32), self.drugs.array(),
+                         pub_offsets, np.frombuffer(self.pub_codes, dtype=np.int32), self.publications.array())
+
+
+class EdgeTable:
+    """
+    Args:
+        columns: Dict: column name -> ndarray with a value per row (edge, edge_id, fda status, number_of_publ,
+            age_oldest_pub, recency, similarity, novelty_score, ...)
+        drug_codes: int32 ndarray: per row, the code of its drug in drugs
+        drugs: object ndarray of drug IDs
+        pub_offsets: int64 ndarray of len(rows) + 1: bounds of the publications of each row in pub_codes
+        pub_codes: int32 ndarray: codes in publications
+        publications: object ndarray of publication IDs
+
+    The columns are read and replaced with table[name] and table[name] = values, as the columns of a DataFrame.
+    """
+
+    def __init__(self, columns, drug_codes, drugs, pub_offsets, pub_codes, publications):
+        self.columns = columns
+        self.drug_codes = drug_codes
+        self.drugs = drugs
+        self.pub_offsets = pub_offsets
+        self.pub_codes = pub_codes
+        self.publications = publications
+
+    @classmethod
+    def from_rows(cls, drugs, publications, **columns):
+        """
+        Args:
+            drugs: List of the drug ID of each row
+            publications: List of the publications of each row (None for none)
+            **columns: name -> values of each row
+
+        Returns: EdgeTable
+        """
+        drug_ids = Interner()
+        publication_ids = Interner()
+        drug_codes = np.array([drug_ids.code(drug) for drug in drugs], dtype=np.int32)
+        pub_codes = np.array([publication_ids.code(x) for pubs in publications if pubs for x in pubs], dtype=np.int32)
+        pub_offsets = np.zeros(len(drug_codes) + 1, dtype=np.int64)
+        np.cumsum([len(pubs) if pubs else 0 for pubs in publications], out=pub_offsets[1:])
+        return cls({name: np.asarray(values) for name, values in columns.items()}, drug_codes, drug_ids.array(),
+                   pub_offsets, pub_codes, publication_ids.array())
+
+    def __len__(self):
+        return len(self.drug_codes)
+
+    def __contains__(self, name):
+        return name == 'drug' or name in self.columns
+
+    def __getitem__(self, name):
+        if name == 'drug':
+            return self.drugs[self.drug_codes]
+        return self.columns[name]
+
+    def __setitem__(self, name, values):
+        values = np.asarray(values)
+        if values.ndim == 0:
+            values = np.full(len(self), values)
+        self.columns[name] = values
+
+    def copy(self):
+        """ Returns: a table sharing the arrays of this one, whose columns can be replaced independently """
+        return EdgeTable(dict(self.columns), self.drug_codes, self.drugs, self.pub_offsets, self.pub_codes,
+                         self.publications)
+
+    def take(self, positions, **columns):
+        """
+        Args:
+            positions: int ndarray of the rows to keep, in their new order, a row may be repeated
+            **columns: name -> values of each kept row, added to the columns
+
+        Returns: EdgeTable of these rows, with the same drug and publication IDs
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        starts = self.pub_offsets[positions]
+        counts = self.pub_offsets[positions + 1] - starts
+        pub_offsets = np.zeros(len(positions) + 1, dtype=np.int64)
+        np.cumsum(counts, out=pub_offsets[1:])
+        # Position in pub_codes of each publication of each kept row
+        pub_positions = np.repeat(starts - pub_offsets[:-1], counts) + np.arange(pub_offsets[-1])
+        taken = {name: values[positions] for name, values in self.columns.items()}
+        taken.update({name: np.asarray(values) for name, values in columns.items()})
+        return EdgeTable(taken, self.drug_codes[positions], self.drugs, pub_offsets, self.pub_codes[pub_positions],
+                         self.publications)
+
+    @staticmethod
+    def concat(tables):
+        """
+        Args: List of EdgeTables with the same columns
+
+        Returns: EdgeTable of the rows of all of them, in order, with the IDs of all of them
+        """
+        drugs = Interner()
+        publications = Interner()
+        drug_codes, pub_codes, counts = [], [], []
+        for table in tables:
+            drug_map = np.array([drugs.code(drug) for drug in table.drugs], dtype=np.int32)
+            pub_map = np.array([publications.code(x) for x in table.publications], dtype=np.int32)
+            drug_codes.append(drug_map[table.drug_codes] if len(table) else table.drug_codes)
+            pub_codes.append(pub_map[table.pub_codes] if len(table.pub_codes) else table.pub_codes)
+            counts.append(np.diff(table.pub_offsets))
+        pub_offsets = np.zeros(sum(len(table) for table in tables) + 1, dtype=np.int64)
+        np.cumsum(np.concatenate(counts), out=pub_offsets[1:])
+        columns = {name: np.concatenate([table.columns[name] for table in tables]) for name in tables[0].columns}
+        return EdgeTable(columns, np.concatenate(drug_codes), drugs.array(), pub_offsets, np.concatenate(pub_codes),
+                         publications.array())
+
+    def row_publications(self, i):
+        """ Returns: List of the publication IDs of row i """
+        return list(self.publications[self.pub_codes[self.pub_offsets[i]:self.pub_offsets[i + 1]]])
+
+    def distinct_publications(self):
+        """ Returns: List of the distinct publication IDs of the rows, in the order they are first seen """
+        codes, first = np.unique(self.pub_codes, return_index=True)
+        return list(self.publications[codes[np.argsort(first, kind='stable')]])
+
+    def rows_with_publications(self, selected):
+        """
+        Args: bool ndarray: per publication ID (by code), whether it is selected
+
+        Returns: bool ndarray: per row, whether one of its publications is selected
+        """
+        counts = np.zeros(len(self.pub_codes) + 1, dtype=np.int64)
+        np.cumsum(selected[self.pub_codes], out=counts[1:])
+        return counts[self.pub_offsets[1:]] > counts[self.pub_offsets[:-1]]
+
+    def oldest_publication_ages(self, publ_years, year):
+        """
+        Args:
+            publ_years: Dict: publication ID -> year, the publications missing from it are not found. The IDs are
+                matched whatever their spelling (see message_index.publication_key)
+            year: int: the current year
+
+        Returns: float ndarray: per row, the age of its oldest publication found, NaN when none of them was found
+        """
+        by_key = {publication_key(key): value for key, value in publ_years.items() if value}
+        years = np.array([by_key.get(publication_key(x), np.nan) for x in self.publications], dtype=np.float64)
+        ages = np.full(len(self), np.nan)
+        rows = np.flatnonzero(np.diff(self.pub_offsets) > 0)
+        if len(rows):
+            # The segments of the rows with publications follow each other in pub_codes
+            ages[rows] = year - np.fmin.reduceat(years[self.pub_codes], self.pub_offsets[rows])
+        return ages
+
+    def drug_groups(self):
+        """ Returns: List of (drug code, positions of its rows), in the order of the first row of each drug """
+        order = np.argsort(self.drug_codes, kind='stable')
+        codes = self.drug_codes[order]
+        starts = np.flatnonzero(np.concatenate([[True], codes[1:] != codes[:-1]])) if len(codes) else np.array([], int)
+        groups = np.split(order, starts[1:])
+        return sorted(zip(codes[starts].tolist(), groups), key=lambda item: item[1][0])
+
+    def aggregate_by_drug(self):
+        """
+        Returns: EdgeTable with a row per distinct drug, in the order of its first row: fda status (the minimum,
+            approved as soon as one of its edges reports it), the distinct publications of all its rows,
+            number_of_publ, age_oldest_pub (the maximum) and number_of_edges
+        """
+        codes, first = np.unique(self.drug_codes, return_index=True)
+        codes = codes[np.argsort(first, kind='stable')]
+        rank = np.zeros(len(self.drugs), dtype=np.int64)
+        rank[codes] = np.arange(len(codes))
+        row_rank = rank[self.drug_codes]
+
+        fda_status = np.full(len(codes), np.nan)
+        np.fmin.at(fda_status, row_rank, self['fda status'].astype(np.float64))
+        age_oldest_pub = np.full(len(codes), np.nan)
+        np.fmax.at(age_oldest_pub, row_rank, self['age_oldest_pub'].astype(np.float64))
+        number_of_edges = np.bincount(row_rank, minlength=len(codes))
+
+        # Distinct (drug, publication) pairs, by drug then in the order they are first seen
+        pub_drug = np.repeat(row_rank, np.diff(self.pub_offsets))
+        _, first = np.unique(pub_drug * max(1, len(self.publications)) + self.pub_codes, return_index=True)
+        first = first[np.lexsort((first, pub_drug[first]))]
+        pub_offsets = np.zeros(len(codes) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(pub_drug[first], minlength=len(codes)), out=pub_offsets[1:])
+
+        columns = {'fda status': fda_status, 'number_of_publ': np.diff(pub_offsets).astype(np.float64),
+                   'age_oldest_pub': age_oldest_pub, 'number_of_edges': number_of_edges}
+        return EdgeTable(columns, codes.astype(np.int32), self.drugs, pub_offsets, self.pub_codes[first],
+                         self.publications)
+
+    def drug_positions(self, drug_rows):
+        """
+        Args: EdgeTable with a row per drug, covering the drugs of this table (see aggregate_by_drug)
+
+        Returns: int ndarray: per row of this table, the row of its drug in drug_rows
+        """
+        rows = {drug: position for position, drug in enumerate(drug_rows['drug'])}
+        by_code = np.array([rows.get(drug, -1) for drug in self.drugs], dtype=np.int64)
+        return by_code[self.drug_codes]
+
+    def to_frame(self, columns):
+        """
+        Args: List of the columns, 'drug' gives the drug IDs and 'publications' the list (or None) of each row
+
+        Returns: DataFrame
+        """
+        import pandas as pd
+        data = {}
+        for name in columns:
+            if name == 'publications':
+                data[name] = [self.row_publications(i) or None for i in range(len(self))]
+            else:
+                data[name] = self[name]
+        return pd.DataFrame(data, columns=columns)
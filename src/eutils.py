@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+
+"""
+Batched fallback to NCBI EUtils for the publication years the Text Mining Provider does not know.
+
+Many IDs are sent in each EFetch request and the XML answer is read with an incremental, event driven parser:
+each article is dropped from the tree as soon as its year has been read, so the memory used does not grow
+with the size of the batch.
+"""
+
+import logging
+import os
+import re
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from http_client import request
+from budget import degrade
+from metrics import in_context
+
+logger = logging.getLogger(__name__)
+
+EFETCH_URL = os.environ.get('NOVELTY_EFETCH_URL', "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi")
+NCBI_API_KEY = os.environ.get('NCBI_API_KEY')
+
+
+def _year(element):
+    if element is not None and element.text and element.text.strip().isdigit():
+        return int(element.text.strip())
+    return None
+
+
+def pubmed_article_year(article):
+    """
+    Same rules as extract_year_pmid, on a single PubmedArticle element: the Year of the PubDate, otherwise the
+    one of DateCompleted, superseded by the one of a revised PubDate.
+    """
+    pub_date = article.find('.//PubDate')
+    year = _year(pub_date.find('Year')) if pub_date is not None else None
+    if not year:
+        date_completed = article.find('.//DateCompleted')
+        if date_completed is not None:
+            year = _year(date_completed.find('Year'))
+        pub_date_revision = article.find(".//PubDate[@pubstatus='revised']")
+        if pub_date_revision is not None:
+            year = _year(pub_date_revision.find('Year')) or year
+    return year
+
+
+def pmc_article_year(article):
+    """ Same rules as extract_year_pmc, on a single PMC article element: the year of the first pub-date. """
+    pub_date = article.find('.//pub-date')
+    if pub_date is None:
+        return None
+    return _year(pub_date.find('year')) or _year(pub_date.find('Year'))
+
+
+def _pmc_article_id(article):
+    for article_id in article.iterfind('.//article-id'):
+        if article_id.get('pub-id-type') in ('pmc', 'pmcid') and article_id.text:
+            return article_id.text.strip().replace('PMC', '')
+    return None
+
+
+def iter_article_years(stream, article_tag, id_of, year_of):
+    """
+    Args:
+        stream: file-like object with the EFetch XML
+        article_tag: str: 'PubmedArticle' or 'article'
+        id_of: function: article element -> ID
+        year_of: function: article element -> year
+
+    Yields:
+        (ID, year) for each article, the year is None when it can not be found
+    """
+    root = None
+    for event, element in ET.iterparse(stream, events=('start', 'end')):
+        if root is None:
+            root = element
+        if event == 'end' and element.tag == article_tag:
+            yield id_of(element), year_of(element)
+            # Free the article, and every article before it, as soon as its year is read
+            root.clear()
+
+
+def iter_pubmed_years(stream):
+    return iter_article_years(stream, 'PubmedArticle', lambda article: (article.findtext('.//PMID') or '').strip(),
+                              pubmed_article_year)
+
+
+def iter_pmc_years(stream):
+    return iter_article_years(stream, 'article', _pmc_article_id, pmc_article_year)
+
+
+def efetch_years(db, ids, iter_years):
+    """
+    Args:
+        db: str: 'pubmed' or 'pmc'
+        ids: List of numeric IDs sent in a single request
+        iter_years: iter_pubmed_years / iter_pmc_years
+
+    Returns:
+        Dict: ID -> year for the articles found, None if the request failed
+    """
+    data = {'db': db, 'id': ','.join(ids), 'retmode': 'xml'}
+    if NCBI_API_KEY:
+        data['api_key'] = NCBI_API_KEY
+    try:
+        # POST, as recommended by NCBI for long ID lists
+        response = request('POST', EFETCH_URL, data=data, stream=True)
+    except requests.exceptions.RequestException as e:
+        logger.error("EFetch %s: %s", db, e)
+        return None
+    with response:
+        if response.status_code != 200:
+            logger.error("%s - EFetch %s", response.status_code, db)
+            return None
+        response.raw.decode_content = True
+        try:
+            return {key: year for key, year in iter_years(response.raw) if key and year}
+        except (requests.exceptions.RequestException, ET.ParseError) as e:
+            logger.error("EFetch %s: %s", db, e)
+            return None
+
+
+def split_publication_ids(pub_ids):
+    """
+    Args: Iterable of PMID/PMC IDs as found in the publication attributes, e.g. PMID:123, PMC:PMC456, PMC456
+
+    Returns: (Dict: PubMed ID -> original IDs, Dict: numeric PMC ID -> original IDs), other IDs are left out
+    """
+    pubmed, pmc = {}, {}
+    for pub_id in pub_ids:
+        upper = pub_id.upper()
+        number = re.sub(r'\D', '', pub_id.split(':')[-1])
+        if not number:
+            continue
+        if upper.startswith('PMID') or upper.startswith('PUBMED'):
+            pubmed.setdefault(number, []).append(pub_id)
+        elif upper.startswith('PMC'):
+            pmc.setdefault(number, []).append(pub_id)
+    return pubmed, pmc
+
+
+def get_publication_years_efetch(pub_ids, chunk_size=200, max_workers=1):
+    """
+    Args:
+        pub_ids: Iterable of PMID/PMC IDs
+        chunk_size: int: IDs per EFetch request
+        max_workers: int: concurrent EFetch requests, NCBI allows 3 requests per second without an API key
+
+    Returns:
+        (Dict: publication ID -> year for the publications found,
+         set of the publication IDs that were looked up, i.e. whose request succeeded)
+    """
+    pubmed, pmc = split_publication_ids(pub_ids)
+    jobs = []
+    for db, ids, iter_years in [('pubmed', pubmed, iter_pubmed_years), ('pmc', pmc, iter_pmc_years)]:
+        numbers = list(ids)
+        jobs.extend((db, numbers[i:i + chunk_size], iter_years, ids) for i in range(0, len(numbers), chunk_size))
+
+    publ_years = {}
+    answered = set()
+    if not jobs:
+        return publ_years, answered
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(jobs)))) as executor:
+        results = executor.map(in_context(lambda job: efetch_years(job[0], job[1], job[2])), jobs)
+        for (db, numbers, iter_years, ids), years in zip(jobs, results):
+            if years is None:
+                degrade('recency', (pub_id for number in numbers for pub_id in ids[number]))
+                continue
+            for number in numbers:
+                answered.update(ids[number])
+                if number in years:
+                    publ_years.update({pub_id: years[number] for pub_id in ids[number]})
+    return publ_years, answered
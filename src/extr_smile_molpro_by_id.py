@@ -1,46 +1,92 @@
-
-from rdkit import Chem
-from rdkit import DataStructs
-from rdkit.Chem import AllChem
+import logging
 import requests
-from contextlib import closing
-from known import find_known_results
-import json
-import orjson
-import pandas as pd
-from collections import Counter
-import time
+from concurrent.futures import ThreadPoolExecutor
+from cache import get_cache
+from http_client import request
+from budget import degrade
+from factor_store import get_store
+from metrics import in_context
+import os
+
+logger = logging.getLogger(__name__)
+
+MOLEPRO_URL = os.environ.get('NOVELTY_MOLEPRO_URL', "https://molepro.transltr.io/molecular_data_provider/compound/by_id")
+NO_SMILES = 'No SMILES could be found'
+NO_IDENTIFIERS = 'No identifiers could be found'
 
 
-def mol_to_smile_molpro(molecules):
+def mol_to_smile_molpro(molecules, chunk_size=200, max_workers=4):
     """
+    The molecules are looked up in the factor store (see factor_store) and the persistent SMILES cache first.
+    The ones missing from the cache are split into chunks of chunk_size IDs which are sent to MolePro in parallel
+    over the shared session. The answers, including the molecules without SMILES, are stored in the cache.
+
     Args:
         List
+        chunk_size: int: 200
+        max_workers: int: 4
 
     Returns:
         Dict
 
     """
+    data_mol = list(dict.fromkeys(molecules))
+    smiles = {}
+    store = get_store()
+    if store is not None:
+        smiles.update({key: value or NO_SMILES for key, value in store.smiles(data_mol).items()})
+    cache = get_cache('smiles')
+    cached = cache.get_many([mol for mol in data_mol if mol not in smiles])
+    smiles.update({key: (NO_SMILES if value is None else value) for key, value in cached.items()})
+
+    missing = [mol for mol in data_mol if mol not in smiles]
+    chunks = [missing[i:i + chunk_size] for i in range(0, len(missing), chunk_size)]
+    if chunks:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as executor:
+            for chunk_smiles in executor.map(in_context(mol_to_smile_molpro_chunk), chunks):
+                smiles.update(chunk_smiles)
+                cache.set_many({key: (None if value in (NO_SMILES, NO_IDENTIFIERS) else value)
+                                for key, value in chunk_smiles.items()})
+
+    # Keep the order of the input molecules
+    return {mol: smiles[mol] for mol in data_mol if mol in smiles}
+
+
+def mol_to_smile_molpro_chunk(molecules):
+    """
+    Args:
+        List: molecules sent to MolePro in a single request
 
-    url = "https://molepro.transltr.io/molecular_data_provider/compound/by_id"
+    Returns:
+        Dict: only the molecules MolePro answered for
+
+    """
     headers = {
         "accept": "application/json",
         "Content-Type": "application/json"
     }
-
     smiles = {}
+    failed = False
 
-    data_mol = list(set(molecules))
-    #print(f'init data: {len(data_mol)}')
+    data_mol = list(molecules)
     while data_mol:
-        #print(f'before: {len(data_mol)}')
         data_mol_before = len(data_mol)
-        response = requests.post(url, headers=headers, json=data_mol)
+        try:
+            response = request('POST', MOLEPRO_URL, headers=headers, json=data_mol)
+        except requests.exceptions.RequestException as e:
+            logger.error("MolePro: %s", e)
+            failed = True
+            break
 
         if response.status_code == 200:
             json_response = response.json()
             collec_url = json_response['url']
-            temp_collec_response = requests.get(collec_url)
+            try:
+                temp_collec_response = request('GET', collec_url)
+            except requests.exceptions.RequestException as e:
+                logger.error("MolePro: %s", e)
+                failed = True
+                break
             if temp_collec_response.status_code == 200:
                 collec_response = temp_collec_response.json()
 
@@ -48,25 +94,28 @@ def mol_to_smile_molpro(molecules):
                     key_list = ['identifiers']
                     if set(key_list).issubset(collec_response['elements'][i].keys()):
                         identifiers = collec_response['elements'][i]['identifiers']
-                        smile = identifiers.get('smiles', 'No SMILES could be found')
+                        smile = identifiers.get('smiles', NO_SMILES)
                         smiles[data_mol[i]] = smile
                     else:
-                        smiles[data_mol[i]] = 'No identifiers could be found'
+                        smiles[data_mol[i]] = NO_IDENTIFIERS
 
                 # Remove molecules with successfully retrieved smiles from data_mol
                 data_mol = [mol for mol in data_mol if mol not in smiles]
                 data_mol_after = len(data_mol)
-                #print(f'after: {len(data_mol)}')
 
                 if data_mol_after == data_mol_before:
                     break
 
             else:
-                print(f"Error: {temp_collec_response.status_code} - {temp_collec_response.text}")
+                logger.error("MolePro %s - %s", temp_collec_response.status_code, temp_collec_response.text)
+                failed = True
                 break
         else:
-            print(f"Error: {response.status_code} - {response.text}")
+            logger.error("MolePro %s - %s", response.status_code, response.text)
+            failed = True
             break
 
+    if failed:
+        # These molecules are scored without similarity
+        degrade('similarity', data_mol)
     return smiles
-
@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+
+"""
+Offline store of the factors of the novelty score, built once from bulk files and read before the caches and the
+external services: the SMILES of the drugs, their Morgan fingerprints, the publication years and the FDA status
+of the drugs. With a store covering the drugs and publications of a response, scoring it sends no request.
+
+Each table is a sorted array of keys (fixed width bytes) and its values: a fixed width array (years, FDA status),
+or the concatenated bytes of the values and their offsets (SMILES, fingerprints). All the arrays are memory
+mapped, opening a store reads nothing and a lookup is a binary search (np.searchsorted) in the keys.
+
+    python factor_store.py store/factors --smiles curie_smiles.tsv --years pmid_years.tsv --fda drug_fda.tsv
+
+The input files have one "key value" pair per line, separated by a tab or spaces, '#' starts a comment:
+- smiles: CURIE and SMILES, a CURIE without SMILES is stored as having none (not looked up in MolePro)
+- years: publication ID (PMID:... / PMC...) and year, a publication without year or with 0 as not found
+- fda: CURIE and FDA status, 'FDA Approval' (or 0) for the approved drugs, anything else for the others
+
+The scorer reads the store given by NOVELTY_FACTOR_STORE (the path without the suffixes), or use_store().
+"""
+
+import argparse
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from metrics import incr
+
+logger = logging.getLogger(__name__)
+
+STORE_PATH = os.environ.get('NOVELTY_FACTOR_STORE', '')
+RADIUS = 2
+TABLES = {'smiles': 'bytes', 'fingerprints': 'bytes', 'publication_year': np.int16, 'fda_status': np.int8}
+
+
+class SortedTable:
+    """
+    Args:
+        base: str: path of the store without the suffixes
+        name: str: name of the table
+    """
+
+    def __init__(self, base, name):
+        self.keys = np.load(f'{base}.{name}.keys.npy', mmap_mode='r')
+        if os.path.exists(f'{base}.{name}.values.npy'):
+            self.values = np.load(f'{base}.{name}.values.npy', mmap_mode='r')
+            self.offsets = self.data = None
+        else:
+            self.values = None
+            self.offsets = np.load(f'{base}.{name}.offsets.npy', mmap_mode='r')
+            self.data = np.load(f'{base}.{name}.data.npy', mmap_mode='r')
+
+    def __len__(self):
+        return len(self.keys)
+
+    def positions(self, keys):
+        """
+        Returns: Dict: key -> row of the keys found in the table
+        """
+        if not len(self.keys):
+            return {}
+        width = self.keys.dtype.itemsize
+        # Longer keys can not be in the table, and would match a truncated key
+        encoded = {key: key.encode() for key in keys if key}
+        encoded = {key: value for key, value in encoded.items() if len(value) <= width}
+        if not encoded:
+            return {}
+        queries = np.array(list(encoded.values()), dtype=self.keys.dtype)
+        rows = np.minimum(np.searchsorted(self.keys, queries), len(self.keys) - 1)
+        found = self.keys[rows] == queries
+        return {key: int(row) for key, row, hit in zip(encoded, rows, found) if hit}
+
+    def get_many(self, keys):
+        """
+        Returns: Dict: key -> value (bytes for the tables of bytes) of the keys found in the table
+        """
+        positions = self.positions(keys)
+        if self.values is not None:
+            return {key: self.values[row].item() for key, row in positions.items()}
+        return {key: self.data[self.offsets[row]:self.offsets[row + 1]].tobytes() for key, row in positions.items()}
+
+
+class FactorStore:
+    """
+    Args:
+        base: str: path of the store without the suffixes, as given to build_store
+    """
+
+    def __init__(self, base):
+        self.base = base
+        with open(f'{base}.meta.json') as f:
+            self.meta = json.load(f)
+        self.radius = self.meta['radius']
+        self.tables = {name: SortedTable(base, name) for name in self.meta['tables']}
+
+    def _get_many(self, name, keys):
+        table = self.tables.get(name)
+        if table is None:
+            return {}
+        found = table.get_many(keys)
+        incr('store_hits', len(found))
+        return found
+
+    def smiles(self, curies):
+        """ Returns: Dict: CURIE -> SMILES, '' for the CURIEs stored without SMILES """
+        return {key: value.decode() for key, value in self._get_many('smiles', curies).items()}
+
+    def publication_years(self, pub_ids):
+        """ Returns: Dict: publication ID -> year, None for the publications stored as not found """
+        return {key: value or None for key, value in self._get_many('publication_year', pub_ids).items()}
+
+    def fda_status(self, curies):
+        """ Returns: Dict: CURIE -> 0.0 (FDA approved) or 1.0 """
+        return {key: float(value) for key, value in self._get_many('fda_status', curies).items()}
+
+    def fingerprint(self, smiles):
+        """ Returns: the Morgan fingerprint (radius self.radius) of the SMILES, None when it is not stored """
+        value = self._get_many('fingerprints', [smiles]).get(smiles)
+        if value is None:
+            return None
+        from rdkit import DataStructs
+        return DataStructs.UIntSparseIntVect(value)
+
+
+_store = None
+_store_path = None
+_store_lock = threading.Lock()
+
+
+def use_store(base):
+    """ Makes the store at base (None: no store) the one of the process, in place of NOVELTY_FACTOR_STORE. """
+    global _store, _store_path
+    with _store_lock:
+        _store, _store_path = None, base or ''
+
+
+def get_store():
+    """
+    Returns: the process wide FactorStore, None when no store is set or it can not be opened
+    """
+    global _store, _store_path
+    if _store_path is None:
+        _store_path = STORE_PATH
+    if _store is None and _store_path:
+        with _store_lock:
+            if _store is None and _store_path:
+                try:
+                    _store = FactorStore(_store_path)
+                except (OSError, ValueError, KeyError) as e:
+                    logger.warning("Factor store %s disabled: %s", _store_path, e)
+                    _store_path = ''
+    return _store
+
+
+def read_pairs(path):
+    """
+    Args: str: file with one "key value" pair per line
+
+    Returns: Dict: key -> value ('' when the line has no value), the last line of a key wins
+    """
+    pairs = {}
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            fields = line.split('\t', 1) if '\t' in line else line.split(None, 1)
+            pairs[fields[0].strip()] = fields[1].strip() if len(fields) > 1 else ''
+    return pairs
+
+
+def _save_table(base, name, values, dtype):
+    keys = sorted(values)
+    width = max((len(key.encode()) for key in keys), default=1)
+    np.save(f'{base}.{name}.keys.npy', np.array([key.encode() for key in keys], dtype=f'S{max(1, width)}'))
+    if dtype == 'bytes':
+        blobs = [values[key] for key in keys]
+        offsets = np.zeros(len(blobs) + 1, dtype=np.int64)
+        np.cumsum([len(blob) for blob in blobs], out=offsets[1:])
+        np.save(f'{base}.{name}.offsets.npy', offsets)
+        np.save(f'{base}.{name}.data.npy', np.frombuffer(b''.join(blobs), dtype=np.uint8))
+    else:
+        np.save(f'{base}.{name}.values.npy', np.array([values[key] for key in keys], dtype=dtype))
+
+
+def _fingerprint_chunk(smiles, radius):
+    from rdkit import Chem
+    from rdkit.Chem import AllChem
+    fps = {}
+    for value in smiles:
+        mol = Chem.MolFromSmiles(value)
+        if mol is not None:
+            fps[value] = AllChem.GetMorganFingerprint(mol, radius).ToBinary()
+    return fps
+
+
+def build_store(base, smiles_file=None, years_file=None, fda_file=None, radius=RADIUS, workers=1, chunk_size=1000):
+    """
+    Builds the store files from the bulk files (see the module docstring), the fingerprints of the SMILES are
+    computed over workers processes.
+
+    Returns:
+        Dict: table -> number of entries
+    """
+    directory = os.path.dirname(base)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    counts = {}
+    if smiles_file:
+        smiles = read_pairs(smiles_file)
+        _save_table(base, 'smiles', {key: value.encode() for key, value in smiles.items()}, 'bytes')
+        distinct = list(dict.fromkeys(value for value in smiles.values() if value))
+        chunks = [distinct[i:i + chunk_size] for i in range(0, len(distinct), chunk_size)]
+        fps = {}
+        if workers > 1 and len(chunks) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                for chunk_fps in executor.map(_fingerprint_chunk, chunks, [radius] * len(chunks)):
+                    fps.update(chunk_fps)
+        else:
+            for chunk in chunks:
+                fps.update(_fingerprint_chunk(chunk, radius))
+        for value in distinct:
+            if value not in fps:
+                logger.warning("Invalid SMILES string %r", value)
+        _save_table(base, 'fingerprints', fps, 'bytes')
+        counts['smiles'] = len(smiles)
+        counts['fingerprints'] = len(fps)
+    if years_file:
+        years = {}
+        for key, value in read_pairs(years_file).items():
+            try:
+                years[key] = int(value) if value else 0
+            except ValueError:
+                years[key] = 0
+        _save_table(base, 'publication_year', years, np.int16)
+        counts['publication_year'] = len(years)
+    if fda_file:
+        fda = {key: 0 if value in ('FDA Approval', '0') else 1 for key, value in read_pairs(fda_file).items()}
+        _save_table(base, 'fda_status', fda, np.int8)
+        counts['fda_status'] = len(fda)
+    with open(f'{base}.meta.json', 'w') as f:
+        json.dump({'radius': radius, 'tables': counts}, f, indent=1)
+    return counts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the offline factor store of the novelty score')
+    parser.add_argument('base', help='path of the store files without the suffixes')
+    parser.add_argument('--smiles', help='file of "CURIE SMILES" lines')
+    parser.add_argument('--years', help='file of "publication ID year" lines')
+    parser.add_argument('--fda', help='file of "CURIE FDA status" lines')
+    parser.add_argument('--workers', type=int, default=1, help='processes fingerprinting the molecules')
+    args = parser.parse_args()
+    if not (args.smiles or args.years or args.fda):
+        parser.error('give at least one of --smiles, --years, --fda')
+    for name, count in build_store(args.base, args.smiles, args.years, args.fda, workers=args.workers).items():
+        print(f"{name}: {count} entries written to {args.base}")
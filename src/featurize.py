@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+
+"""
+Parallel featurization of molecules: SMILES parsing and Morgan bit vector fingerprinting spread over a pool of
+worker processes, in chunks. The caller allocates a shared memory block for the fingerprint matrix and each
+worker writes the packed uint64 rows of its chunk straight into it, so only the chunk offsets and the errors
+go through pickling, never RDKit objects. A SMILES that can not be parsed is reported for its molecule and
+leaves the others untouched.
+
+The count-based Morgan fingerprints of the default similarity (see mol_similarity.FingerprintIndex) have no fixed
+width: featurize_counts spreads them over the same pool, and the workers send back their compact binary form
+instead of the RDKit objects.
+
+The number of processes defaults to NOVELTY_WORKERS (1: everything runs in the calling process), at most the
+number of CPUs available to the process.
+"""
+
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from rdkit import Chem
+from fp_library import NBITS, RADIUS, fingerprint_words, popcount
+
+
+def available_cpus():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+# More processes than CPUs only adds the cost of the pool: 3000 molecules on 1 CPU take 0.55 s over 2 workers
+# against 0.51 s in the calling process
+WORKERS = max(1, min(int(os.environ.get('NOVELTY_WORKERS', 1) or 1), available_cpus()))
+CHUNK_SIZE = 512
+# Below this number of molecules starting the pool costs more than it saves. Starting the pool and collecting
+# the chunks costs about 40 ms, about 200 molecules at 5000 molecules/s per CPU
+MIN_PARALLEL = 2048
+
+
+def featurize_chunk(smiles, out, nbits=NBITS, radius=RADIUS):
+    """
+    Args:
+        smiles: List of SMILES
+        out: np.ndarray: uint64 rows receiving the fingerprints, one per SMILES
+        nbits: int
+        radius: int
+
+    Returns:
+        Dict: position in smiles -> error, for the SMILES that could not be parsed (their row is left as is)
+    """
+    invalid = {}
+    for i, value in enumerate(smiles):
+        mol = Chem.MolFromSmiles(value) if value else None
+        if mol is None:
+            invalid[i] = f'invalid SMILES {value!r}'
+            continue
+        out[i] = fingerprint_words(mol, nbits, radius)
+    return invalid
+
+
+def morgan_counts_chunk(smiles, radius=RADIUS):
+    """
+    Args:
+        smiles: List of SMILES
+        radius: int
+
+    Returns:
+        (List: binary form of the count-based Morgan fingerprint of each SMILES, None for the ones that could not
+         be parsed,
+         Dict: position in smiles -> error, for the SMILES that could not be parsed)
+    """
+    from rdkit.Chem import AllChem
+    fps = []
+    invalid = {}
+    for i, value in enumerate(smiles):
+        mol = Chem.MolFromSmiles(value) if value else None
+        if mol is None:
+            fps.append(None)
+            invalid[i] = f'invalid SMILES {value!r}'
+            continue
+        fps.append(AllChem.GetMorganFingerprint(mol, radius).ToBinary())
+    return fps, invalid
+
+
+def _attach(name):
+    # The caller owns the block. Before Python 3.13 attaching registers it again with the resource tracker,
+    # which the pool workers share with the caller, so the caller's unlink still releases it
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+def _featurize_shared(name, shape, start, smiles, nbits, radius):
+    block = _attach(name)
+    try:
+        fps = np.ndarray(shape, dtype=np.uint64, buffer=block.buf)
+        invalid = featurize_chunk(smiles, fps[start:start + len(smiles)], nbits, radius)
+        del fps
+    finally:
+        block.close()
+    return {start + i: error for i, error in invalid.items()}
+
+
+def featurize(smiles_dict, nbits=NBITS, radius=RADIUS, workers=None, chunk_size=CHUNK_SIZE):
+    """
+    Args:
+        smiles_dict: Dict: molecule ID -> SMILES
+        nbits: int: 2048, a multiple of 64
+        radius: int: 2
+        workers: int: processes, default WORKERS
+        chunk_size: int: molecules per task sent to a worker
+
+    Returns:
+        (List of the IDs of the valid molecules,
+         np.ndarray: their fingerprints, uint64 matrix of nbits / 64 words per row, in the order of the IDs,
+         np.ndarray: number of bits set in each row,
+         Dict: ID -> error for the molecules whose SMILES could not be parsed)
+    """
+    workers = WORKERS if workers is None else workers
+    keys = list(smiles_dict)
+    smiles = [smiles_dict[key] for key in keys]
+    shape = (len(keys), nbits // 64)
+
+    if workers <= 1 or len(keys) < MIN_PARALLEL:
+        fps = np.zeros(shape, dtype=np.uint64)
+        invalid = featurize_chunk(smiles, fps, nbits, radius)
+    else:
+        block = shared_memory.SharedMemory(create=True, size=max(1, shape[0] * shape[1] * 8))
+        try:
+            shared = np.ndarray(shape, dtype=np.uint64, buffer=block.buf)
+            shared[:] = 0
+            invalid = {}
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(_featurize_shared, block.name, shape, start,
+                                           smiles[start:start + chunk_size], nbits, radius)
+                           for start in range(0, len(keys), chunk_size)]
+                for future in futures:
+                    invalid.update(future.result())
+            # Copy out of the block, which is released right away
+            fps = shared.copy()
+            del shared
+        finally:
+            block.close()
+            block.unlink()
+
+    if invalid:
+        valid = [i for i in range(len(keys)) if i not in invalid]
+        fps = fps[valid]
+        keys_valid = [keys[i] for i in valid]
+    else:
+        keys_valid = keys
+    counts = popcount(fps).sum(axis=1, dtype=np.int64).astype(np.uint16)
+    return keys_valid, fps, counts, {keys[i]: error for i, error in invalid.items()}
+
+
+def featurize_counts(smiles_dict, radius=RADIUS, workers=None, chunk_size=CHUNK_SIZE):
+    """
+    Args:
+        smiles_dict: Dict: molecule ID -> SMILES
+        radius: int: 2
+        workers: int: processes, default WORKERS
+        chunk_size: int: molecules per task sent to a worker
+
+    Returns:
+        (List of the IDs of the valid molecules,
+         List of their count-based Morgan fingerprints (UIntSparseIntVect), in the order of the IDs,
+         Dict: ID -> error for the molecules whose SMILES could not be parsed)
+    """
+    from rdkit import DataStructs
+    workers = WORKERS if workers is None else workers
+    keys = list(smiles_dict)
+    smiles = [smiles_dict[key] for key in keys]
+
+    if workers <= 1 or len(keys) < MIN_PARALLEL:
+        binaries, invalid = morgan_counts_chunk(smiles, radius)
+    else:
+        binaries = []
+        invalid = {}
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [(start, executor.submit(morgan_counts_chunk, smiles[start:start + chunk_size], radius))
+                       for start in range(0, len(keys), chunk_size)]
+            for start, future in futures:
+                chunk, chunk_invalid = future.result()
+                binaries.extend(chunk)
+                invalid.update({start + i: error for i, error in chunk_invalid.items()})
+
+    keys_valid = [key for key, binary in zip(keys, binaries) if binary is not None]
+    fps = [DataStructs.UIntSparseIntVect(binary) for binary in binaries if binary is not None]
+    return keys_valid, fps, {keys[i]: error for i, error in invalid.items()}
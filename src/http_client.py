@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+
+"""
+Shared HTTP client for the calls to the external services (MolePro, Text Mining Provider, EUtils).
+
+A single requests.Session keeps the connections to each host alive and pooled, instead of opening a new
+connection for every request. request() sends through it under the active latency budget (see budget) and
+under the scheduler of the host:
+- a token bucket keeps the request rate within the limit of the host, if it has one (RATE_LIMITS),
+- the number of requests in flight adapts: it is halved when the host answers 429 or 5xx and grows by one
+  per round of successful requests (AIMD), up to POOL_MAXSIZE,
+- identical requests already in flight are not sent again, their callers share the answer.
+Throttled requests are retried after the Retry-After of the host, or an exponential backoff.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from metrics import incr
+from budget import BudgetExhausted, call_timeout, current_budget
+
+POOL_CONNECTIONS = 8
+POOL_MAXSIZE = 32
+
+# Requests per second allowed by the hosts that enforce a limit, NCBI allows 10 with an API key and 3 without.
+# More can be set with NOVELTY_RATE_LIMITS, e.g. "molepro.transltr.io=20,eutils.ncbi.nlm.nih.gov=10"
+RATE_LIMITS = {'eutils.ncbi.nlm.nih.gov': 10.0 if os.environ.get('NCBI_API_KEY') else 3.0}
+for _item in filter(None, os.environ.get('NOVELTY_RATE_LIMITS', '').split(',')):
+    _host, _, _rate = _item.partition('=')
+    RATE_LIMITS[_host.strip()] = float(_rate)
+
+# Retries of a throttled or failed request when no budget is active
+RETRIES = 2
+BACKOFF = 0.5
+THROTTLE_STATUS = {429, 500, 502, 503, 504}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def _count_response(response, *args, **kwargs):
+    incr('http_requests')
+    if kwargs.get('stream'):
+        # The body of a streamed response is not read here, count its announced length
+        incr('http_bytes', int(response.headers.get('Content-Length', 0) or 0))
+    else:
+        incr('http_bytes', len(response.content))
+    return response
+
+
+def get_session():
+    """
+    Returns: the process wide requests.Session
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                session.hooks['response'].append(_count_response)
+                _session = session
+    return _session
+
+
+class HostScheduler:
+    """
+    Admission of the requests to one host.
+
+    Args:
+        rate: float: requests per second allowed, None for no limit
+        burst: float: requests that can be sent at once after an idle period, by default 1 so that the requests
+            are evenly spaced and no sliding one second window of the host sees more than rate of them
+        max_concurrency: int: upper bound of the adaptive number of requests in flight
+    """
+
+    def __init__(self, rate=None, burst=None, max_concurrency=POOL_MAXSIZE):
+        self.rate = rate
+        self.burst = burst if burst is not None else 1.0
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.max_concurrency = max_concurrency
+        self.concurrency = float(max_concurrency)
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self._cond = threading.Condition()
+
+    def _wait_time(self, now):
+        # Seconds before a request can be sent (None: until one in flight completes), called with the lock held
+        if self.in_flight >= int(self.concurrency):
+            return None
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.rate:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                return (1 - self.tokens) / self.rate
+        return 0.0
+
+    def acquire(self, deadline=None):
+        """
+        Blocks until a request can be sent.
+
+        Args:
+            deadline: float: time.monotonic() after which to give up, None to wait as long as needed
+
+        Raises: BudgetExhausted when the deadline passes first
+        """
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                wait = self._wait_time(now)
+                if wait == 0.0:
+                    if self.rate:
+                        self.tokens -= 1
+                    self.in_flight += 1
+                    return
+                if deadline is not None:
+                    if now >= deadline:
+                        raise BudgetExhausted('latency budget exhausted waiting for the rate limit')
+                    wait = deadline - now if wait is None else min(wait, deadline - now)
+                self._cond.wait(wait)
+
+    def release(self, throttled=False, retry_after=None):
+        """
+        Args:
+            throttled: bool: the host answered 429 / 5xx or did not answer, the concurrency is halved
+            retry_after: float: seconds the host asked to wait before the next request
+        """
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self.concurrency = max(1.0, self.concurrency / 2)
+                if retry_after:
+                    self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+            else:
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+            self._cond.notify_all()
+
+
+_schedulers = {}
+_in_flight = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(host):
+    """ Returns: the process wide HostScheduler of host ('name:port' as in the URLs) """
+    with _schedulers_lock:
+        if host not in _schedulers:
+            _schedulers[host] = HostScheduler(rate=RATE_LIMITS.get(host))
+        return _schedulers[host]
+
+
+def set_rate_limit(host, rate, burst=None):
+    """ Sets the requests per second allowed to host, None for no limit. """
+    with _schedulers_lock:
+        RATE_LIMITS[host] = rate
+        _schedulers[host] = HostScheduler(rate=rate, burst=burst)
+
+
+def _retry_after(response):
+    value = response.headers.get('Retry-After')
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+def _send(method, url, kwargs):
+    # The request goes through the scheduler of its host, and is sent again while retries are allowed
+    budget = current_budget()
+    attempts = 1 + (budget.retries if budget is not None else RETRIES)
+    scheduler = get_scheduler(urlsplit(url).netloc)
+    for attempt in range(attempts):
+        scheduler.acquire(budget.deadline if budget is not None else None)
+        try:
+            response = get_session().request(method, url, timeout=call_timeout(), **kwargs)
+        except BudgetExhausted:
+            scheduler.release()
+            raise
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
+            scheduler.release(throttled=True)
+            if attempt == attempts - 1:
+                raise
+            incr('http_retries')
+            continue
+        except BaseException:
+            scheduler.release()
+            raise
+        throttled = response.status_code in THROTTLE_STATUS
+        retry_after = _retry_after(response) if throttled else None
+        scheduler.release(throttled, retry_after)
+        if not throttled or attempt == attempts - 1:
+            return response
+        incr('http_throttled')
+        incr('http_retries')
+        response.close()
+        delay = retry_after if retry_after is not None else BACKOFF * 2 ** attempt
+        if budget is not None:
+            delay = min(delay, budget.remaining())
+        time.sleep(delay)
+
+
+def request(method, url, **kwargs):
+    """
+    Sends a request with the shared session, under the scheduler of its host and with the timeout given by the
+    active latency budget. Requests that time out, can not connect or are throttled (429 / 5xx) are sent again,
+    up to the number of retries of the budget (RETRIES without budget) and while time is left. The callers of
+    an identical request, not streamed, already in flight wait for its answer instead of sending it again.
+
+    Args:
+        method: str: 'GET', 'POST', ...
+        url: str
+        **kwargs: passed to requests.Session.request
+
+    Returns: requests.Response
+
+    Raises: requests.exceptions.RequestException, BudgetExhausted when the budget is spent
+    """
+    if kwargs.get('stream'):
+        return _send(method, url, kwargs)
+
+    key = (method, url, repr(kwargs.get('params')), repr(kwargs.get('data')), repr(kwargs.get('json')))
+    with _schedulers_lock:
+        future = _in_flight.get(key)
+        leader = future is None
+        if leader:
+            future = _in_flight[key] = Future()
+    if not leader:
+        incr('http_coalesced')
+        budget = current_budget()
+        try:
+            return future.result(timeout=budget.remaining() if budget is not None and budget.deadline is not None
+                                 else None)
+        except FutureTimeoutError:
+            raise BudgetExhausted('latency budget exhausted waiting for an identical request')
+
+    try:
+        response = _send(method, url, kwargs)
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    else:
+        future.set_result(response)
+        return response
+    finally:
+        with _schedulers_lock:
+            del _in_flight[key]
@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+
+"""
+Incremental novelty scoring of a response that grows over time: the ARS merges the results of the ARAs into
+the same PK as they arrive, and each new version of mergedAnnotatedOutput is mostly the previous one plus a few
+results.
+
+An IncrementalScorer keeps the state of one PK between its versions: the results already processed, the rows of
+their edges (FDA status, publications, age of the oldest publication), the aggregates of the drugs, their SMILES,
+the fingerprints of the known drugs and the nearest known drug of each unknown drug. A new version only costs the
+extraction, the lookups and the fingerprinting of its new results. The nearest neighbors of the unknown drugs
+already scored are compared with the new known drugs only, and not at all once they found an identical one.
+The scores of all the results are then put together with vectorized operations, as score_response would.
+
+    scorer = IncrementalScorer()
+    df = scorer.update(response_v1)
+    df = scorer.update(response_v2)   # only the results added since response_v1 are processed
+
+Lookups that fail (SMILES, publications) are retried with the next version. A result is identified by the IDs of
+its nodes and edges, when a version no longer has one of the results already processed (replaced by the ARS) the
+state is rebuilt from that version.
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+from message_index import MessageIndex
+from extr_smile_molpro_by_id import mol_to_smile_molpro, NO_SMILES
+from mol_similarity import FingerprintIndex, find_nearest_neighbors
+from novelty_score_calculation import (extracting_drug_fda_publ_date, add_publication_ages, aggregate_by_drug, add_scores,
+                                       nearest_similarity, degraded_factors, fan_out, score_response)
+from edge_table import EdgeTable
+from budget import Budget, use_budget, current_budget
+from http_client import RETRIES
+from metrics import Metrics, current_metrics, use_metrics, stage, incr
+
+logger = logging.getLogger(__name__)
+
+# PKs whose state is kept by score_pk, the least recently scored ones are dropped beyond
+MAX_SCORERS = 256
+
+
+def result_key(result):
+    """ Returns: the identity of a result: the sorted IDs of its bound nodes and of its bound edges """
+    nodes = tuple(sorted(binding['id'] for bindings in result['node_bindings'].values() for binding in bindings))
+    edges = tuple(sorted(binding['id'] for analysis in result.get('analyses') or ()
+                         for bindings in analysis['edge_bindings'].values() for binding in bindings))
+    return nodes, edges
+
+
+class IncrementalScorer:
+    """
+    Novelty scores of the successive versions of one merged response, see update(). Not thread safe.
+
+    Args:
+        library: optional fp_library.FingerprintLibrary, see score_response
+    """
+
+    def __init__(self, library=None):
+        self.library = library
+        self.reset()
+
+    def reset(self):
+        self.ids = {}
+        self.stale = set()
+        self.rows = None
+        self.result_edges = None
+        self.drugs = {}
+        self.known_drugs = set()
+        self.unknown_drugs = set()
+        self.pending_known = {}
+        self.pending_unknown = {}
+        self.known_index = FingerprintIndex({})
+        self.queries = {}
+        self.nearest = {}
+        self.unresolved_publications = set()
+
+    def update(self, response, level='edge', per_drug=False, budget=None, return_metrics=False):
+        """
+        Scores a new version of the response.
+
+        Args:
+            response: Dict: the parsed merged response, a later version of the one of the previous call
+            level, per_drug, budget, return_metrics: see score_response, the budget applies to the lookups of
+                this version
+
+        Returns: the same as score_response(response, ...) on the whole response
+        """
+        metrics = Metrics() if return_metrics else current_metrics()
+        if budget is None:
+            budget = current_budget()
+        elif not isinstance(budget, Budget):
+            budget = Budget(budget)
+        report = budget is not None
+        if budget is None:
+            # Only records the failed lookups, to retry them with the next version
+            budget = Budget(None, retries=RETRIES)
+        with use_metrics(metrics), use_budget(budget):
+            df = self._update(response, level, per_drug, budget, report)
+        return (df, metrics.as_dict()) if return_metrics else df
+
+    def _update(self, response, level, per_drug, budget, report):
+        import pandas as pd
+        fields = response['fields']
+        if fields['status'] != 'Done' or not fields['data']['message']['results']:
+            return pd.DataFrame()
+        message = fields['data']['message']
+
+        with stage('split'):
+            keys = [result_key(result) for result in message['results']]
+            positions = {key: idres for idres, key in enumerate(keys)}
+            if not self.ids.keys() <= positions.keys():
+                self.reset()
+            todo = [idres for idres, key in enumerate(keys) if key not in self.ids or self.ids[key] in self.stale]
+            delta = {'fields': {'status': fields['status'], 'data': {'message': dict(
+                message, results=[message['results'][idres] for idres in todo])}}}
+            index = MessageIndex(delta)
+            if not index.complete or index.query[2] != 1:
+                # Nothing to keep for the responses that are not about drugs
+                return score_response(response, library=self.library, level=level, per_drug=per_drug)
+            incr('items', len(todo))
+
+        # Results whose lookups failed with the previous version are processed again
+        redo = {self.ids[keys[idres]] for idres in todo if keys[idres] in self.ids}
+        if redo:
+            self.rows = self.rows.take(np.flatnonzero(~np.isin(self.rows['rid'], list(redo))))
+            self.result_edges = self.result_edges[~self.result_edges['rid'].isin(redo)]
+            self.stale -= redo
+        rids = [self.ids.setdefault(keys[idres], len(self.ids)) for idres in todo]
+
+        with stage('attributes'):
+            rows, _ = extracting_drug_fda_publ_date(delta, index.unknown, index=index, lookup_publications=False)
+            incr('items', len(rows))
+        add_publication_ages(rows)
+        rows['rid'] = np.array([rids[i] for i in index.unknown for _ in index.result_scored_edges[i]],
+                               dtype=np.int64)[rows['edge']]
+        result_edges = pd.DataFrame([(rids[i], edge_id) for i in range(len(todo)) if i in index.unknown_set
+                                     for edge_id in index.result_edges[i]], columns=['rid', 'edge_id'])
+        self._track_publications(rows, budget)
+        if self.rows is None:
+            self.rows, self.result_edges = rows, result_edges
+        elif len(rows):
+            self.rows = EdgeTable.concat([self.rows, rows])
+            self.result_edges = pd.concat([self.result_edges, result_edges], ignore_index=True)
+
+        with stage('aggregation'):
+            if redo:
+                self.drugs = {}
+                self._aggregate(self.rows)
+            else:
+                self._aggregate(rows)
+
+        known = [index.result_drug(i) for i in index.known] if self.library is None else []
+        unknown = [index.result_drug(i) for i in index.unknown]
+        try:
+            self._similarity(known, unknown)
+        except Exception as e:
+            logger.error("similarity: %s", e)
+
+        return self._output(level, per_drug, {key: idres for key, idres in positions.items() if key in self.ids},
+                            report)
+
+    def _track_publications(self, rows, budget):
+        # The rows of the publications that could not be looked up are processed again with the next version
+        looked_up = set(rows.distinct_publications())
+        unresolved = budget.unresolved.get('recency', set()) & looked_up
+        self.unresolved_publications = (self.unresolved_publications - looked_up) | unresolved
+        if unresolved:
+            selected = np.array([x in unresolved for x in rows.publications], dtype=bool)
+            self.stale.update(rows['rid'][rows.rows_with_publications(selected)].tolist())
+
+    def _aggregate(self, rows):
+        # Merges the rows into the aggregates of their drugs, as aggregate_by_drug over all the rows would
+        drugs = aggregate_by_drug(rows)
+        for i, (drug, fda_status, age, edges) in enumerate(zip(drugs['drug'], drugs['fda status'],
+                                                               drugs['age_oldest_pub'], drugs['number_of_edges'])):
+            publications = drugs.row_publications(i)
+            entry = self.drugs.get(drug)
+            if entry is None:
+                self.drugs[drug] = [fda_status, dict.fromkeys(publications), age, edges]
+            else:
+                entry[0] = np.fmin(entry[0], fda_status)
+                entry[1].update(dict.fromkeys(publications))
+                entry[2] = np.fmax(entry[2], age)
+                entry[3] += edges
+
+    def _similarity(self, known, unknown):
+        new_known = [drug for drug in dict.fromkeys(known) if drug not in self.known_drugs]
+        new_unknown = [drug for drug in dict.fromkeys(unknown) if drug not in self.unknown_drugs]
+        self.known_drugs.update(new_known)
+        self.unknown_drugs.update(new_unknown)
+        lookup_known = list(dict.fromkeys(list(self.pending_known) + new_known))
+        lookup_unknown = list(dict.fromkeys(list(self.pending_unknown) + new_unknown))
+        if not lookup_known and not lookup_unknown:
+            return
+
+        with stage('smiles'):
+            incr('items', len(set(lookup_unknown + lookup_known)))
+            smiles = mol_to_smile_molpro(lookup_unknown + lookup_known)
+        self.pending_known = {drug: None for drug in lookup_known if drug not in smiles}
+        self.pending_unknown = {drug: None for drug in lookup_unknown if drug not in smiles}
+        known_smiles = {drug: smiles[drug] for drug in lookup_known if drug in smiles and smiles[drug] != NO_SMILES}
+        unknown_smiles = {drug: smiles[drug] for drug in lookup_unknown if drug in smiles}
+
+        if known_smiles:
+            with stage('fingerprinting'):
+                added = FingerprintIndex(known_smiles)
+                incr('items', len(added))
+                for key, error in added.invalid.items():
+                    logger.warning("Invalid SMILES string for %s: %s", key, error)
+            # Only the new known drugs can improve the nearest neighbors found so far, and not the identical ones
+            queries = {drug: value for drug, value in self.queries.items()
+                       if not self.nearest.get(drug) or self.nearest[drug][0][1] < 1}
+            if len(added) and queries:
+                for drug, neighbors in find_nearest_neighbors(queries, added, 0, 1).items():
+                    if neighbors and (not self.nearest.get(drug) or neighbors[0][1] > self.nearest[drug][0][1]):
+                        self.nearest[drug] = neighbors
+            self.known_index.add(known_smiles)
+
+        if unknown_smiles:
+            nearest = find_nearest_neighbors(unknown_smiles,
+                                             self.library if self.library is not None else self.known_index, 0, 1)
+            self.nearest.update(nearest)
+            self.queries.update({drug: unknown_smiles[drug] for drug in nearest})
+
+    def _drug_table(self):
+        drugs = list(self.drugs)
+        entries = list(self.drugs.values())
+        return EdgeTable.from_rows(drugs, [list(entry[1]) for entry in entries], **{
+            'fda status': np.array([entry[0] for entry in entries], dtype=np.float64),
+            'number_of_publ': np.array([len(entry[1]) for entry in entries], dtype=np.float64),
+            'age_oldest_pub': np.array([entry[2] for entry in entries], dtype=np.float64),
+            'number_of_edges': np.array([entry[3] for entry in entries], dtype=np.int64)})
+
+    def _degraded(self):
+        # The factors still unresolved after this version, in the form degraded_factors expects
+        state = Budget(None)
+        if self.pending_known and self.library is None:
+            # The nearest known drug may be one of those whose SMILES are missing
+            state.degrade('similarity', self.unknown_drugs)
+        elif self.pending_unknown:
+            state.degrade('similarity', self.pending_unknown)
+        if self.unresolved_publications:
+            state.degrade('recency', self.unresolved_publications)
+        return state
+
+    def _output(self, level, per_drug, positions, report):
+        similarity = nearest_similarity(self.nearest)
+        with stage('scoring'):
+            df = self._drug_table() if per_drug or level == 'drug' else self.rows.copy()
+            incr('items', len(df))
+            df['similarity'] = np.array([similarity.get(drug, np.nan) for drug in df.drugs],
+                                        dtype=float)[df.drug_codes]
+            add_scores(df)
+
+            columns = ['drug', 'novelty_score']
+            if report:
+                state = self._degraded()
+                df['degraded'] = np.array(degraded_factors(df, state), dtype=object)
+                columns.append('degraded')
+            if per_drug and level != 'drug':
+                # Fan the scores of the drugs back out to their edges
+                df = fan_out(self.rows, df, columns[1:])
+
+            if level == 'result':
+                rid_positions = {self.ids[key]: idres for key, idres in positions.items()}
+                edges = df.to_frame(['edge_id'] + columns).drop_duplicates('edge_id')
+                df = self.result_edges.merge(edges, on='edge_id', how='inner').assign(
+                    result=lambda x: x['rid'].map(rid_positions)).sort_values(by='novelty_score', ascending=False)
+                df = df.drop_duplicates('result')[['result'] + columns]
+            else:
+                df = df.to_frame(columns).sort_values(by='novelty_score', ascending=False)
+            if report:
+                df.attrs['degraded'] = state.degraded
+        return df
+
+
+_scorers = OrderedDict()
+_scorers_lock = threading.Lock()
+
+
+def score_pk(pk, response, library=None, **kwargs):
+    """
+    Scores a version of the merged response of a PK with the IncrementalScorer kept for the PK.
+
+    Args:
+        pk: str: the PK of the merged response
+        response: Dict
+        library: optional fp_library.FingerprintLibrary, used when the scorer of the PK is created
+        **kwargs: see IncrementalScorer.update
+
+    Returns: see score_response
+    """
+    with _scorers_lock:
+        scorer = _scorers.pop(pk, None)
+        if scorer is None:
+            scorer = IncrementalScorer(library)
+        _scorers[pk] = scorer
+        while len(_scorers) > MAX_SCORERS:
+            _scorers.popitem(last=False)
+    return scorer.update(response, **kwargs)
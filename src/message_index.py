@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+
+"""
+Lookup tables over the TRAPI message of a response, built in a single pass and shared by all the steps of
+the novelty score (known/unknown split, FDA/publication extraction, molecular similarity, result extraction)
+instead of each of them walking response['fields']['data']['message'] again.
+"""
+
+INFERRING_SOURCES = ['infores:aragorn', 'infores:arax', 'infores:biothings-explorer',
+                     'infores:improving-agent', 'infores:robokop']
+MESSAGE_KEYS = ['results', 'knowledge_graph', 'query_graph']
+ATTRIBUTE_TYPE_IDS_FDA = ['biolink:FDA_approval_status', 'biolink:FDA_APPROVAL_STATUS']
+ATTRIBUTE_TYPE_IDS_PUB = ['biolink:publications', 'biolink:Publication', 'biolink:publication']
+
+
+def publication_key(pub_id):
+    """
+    Args: str: PMID/PMC ID, as found in the publication attributes or in the answers of the Text Mining Provider,
+        e.g. PMID:123, pmid:123, PUBMED:123, PMC:PMC456, PMC456
+
+    Returns: str: the ID in a single spelling (PMID:123, PMC:456), so that the spellings of a publication match
+        whatever their case and prefix; the other IDs are upper-cased
+    """
+    value = pub_id.strip().upper()
+    number = ''.join(c for c in value.split(':')[-1] if c.isdigit())
+    if number and (value.startswith('PMID') or value.startswith('PUBMED')):
+        return f'PMID:{number}'
+    if number and value.startswith('PMC'):
+        return f'PMC:{number}'
+    return value
+
+
+def is_drug_curie(curie):
+    return ('PUBCHEM' in curie or 'CHEMBL' in curie or 'UNII' in curie or 'RXNORM' in curie or 'UMLS' in curie
+            or not 'MONDO' in curie)
+
+
+def query_id(response):
+    if response['fields']['status'] == 'Done':
+        for i in response['fields']['data']['message']['query_graph']['nodes']:
+            if 'ids' in response['fields']['data']['message']['query_graph']['nodes'][i].keys():
+                if response['fields']['data']['message']['query_graph']['nodes'][i]['ids']:
+                    known_node = response['fields']['data']['message']['query_graph']['nodes'][i]['categories'][0]
+                else:
+                    unknown_node = response['fields']['data']['message']['query_graph']['nodes'][i]['categories'][0]
+            else:
+                unknown_node = response['fields']['data']['message']['query_graph']['nodes'][i]['categories'][0]
+        if unknown_node in ['biolink:ChemicalEntity', 'biolink:SmallMolecule', 'biolink:Drug']:
+            chk=1
+        else:
+            chk=0
+    return known_node, unknown_node, chk
+
+
+class MessageIndex:
+    """
+    Args:
+        response: Dict: response of an ARA / merged response, as returned by the ARS
+
+    Attributes:
+        status: the status of the response
+        complete: the message has results, knowledge_graph and query_graph
+        results: List: the results of the message
+        edges: Dict: the knowledge graph edges
+        known, unknown: List of the indices of the known / unknown results, as find_known_results
+        known_set, unknown_set: the same as sets, for membership checks
+        edge_primary_sources: Dict: edge ID -> IDs of its primary knowledge sources
+        result_edges: List: per result, the edge IDs bound to the first query edge in every analysis
+        result_scored_edges: List: per result, the first edge ID bound to each query edge in the first analysis
+    """
+
+    def __init__(self, response):
+        self.status = response['fields']['status']
+        message = response['fields'].get('data', {}).get('message') or {}
+        self.complete = set(MESSAGE_KEYS).issubset(message.keys())
+        self.results = message.get('results') or []
+        self.edges = message['knowledge_graph']['edges'] if self.complete else {}
+        self._response = response
+        self._query = None
+        self._edge_drug = {}
+        self._result_drug = {}
+
+        self.edge_primary_sources = {}
+        self.known = []
+        self.unknown = []
+        self.result_edges = []
+        self.result_scored_edges = []
+        if self.complete:
+            self._index_results()
+        self.known_set = set(self.known)
+        self.unknown_set = set(self.unknown)
+
+    def _primary_sources(self, edge_id):
+        sources = self.edge_primary_sources.get(edge_id)
+        if sources is None:
+            sources = [source["resource_id"] for source in self.edges[edge_id]["sources"]
+                       if source["resource_role"] == "primary_knowledge_source"]
+            self.edge_primary_sources[edge_id] = sources
+        return sources
+
+    def _index_results(self):
+        for idres, result in enumerate(self.results):
+            analyses = result.get('analyses')
+            result_edges = []
+            scored_edges = []
+            if analyses is not None:
+                for ida, analysis in enumerate(analyses):
+                    for idb, eb in enumerate(analysis["edge_bindings"].values()):
+                        if ida == 0 and eb:
+                            scored_edges.append(eb[0]["id"])
+                        for element in eb:
+                            edge_id = element["id"]
+                            if idb == 0:
+                                result_edges.append(edge_id)
+                            # A result is known as soon as one of its edges has a non inferring primary source
+                            for resource_id in self._primary_sources(edge_id):
+                                if resource_id not in INFERRING_SOURCES:
+                                    self.known.append(idres)
+                                    break
+                                else:
+                                    self.unknown.append(idres)
+            self.result_edges.append(result_edges)
+            self.result_scored_edges.append(scored_edges)
+
+    @property
+    def query(self):
+        """ (known node category, unknown node category, 1 if the unknown node is a drug else 0), see query_id """
+        if self._query is None:
+            self._query = query_id(self._response)
+        return self._query
+
+    def edge_drug(self, edge_id):
+        """ The drug CURIE of an edge: its subject when it looks like a drug, otherwise its object. """
+        drug = self._edge_drug.get(edge_id)
+        if drug is None:
+            edge = self.edges[edge_id]
+            drug = edge['subject'] if is_drug_curie(edge['subject']) else edge['object']
+            self._edge_drug[edge_id] = drug
+        return drug
+
+    def result_drug(self, idres):
+        """ The drug CURIE of a result, from its node bindings. """
+        drug = self._result_drug.get(idres)
+        if drug is None:
+            node_bindings = self.results[idres]['node_bindings']
+            s = list(node_bindings.keys())
+            drug = node_bindings[s[0]][0]['id']
+            if not is_drug_curie(drug):
+                drug = node_bindings[s[1]][0]['id']
+            self._result_drug[idres] = drug
+        return drug
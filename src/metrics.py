@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+
+"""
+Per-stage instrumentation of the novelty score pipeline.
+
+A Metrics collector is activated with use_metrics(); the code of the pipeline then marks its stages with
+stage('name') and counts events with incr('counter', n). Both are no-ops when no collector is active.
+The counters are attributed to the innermost running stage; the wall time of a stage includes the time of
+the stages nested in it. Worker threads do not inherit the active collector, submit functions wrapped with
+in_context() to them.
+
+Stages: load, split, attributes, publications, smiles, aggregation, fingerprinting, similarity, scoring
+Counters: http_requests, http_bytes, http_retries, http_throttled, http_coalesced, cache_hits, cache_misses,
+store_hits, items
+"""
+
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+COUNTERS = ['http_requests', 'http_bytes', 'http_retries', 'http_throttled', 'http_coalesced', 'cache_hits',
+            'cache_misses', 'store_hits', 'items']
+
+_active = contextvars.ContextVar('novelty_metrics', default=None)
+_stage = contextvars.ContextVar('novelty_stage', default=None)
+
+
+class Metrics:
+
+    def __init__(self):
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, name):
+        entry = self.stages.get(name)
+        if entry is None:
+            entry = dict(wall_time=0.0, calls=0, **{counter: 0 for counter in COUNTERS})
+            self.stages[name] = entry
+        return entry
+
+    def add(self, name, counter, value):
+        with self._lock:
+            self._entry(name)[counter] += value
+
+    def as_dict(self):
+        """
+        Returns:
+            Dict: stage -> {wall_time (s), calls, http_requests, http_bytes, http_retries, http_throttled,
+                            http_coalesced, cache_hits, cache_misses, store_hits, items}
+        """
+        with self._lock:
+            return {name: dict(entry) for name, entry in self.stages.items()}
+
+    def to_prometheus(self, prefix='novelty', labels=None):
+        """
+        Returns:
+            str: the metrics in the Prometheus text exposition format, one sample per stage and counter, all of
+                them counters since they only grow
+        """
+        extra = ''.join(f',{key}="{value}"' for key, value in (labels or {}).items())
+        stages = self.as_dict()
+        lines = []
+        for counter, kind, help_text in [('wall_time', 'seconds_total', 'Wall time spent in the stage'),
+                                          ('calls', 'calls_total', 'Number of times the stage ran'),
+                                          ('http_requests', 'http_requests_total', 'HTTP requests sent'),
+                                          ('http_bytes', 'http_bytes_total', 'HTTP response bytes received'),
+                                          ('http_retries', 'http_retries_total', 'HTTP requests sent again'),
+                                          ('http_throttled', 'http_throttled_total', 'HTTP requests throttled by the host'),
+                                          ('http_coalesced', 'http_coalesced_total', 'HTTP requests sharing the answer of an identical one'),
+                                          ('cache_hits', 'cache_hits_total', 'Lookups answered by a cache'),
+                                          ('cache_misses', 'cache_misses_total', 'Lookups missing from a cache'),
+                                          ('store_hits', 'store_hits_total', 'Lookups answered by the factor store'),
+                                          ('items', 'items_total', 'Items processed by the stage')]:
+            name = f'{prefix}_stage_{kind}'
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            for stage_name, entry in stages.items():
+                lines.append(f'{name}{{stage="{stage_name}"{extra}}} {entry[counter]}')
+        return '\n'.join(lines) + '\n'
+
+
+def current_metrics():
+    return _active.get()
+
+
+@contextmanager
+def use_metrics(metrics):
+    """ Activates metrics (a Metrics, or None to disable the collection) for the enclosed code. """
+    token = _active.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _active.reset(token)
+
+
+@contextmanager
+def stage(name):
+    metrics = _active.get()
+    if metrics is None:
+        yield
+        return
+    token = _stage.set(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _stage.reset(token)
+        metrics.add(name, 'wall_time', time.perf_counter() - start)
+        metrics.add(name, 'calls', 1)
+
+
+def incr(counter, value=1):
+    metrics = _active.get()
+    if metrics is not None and value:
+        metrics.add(_stage.get() or 'other', counter, value)
+
+
+def in_context(fn):
+    """ Wraps fn so that it runs with the collector and stage of the caller, e.g. in a worker thread. """
+    context = contextvars.copy_context()
+
+    def wrapper(*args, **kwargs):
+        return context.copy().run(fn, *args, **kwargs)
+    return wrapper
@@ -1,65 +1,180 @@
 #!/usr/bin/env python
 
-from rdkit import Chem
-from rdkit import DataStructs
-from rdkit.Chem import AllChem
-import requests
-from contextlib import closing
-import json
-import pandas as pd
-from collections import Counter
-import time
+import heapq
+import logging
+from functools import lru_cache
+from metrics import stage, incr
+from factor_store import get_store
 
+logger = logging.getLogger(__name__)
 
+# Fingerprints kept per process, a long running process (see service) sees the same drugs in most responses
+FINGERPRINT_CACHE_SIZE = 100000
 
-def find_nearest_neighbors(unknown_smiles_dict, known_smiles_dict, similarity_cutoff, num_neighbors):
+
+@lru_cache(maxsize=FINGERPRINT_CACHE_SIZE)
+def morgan_fingerprint(smiles, radius=2):
+    """
+    Args:
+        smiles: str
+        radius: int: 2
+
+    Returns: Morgan fingerprint of the molecule, None if the SMILES can not be parsed. The ones of the factor store
+        (see factor_store) are read from it instead of computed
+    """
+    store = get_store()
+    if store is not None and store.radius == radius:
+        fp = store.fingerprint(smiles)
+        if fp is not None:
+            return fp
+    from rdkit import Chem
+    from rdkit.Chem import AllChem
+    mol = Chem.MolFromSmiles(smiles)
+    if mol is None:
+        return None
+    return AllChem.GetMorganFingerprint(mol, radius)
+
+
+class FingerprintIndex:
+    """
+    Morgan fingerprints (radius 2) of a set of molecules, each SMILES is parsed and fingerprinted once.
+    The molecules whose SMILES can not be parsed are left out and listed in invalid.
+
+    The fingerprints are the count-based Morgan ones of RDKit, unlike the folded bit vectors of
+    fp_library.FingerprintLibrary: the same pair of molecules gets a different Tanimoto similarity from each.
+
+    Args:
+        smiles_dict: Dict: molecule ID -> SMILES
+        radius: int: 2
+        workers: int: processes the fingerprinting is spread over, see fingerprint_many
+    """
+
+    def __init__(self, smiles_dict, radius=2, workers=None):
+        self.radius = radius
+        self.keys = []
+        self.fps = []
+        self.invalid = {}
+        self.add(smiles_dict, workers)
+
+    def add(self, smiles_dict, workers=None):
+        """ Appends molecules to the index, after the ones already in it. """
+        keys, fps, _, invalid = self.fingerprint_many(smiles_dict, workers)
+        self.keys.extend(keys)
+        self.fps.extend(fps)
+        self.invalid.update(invalid)
+
+    def fingerprint_many(self, smiles_dict, workers=None):
+        """
+        Fingerprints of many molecules. From featurize.MIN_PARALLEL molecules on, the ones the factor store does
+        not have are computed over the worker processes (see featurize.featurize_counts), the others in the
+        calling process, memoized by morgan_fingerprint.
+
+        Args:
+            smiles_dict: Dict: molecule ID -> SMILES
+            workers: int: processes, default featurize.WORKERS
+
+        Returns:
+            (List of the IDs of the valid molecules, List of their fingerprints in the order of the IDs,
+             None: there is no bit count for count-based fingerprints,
+             Dict: ID -> error for the molecules whose SMILES could not be parsed)
+        """
+        import featurize
+        workers = featurize.WORKERS if workers is None else workers
+        fps = {}
+        invalid = {}
+        if workers > 1 and len(smiles_dict) >= featurize.MIN_PARALLEL:
+            store = get_store()
+            if store is not None and store.radius == self.radius:
+                for key, value in smiles_dict.items():
+                    fp = store.fingerprint(value)
+                    if fp is not None:
+                        fps[key] = fp
+            missing = {key: value for key, value in smiles_dict.items() if key not in fps}
+            keys, computed, invalid = featurize.featurize_counts(missing, self.radius, workers)
+            fps.update(zip(keys, computed))
+        else:
+            for key, value in smiles_dict.items():
+                fp = morgan_fingerprint(value, self.radius)
+                if fp is None:
+                    invalid[key] = f'invalid SMILES {value!r}'
+                    continue
+                fps[key] = fp
+        keys = [key for key in smiles_dict if key in fps]
+        return keys, [fps[key] for key in keys], None, invalid
+
+    def __len__(self):
+        return len(self.keys)
+
+    def fingerprint(self, mol):
+        from rdkit.Chem import AllChem
+        return AllChem.GetMorganFingerprint(mol, self.radius)
+
+    def search(self, query_fp, similarity_cutoff, num_neighbors):
+        """
+        Args:
+            query_fp: Morgan fingerprint of the query molecule
+            similarity_cutoff: float
+            num_neighbors: int
+
+        Returns:
+            List of (molecule ID, similarity) of the num_neighbors most similar molecules,
+            in descending order of similarity, without the ones below similarity_cutoff
+        """
+        if not self.fps or num_neighbors <= 0:
+            return []
+        from rdkit import DataStructs
+        similarities = DataStructs.BulkTanimotoSimilarity(query_fp, self.fps)
+        # Partial selection of the top-k, ties keep the order of the index like a stable sort
+        top = heapq.nlargest(num_neighbors, range(len(similarities)), key=similarities.__getitem__)
+        return [(self.keys[i], similarities[i]) for i in top if similarities[i] >= similarity_cutoff]
+
+
+def find_nearest_neighbors(unknown_smiles_dict, known_smiles_dict, similarity_cutoff, num_neighbors, workers=None):
     """
     
     Returns:
-        Dict
+        Dict, without the unknown molecules whose SMILES can not be parsed (each is logged as a warning, the
+        known ones as well)
 
     Args:
         unknown_smiles_dict: Dict
-        known_smiles_dict: Dict
+        known_smiles_dict: Dict, or a prebuilt index of the known molecules: a FingerprintIndex
+            or a fp_library.FingerprintLibrary / fp_library.PrunedLibrary of reference drugs
         similarity_cutoff: float: 0
         num_neighbors: int: 1
+        workers: int: processes the fingerprinting and, for the indexes supporting it (FingerprintLibrary /
+            PrunedLibrary), the queries are spread over, default featurize.WORKERS
 
     """
+    # The featurization, and RDKit with it, is only imported once a similarity is computed
+    import featurize
+    workers = featurize.WORKERS if workers is None else workers
     unknown_smiles = {key:value for key,value in unknown_smiles_dict.items() if value != "No SMILES could be found"}
-    known_smiles = {key:value for key,value in known_smiles_dict.items() if value != "No SMILES could be found"}
-
-    # Convert input SMILES to a molecule
-    known_mols = {}
-    for key,value in known_smiles.items():
-        known_mol = Chem.MolFromSmiles(value)
-        if known_mol is None:
-            raise ValueError("Invalid SMILES string for",key)
+    with stage('fingerprinting'):
+        invalid = {}
+        if hasattr(known_smiles_dict, 'search'):
+            known_index = known_smiles_dict
+        else:
+            known_smiles = {key:value for key,value in known_smiles_dict.items() if value != "No SMILES could be found"}
+            # Parse and fingerprint every known molecule once
+            known_index = FingerprintIndex(known_smiles, workers=workers)
+            invalid.update(known_index.invalid)
+            incr('items', len(known_index))
+
+        # Fingerprints of the kind the index compares, over the worker processes for large batches
+        query_keys, fps, _, query_invalid = known_index.fingerprint_many(unknown_smiles, workers)
+        query_fps = dict(zip(query_keys, fps))
+        invalid.update(query_invalid)
+        incr('items', len(query_fps))
+        for key, error in invalid.items():
+            logger.warning("Invalid SMILES string for %s: %s", key, error)
+
+    # Bulk similarity against all known molecules and top-k selection
+    with stage('similarity'):
+        incr('items', len(query_fps))
+        if hasattr(known_index, 'search_many'):
+            neighbors = known_index.search_many(query_fps.values(), similarity_cutoff, num_neighbors, workers=workers)
         else:
-            known_mols.update({key:known_mol})
-    nearest_neighbor_mapping = {}
-    for unknownkey,value in unknown_smiles.items():
-        query_mol = Chem.MolFromSmiles(value)
-        if query_mol is None:
-            raise ValueError("Invalid SMILES string")
-
-        # Calculate fingerprints for the query molecule
-        query_fp = AllChem.GetMorganFingerprint(query_mol, 2)
-
-        # Calculate similarity scores between the query molecule and all molecules in the dataset
-        similarities = []
-        for key, mol in known_mols.items():
-            fp = AllChem.GetMorganFingerprint(mol, 2)
-            similarity = DataStructs.TanimotoSimilarity(query_fp, fp)
-            similarities.append((key, similarity))
-
-        # Sort the similarities in descending order
-        similarities.sort(key=lambda x: x[1], reverse=True)
-
-        # Retrieve the nearest neighbors
-        neighbors = []
-        for i in range(min(num_neighbors, len(similarities))):
-            index, similarity = similarities[i]
-            if similarity >= similarity_cutoff:
-                neighbors.append((index, similarity))
-        nearest_neighbor_mapping.update({unknownkey:neighbors})
+            neighbors = [known_index.search(query_fp, similarity_cutoff, num_neighbors) for query_fp in query_fps.values()]
+    nearest_neighbor_mapping = dict(zip(query_fps.keys(), neighbors))
     return nearest_neighbor_mapping
@@ -1,13 +1,25 @@
-import pandas as pd
 from datetime import date
-import json
+import logging
 import requests
-from bs4 import BeautifulSoup
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 from known import find_known_results
 from extr_smile_molpro_by_id import  mol_to_smile_molpro
 from mol_similarity import find_nearest_neighbors
+from cache import get_cache
+from message_index import MessageIndex, ATTRIBUTE_TYPE_IDS_FDA, ATTRIBUTE_TYPE_IDS_PUB, publication_key
+from response_loader import load_response
+from edge_table import EdgeTableBuilder
+import eutils
+from eutils import get_publication_years_efetch, split_publication_ids
+from http_client import request
+from factor_store import get_store
+from budget import Budget, use_budget, current_budget, degrade
+from metrics import Metrics, current_metrics, use_metrics, stage, incr, in_context
 import time
+import argparse
+import glob
+import os
 
 """
 This script computes the novelty score for a list of results obtained for a 1-H response.
@@ -18,34 +30,60 @@ The steps for the ideal workflow are as follows:
 4. Compute molecular similarity to identify if similar to existing drugs.
  
 The end result of this script displays a table with values from different columns and accordingly lists the novelty score as well.
+
+Library use: score_response(response_dict) scores an already parsed response, compute_novelty(path) a response file,
+score_responses(responses) the responses of all the ARAs to a query, looking their drugs and publications up once.
+Batch use: python novelty_score_calculation.py responses/ 'archive/*.json' --workers 8 --output-dir scores/
+
+Importing the module only loads NumPy and the HTTP client: pandas is imported when a DataFrame is returned, RDKit
+when a similarity is computed (mol_similarity) and BeautifulSoup by the per-ID EUtils fallback.
 """
 
-def molecular_sim(known, unknown, response):
-    unknown_ids = []
-    known_ids = []
-    if len(unknown) > 0:
-        for drug in unknown:
-            s = list(response['fields']['data']['message']['results'][drug]['node_bindings'].keys())
-            edge_attribute_sn = response['fields']['data']['message']['results'][drug]['node_bindings'][s[0]][0]['id']
-            if 'PUBCHEM' in edge_attribute_sn or 'CHEMBL' in edge_attribute_sn or 'UNII' in edge_attribute_sn or 'RXNORM' in edge_attribute_sn or 'UMLS' in edge_attribute_sn or not 'MONDO' in edge_attribute_sn:
-                unknown_ids.append(edge_attribute_sn)
-            else:
-                unknown_ids.append(
-                    response['fields']['data']['message']['results'][drug]['node_bindings'][s[1]][0]['id'])
-
-    if len(known) > 0:
-        for drug in known:
-            s = list(response['fields']['data']['message']['results'][drug]['node_bindings'].keys())
-            edge_attribute_sn = response['fields']['data']['message']['results'][drug]['node_bindings'][s[0]][0]['id']
-            if 'PUBCHEM' in edge_attribute_sn or 'CHEMBL' in edge_attribute_sn or 'UMLS' in edge_attribute_sn or 'UNII' in edge_attribute_sn or 'RXNORM' in edge_attribute_sn or not 'MONDO' in edge_attribute_sn:
-                known_ids.append(edge_attribute_sn)
-            else:
-                known_ids.append(response['fields']['data']['message']['results'][drug]['node_bindings'][s[1]][0]['id'])
-
-    smile_unkown = mol_to_smile_molpro(unknown_ids)
-    smile_known = mol_to_smile_molpro(known_ids)
-
-    similarity_map = find_nearest_neighbors(smile_unkown, smile_known, 0, 1)
+# The external services can be pointed at local stand-ins with NOVELTY_PUBLICATIONS_URL, NOVELTY_MOLEPRO_URL
+# and NOVELTY_EFETCH_URL
+PUBLICATIONS_URL = os.environ.get('NOVELTY_PUBLICATIONS_URL', "https://3md2qwxrrk.us-east-1.awsapprunner.com/publications")
+
+logger = logging.getLogger(__name__)
+
+def similarity_drugs(known, unknown, index, library=None):
+    """
+    Returns: (List of the drugs of the unknown results, List of the drugs of the known results they are compared
+        with, empty when they are compared with a library)
+    """
+    unknown_ids = [index.result_drug(drug) for drug in unknown]
+    known_ids = [index.result_drug(drug) for drug in known] if library is None else []
+    return unknown_ids, known_ids
+
+def molecular_sim(known, unknown, response, library=None, index=None, smiles=None):
+    """
+    Args:
+        known: List of the indices of the known results
+        unknown: List of the indices of the unknown results
+        response: Dict
+        library: optional fp_library.FingerprintLibrary of reference drugs, used in place of the known results
+        index: optional MessageIndex of the response
+        smiles: Dict: drug -> SMILES already looked up (see mol_to_smile_molpro), by default they are looked up
+
+    Returns:
+        Dict: unknown drug -> [(nearest known drug, similarity)]
+    """
+    if index is None:
+        index = MessageIndex(response)
+    unknown_ids, known_ids = similarity_drugs(known, unknown, index, library)
+
+    if smiles is None:
+        # A single (cached, chunked) MolePro lookup for the known and the unknown drugs together
+        with stage('smiles'):
+            incr('items', len(set(unknown_ids + known_ids)))
+            smiles = mol_to_smile_molpro(unknown_ids + known_ids)
+    budget = current_budget()
+    if budget is not None and any(budget.is_unresolved('similarity', key) for key in known_ids):
+        # The nearest known drug may be one of those whose SMILES are missing
+        degrade('similarity', unknown_ids)
+    smile_unkown = {key: smiles[key] for key in dict.fromkeys(unknown_ids) if key in smiles}
+    smile_known = {key: smiles[key] for key in dict.fromkeys(known_ids) if key in smiles}
+
+    similarity_map = find_nearest_neighbors(smile_unkown, smile_known if library is None else library, 0, 1)
     return similarity_map
 
 
@@ -53,34 +91,123 @@ def get_publication_info(pub_id):
     """
     Args: PMID
     Returns: The publication info
+
+    Note: this always goes to the network, use get_publication_years for cached lookups.
     """
-    base_url = "https://3md2qwxrrk.us-east-1.awsapprunner.com/publications?pubids="
+    base_url = f"{PUBLICATIONS_URL}?pubids="
     request_id = '1df88223-c0f8-47f5-a1f3-661b944c7849'
     full_url = f"{base_url}{pub_id}&request_id={request_id}"
-    response = requests.get(full_url)
+    response = request('GET', full_url)
     response = response.json()
     return response
 
 
-def sigmoid(x):
-    return 1 / (1 + np.exp(x))
+def get_publication_years(pub_ids, chunk_size=100, max_workers=8, eutils_fallback=True):
+    """
+    Fetches the publishing year of many publications at once. The IDs are deduplicated and looked up
+    in the factor store (see factor_store) and the persistent publication cache first. The remaining IDs
+    are split into chunks of chunk_size IDs and the chunks are sent to the Text Mining Provider concurrently,
+    with at most max_workers requests in flight. The publications it does not know are then looked up in
+    batches with EFetch (see eutils).
+    The answers, including the publications that were not found, are stored in the cache.
 
-def query_id(response):
-    if response['fields']['status'] == 'Done':
-        for i in response['fields']['data']['message']['query_graph']['nodes']:
-            if 'ids' in response['fields']['data']['message']['query_graph']['nodes'][i].keys():
-                if response['fields']['data']['message']['query_graph']['nodes'][i]['ids']:
-                    known_node = response['fields']['data']['message']['query_graph']['nodes'][i]['categories'][0]
-                else:
-                    unknown_node = response['fields']['data']['message']['query_graph']['nodes'][i]['categories'][0]
-            else:
-                unknown_node = response['fields']['data']['message']['query_graph']['nodes'][i]['categories'][0]
-        if unknown_node in ['biolink:ChemicalEntity', 'biolink:SmallMolecule', 'biolink:Drug']:
-            chk=1
-        else:
-            chk=0
-    return known_node, unknown_node, chk
+    Args:
+        pub_ids: Iterable of PMID/PMC IDs
+        chunk_size: int: 100
+        max_workers: int: 8
+        eutils_fallback: bool: look the publications unknown to the Text Mining Provider up in EUtils
+
+    Returns:
+        Dict: publication ID -> year (int), publications that could not be found are left out
+    """
+    unique_ids = list(dict.fromkeys(pub_ids))
+    publ_years = {}
+    store = get_store()
+    if store is not None:
+        stored = store.publication_years(unique_ids)
+        publ_years.update({key: value for key, value in stored.items() if value is not None})
+        unique_ids = [x for x in unique_ids if x not in stored]
+    cache = get_cache('publication_year')
+    cached = cache.get_many(unique_ids)
+    publ_years.update({key: value for key, value in cached.items() if value is not None})
+    missing = [x for x in unique_ids if x not in cached]
+    chunks = [missing[i:i + chunk_size] for i in range(0, len(missing), chunk_size)]
+    if not chunks:
+        return publ_years
 
+    # IDs whose lookup succeeded, found or not: only those are cached
+    answered = []
+    found = {}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as executor:
+        for chunk, chunk_years in zip(chunks, executor.map(in_context(get_publication_years_chunk), chunks)):
+            if chunk_years is None:
+                # The request failed, nothing is known about these publications
+                degrade('recency', chunk)
+                continue
+            found.update(chunk_years)
+            answered.extend(chunk)
+
+    not_found = [x for x in answered if x not in found]
+    if eutils_fallback and not_found:
+        efetch_years, efetch_answered = get_publication_years_efetch(not_found)
+        found.update(efetch_years)
+        # The publications sent to EFetch are only known to be missing once EFetch answered for them too, the
+        # ones of a failed EFetch request are not cached and are looked up again next time
+        pubmed, pmc = split_publication_ids(not_found)
+        sent = {x for ids in [*pubmed.values(), *pmc.values()] for x in ids}
+        answered = [x for x in answered if x not in sent or x in efetch_answered]
+
+    publ_years.update(found)
+    cache.set_many({x: found.get(x) for x in answered})
+    return publ_years
+
+
+def get_publication_years_chunk(pub_ids):
+    """
+    Args: List of PMID/PMC IDs sent in a single request
+
+    Returns: Dict: publication ID -> year (int) of the publications that were found, None if the request failed.
+        The years are given for the IDs as they were sent, whatever the spelling of the IDs in the answer (see
+        message_index.publication_key)
+    """
+    try:
+        response_pub = get_publication_info(','.join(pub_ids))
+    except (ConnectionError, requests.exceptions.RequestException, ValueError):
+        return None
+    publ_years = {}
+    if response_pub['_meta']['n_results'] == 0:
+        return publ_years
+    sent = {}
+    for pub_id in pub_ids:
+        sent.setdefault(publication_key(pub_id), []).append(pub_id)
+    for key, value in response_pub['results'].items():
+        if 'not_found' not in key:
+            for pub_id in sent.get(publication_key(key), [key]):
+                publ_years[pub_id] = int(value['pub_year'])
+    return publ_years
+
+
+def age_of_oldest_publication(publications, publ_years, today):
+    """
+    Args:
+        publications: List of PMID/PMC IDs of an edge
+        publ_years: Dict: publication ID -> year, as returned by get_publication_years, the IDs are matched
+            whatever their spelling (see message_index.publication_key)
+        today: date
+
+    Returns: The age (years) of the oldest publication found, NaN when none of them was found
+    """
+    if not publications:
+        return np.nan
+    by_key = {publication_key(key): value for key, value in publ_years.items() if value}
+    years = [by_key[publication_key(x)] for x in publications if publication_key(x) in by_key]
+    if not years:
+        return np.nan
+    return today.year - min(years)
+
+
+def sigmoid(x):
+    return 1 / (1 + np.exp(x))
 
 def recency_function_exp(number_of_publ, age_of_oldest_publ, max_number, max_age):
     """
@@ -111,6 +238,34 @@ def recency_function_exp(number_of_publ, age_of_oldest_publ, max_number, max_age
     return recency
 
 
+def recency_function_exp_vec(number_of_publ, age_of_oldest_publ, max_number, max_age):
+    """
+    Array version of recency_function_exp, evaluated on whole columns at once.
+
+    Args:
+        number_of_publ (array): The number of publications of each row.
+        age_of_oldest_publ (array): The age of the oldest publication of each row.
+        max_number (float): The maximum number of publication.
+        max_age (float): The maximum age of publication.
+
+    Returns:
+        np.ndarray: The recency of each row, the same as recency_function_exp row by row.
+    """
+    number_of_publ = np.asarray(number_of_publ, dtype=float)
+    age_of_oldest_publ = np.asarray(age_of_oldest_publ, dtype=float)
+    coef_number = 10
+    coef_age = 4
+    alter_number_of_publ = sigmoid(coef_number * (number_of_publ / max_number - 0.5))
+    alter_age_of_oldest_publ = sigmoid(coef_age * (age_of_oldest_publ / max_age - 0.5))
+
+    nan_number = np.isnan(number_of_publ)
+    nan_age = np.isnan(age_of_oldest_publ)
+    recency = alter_number_of_publ * alter_age_of_oldest_publ
+    recency = np.where(nan_number & ~nan_age, alter_age_of_oldest_publ, recency)
+    recency = np.where(nan_age & ~nan_number, alter_number_of_publ, recency)
+    return recency
+
+
 def extract_year_pmid(response):
     """
     Extracting the publication year from the XML response, assuming a specific structure.
@@ -124,6 +279,7 @@ def extract_year_pmid(response):
         Date (Year) of the publishing date
     
     """
+    from bs4 import BeautifulSoup
     soup = BeautifulSoup(response.content, 'xml')
 
     try:
@@ -168,6 +324,7 @@ def extract_year_pmc(response):
         Date (Year) of the publishing date
     
     """
+    from bs4 import BeautifulSoup
     soup = BeautifulSoup(response.content, 'xml')
 
     try:
@@ -187,10 +344,18 @@ def get_publication_year_pmid(pmid):
     
     Returns: The "Year" of publishing date
     """
-    base_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi?db=pubmed&id="
+    cache = get_cache('publication_year')
+    key = f'efetch:pubmed:{pmid}'
+    cached = cache.get_many([key])
+    if key in cached:
+        return cached[key]
+    base_url = f"{eutils.EFETCH_URL}?db=pubmed&id="
     full_url = f"{base_url}{pmid}"
-    response = requests.get(full_url)
-    return extract_year_pmid(response)
+    response = request('GET', full_url)
+    year = extract_year_pmid(response)
+    if response.status_code == 200:
+        cache.set(key, year)
+    return year
 
 def get_publication_year_pmc(pmc_id):
     """
@@ -198,114 +363,95 @@ def get_publication_year_pmc(pmc_id):
     
     Returns: The "Year" of publishing date
     """
-    base_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi?db=pmc&id="
+    cache = get_cache('publication_year')
+    key = f'efetch:pmc:{pmc_id}'
+    cached = cache.get_many([key])
+    if key in cached:
+        return cached[key]
+    base_url = f"{eutils.EFETCH_URL}?db=pmc&id="
     full_url = f"{base_url}{pmc_id}"
-    response = requests.get(full_url)
-    return extract_year_pmc(response)
+    response = request('GET', full_url)
+    year = extract_year_pmc(response)
+    if response.status_code == 200:
+        cache.set(key, year)
+    return year
 
 
-def extracting_drug_fda_publ_date(response, unknown):
+def extracting_drug_fda_publ_date(response, unknown, chunk_size=100, max_workers=8, index=None,
+                                  lookup_publications=True):
     """
     Upon querying, the response is returned as a list containing 10 dictionaries,
     with each dictionary representing the response from an ARA. The function 'extracting_drug_fda_publ_date'
     is designed to extract the drug entity name of each edge. It then checks the EPC attributes of each edge
     to determine the FDA approval status of the drug and the accociated pulications PMID/PMC ID ... .
     And finally extract the publishing date of the publications to get the oldest (Year) date among them.
+    The publications of all edges are looked up together in a single pre-pass (see get_publication_years),
+    so that every distinct PMID/PMC ID is fetched once.
 
     Args:
         Dictionary: response for a ARA to a query
+        unknown: List of the indices of the unknown results
+        chunk_size: int: number of publications sent per request
+        max_workers: int: maximum number of concurrent publication requests
+        index: optional MessageIndex of the response
+        lookup_publications: bool: look the publications up and add the age_oldest_pub column, otherwise left to
+            add_publication_ages, e.g. once for the publications of many responses
 
     Returns:
-        "An DataFrame constructed where each row represents an edge and contains information such as the drug entity
-        name, FDA status of the drug, a list of associated publications, the number of associated publications,
-        and the oldest publication date (year) linked to each drug."
+        "An edge_table.EdgeTable where each row represents an edge (edge_id is its knowledge graph ID) and
+        contains information such as the drug entity name, FDA status of the drug (NaN when unknown), the
+        associated publications, the number of associated publications, and the oldest publication date (year)
+        linked to each drug." (a DataFrame of the edges and their results when the query is not about drugs),
+        and query_chk
 
     """
-    attribute_type_id_list_fda = ['biolink:FDA_approval_status', 'biolink:FDA_APPROVAL_STATUS']
-    attribute_type_id_list_pub = ['biolink:publications', 'biolink:Publication', 'biolink:publication']
+    attribute_type_id_list_fda = ATTRIBUTE_TYPE_IDS_FDA
+    attribute_type_id_list_pub = ATTRIBUTE_TYPE_IDS_PUB
     drug_idx_fda_status = []
-    keys_list = ['results', 'knowledge_graph', 'query_graph']
-    today = date.today()
+    edges = EdgeTableBuilder()
+
+    if index is None:
+        index = MessageIndex(response)
 
-    if response['fields']['status'] == 'Done':
-        if set(keys_list).issubset(response['fields']['data']['message'].keys()):
+    if index.status == 'Done':
+        if index.complete:
             res_chk = 1
-            # for edge in response['fields']['data']['message']['knowledge_graph']['edges'].keys():
-            query_known, query_unknown, query_chk = query_id(response)
+            query_known, query_unknown, query_chk = index.query
             idi=-1
             for tmp in unknown:
-                tmp_res = response['fields']['data']['message']['results'][tmp]['analyses'][0]['edge_bindings']
-                for tmp_1 in tmp_res:
+                for edge in index.result_scored_edges[tmp]:
                     idi+=1
-                    edge = response['fields']['data']['message']['results'][tmp]['analyses'][0]['edge_bindings'][tmp_1][0]['id']
-            # edge_list = list(response['fields']['data']['message']['knowledge_graph']['edges'].keys())
-            # for idx, idi in enumerate(edge_list):
-            #     if idx % 20 == 0:
-            #         print(f'progressing {idx}')
-                # edge = edge_list[idx]
-                    edge_attribute = response['fields']['data']['message']['knowledge_graph']['edges'][edge]
+                    edge_attribute = index.edges[edge]
                     # if set(['subject', 'object']).issubset(edge_attribute.keys()):
                     if query_chk==1:
-                        if 'PUBCHEM' in edge_attribute['subject'] or 'CHEMBL' in edge_attribute['subject'] or 'UNII' in edge_attribute['subject'] or 'RXNORM' in edge_attribute['subject'] or 'UMLS' in edge_attribute['subject'] or not 'MONDO' in edge_attribute['subject']:
-                            drug_idx = edge_attribute['subject']
-                        else:
-                            drug_idx = edge_attribute['object']
-                        if set(['attributes']).issubset(edge_attribute.keys()):
-                            if len(edge_attribute['attributes']) > 0:
-                                att_type_id = {}
-                                fda = []
-                                pub = []
-                                for i in range(len(edge_attribute['attributes'])):
-                                    att_type_id[i] = edge_attribute['attributes'][i]['attribute_type_id']
-
-                                for key in att_type_id.keys():
-                                    if att_type_id[key] in attribute_type_id_list_fda:
-                                        fda.append(key)
-                                    elif att_type_id[key] in attribute_type_id_list_pub:
-                                        pub.append(key)
-
-                                if len(fda) > 0:
-                                    if edge_attribute['attributes'][fda[0]]['value'] == 'FDA Approval':
-                                        fda_status = 0.0
-                                    else:
-                                        fda_status = 1.0
-                                else:
-                                    fda_status = None
-
-                                # Publication
-                                if len(pub) > 0:
-                                    publications = edge_attribute['attributes'][pub[0]]['value']
-                                    if '|' in publications:
-                                        publications = publications.split('|')
-                                    if type(publications) == 'str':
-                                        publications = [publications]
-
-                                    # Removal of all publication entries that are links
-                                    publications = [x for x in publications if "http" not in x]
-                                    # Removal of all publication entries that are Clinical Trials
-                                    publications = [x for x in publications if "clinicaltrials" not in x]
-                                    number_of_publ = len(publications)
-
-                                    if len(publications)>0:
-                                        # print(publications)
-                                        publications_1 = ','.join(publications)
-                                        try:
-                                            response_pub = get_publication_info(publications_1)
-                                            if response_pub['_meta']['n_results']==0:
-                                                age_oldest = np.nan
-                                            else:
-                                                publ_year = []
-                                                for key in response_pub['results'].keys():
-                                                    if 'not_found' not in key:
-                                                        publ_year.extend([int(response_pub['results'][key]['pub_year'])])
-                                                age_oldest = today.year - min(publ_year)
-                                        except ConnectionError as e:
-                                            age_oldest = np.nan
-                                else:
-                                    publications = None
-                                    number_of_publ = 0.0
-                                    age_oldest = np.nan
-                            drug_idx_fda_status.append((idi, drug_idx, fda_status, publications, number_of_publ, age_oldest))
+                        if 'attributes' not in edge_attribute:
+                            continue
+                        fda_status = np.nan
+                        publications = ()
+                        fda = pub = None
+                        # The first FDA status and the first publications attributes of the edge
+                        for attribute in edge_attribute['attributes']:
+                            attribute_type_id = attribute['attribute_type_id']
+                            if attribute_type_id in attribute_type_id_list_fda:
+                                if fda is None:
+                                    fda = attribute
+                            elif attribute_type_id in attribute_type_id_list_pub:
+                                if pub is None:
+                                    pub = attribute
+                        if fda is not None:
+                            fda_status = 0.0 if fda['value'] == 'FDA Approval' else 1.0
+
+                        # Publication
+                        if pub is not None:
+                            publications = pub['value']
+                            if '|' in publications:
+                                publications = publications.split('|')
+                            if isinstance(publications, str):
+                                publications = [publications]
+
+                            # Removal of all publication entries that are links or Clinical Trials
+                            publications = [x for x in publications if "http" not in x and "clinicaltrials" not in x]
+                        edges.add(idi, edge, index.edge_drug(edge), fda_status, publications)
                     else:
                         if query_unknown in ['biolink:Gene', 'biolink:Protein']:
                             if 'NCBI' in edge_attribute['subject'] or 'GO' in edge_attribute['subject']:
@@ -326,46 +472,137 @@ def extracting_drug_fda_publ_date(response, unknown):
         res_chk = 0
         query_chk = 0
     if query_chk==1 and res_chk==1:
-        DF = pd.DataFrame(drug_idx_fda_status, columns=['edge', 'drug', 'fda status', 'publications', 'number_of_publ', 'age_oldest_pub'])
+        DF = edges.build()
+        store = get_store()
+        if store is not None:
+            # The FDA status of the drugs whose edges do not have it, from the factor store
+            unknown_status = np.isnan(DF['fda status'])
+            if unknown_status.any():
+                codes = np.unique(DF.drug_codes[unknown_status])
+                stored = store.fda_status(DF.drugs[codes])
+                by_code = np.array([stored.get(drug, np.nan) for drug in DF.drugs], dtype=np.float64)
+                DF['fda status'] = np.where(unknown_status, by_code[DF.drug_codes], DF['fda status'])
+        if lookup_publications:
+            add_publication_ages(DF, chunk_size=chunk_size, max_workers=max_workers)
     elif query_chk!=1 and res_chk==1:
+        import pandas as pd
         DF = pd.DataFrame(drug_idx_fda_status, columns=['edge', 'result'])
     else:
+        import pandas as pd
         DF = pd.DataFrame()
     return DF, query_chk
 
-def extract_results(response, unknown, known):
+def distinct_publications(dfs):
+    """
+    Args: Iterable of EdgeTables returned by extracting_drug_fda_publ_date
+
+    Returns: List of the distinct publications of all their edges
+    """
+    return list(dict.fromkeys(x for df in dfs for x in df.distinct_publications()))
+
+def add_publication_ages(df, publ_years=None, chunk_size=100, max_workers=8):
+    """
+    Adds the age_oldest_pub column to the EdgeTable returned by extracting_drug_fda_publ_date. Every distinct
+    publication of every edge is fetched once (see get_publication_years).
+
+    Args:
+        df: EdgeTable, modified in place
+        publ_years: Dict: publication ID -> year already looked up, the publications missing from it are not found
+        chunk_size, max_workers: see get_publication_years, when publ_years is not given
+
+    Returns: df
+    """
+    today = date.today()
+    if publ_years is None:
+        # Publication pre-pass: every distinct publication of every edge is fetched once
+        with stage('publications'):
+            all_publications = distinct_publications([df])
+            incr('items', len(all_publications))
+            publ_years = get_publication_years(all_publications, chunk_size=chunk_size, max_workers=max_workers)
+    df['age_oldest_pub'] = df.oldest_publication_ages(publ_years, today.year)
+    return df
+
+def aggregate_by_drug(df):
+    """
+    Merges the rows of the edges of each drug, so that its recency, similarity and novelty score are
+    computed once per drug instead of once per edge.
+
+    Args:
+        df: EdgeTable returned by extracting_drug_fda_publ_date, a row per edge
+
+    Returns:
+        EdgeTable with a row per distinct drug, in the order of their first edge: drug, fda status (approved as
+        soon as one of its edges reports the approval), publications (distinct publications of all its edges),
+        number_of_publ, age_oldest_pub (the oldest over all its edges) and number_of_edges
+    """
+    return df.aggregate_by_drug()
+
+def fan_out(edges, drugs, columns):
+    """
+    Gives every edge the values of its drug.
+
+    Args:
+        edges: EdgeTable, a row per edge
+        drugs: EdgeTable returned by aggregate_by_drug(edges)
+        columns: List of the columns of drugs to copy
+
+    Returns: a copy of edges with these columns
+    """
+    positions = edges.drug_positions(drugs)
+    edges = edges.copy()
+    for name in columns:
+        edges[name] = drugs[name][positions]
+    return edges
+
+def extract_results(response, unknown, known, index=None):
+    if index is None:
+        index = MessageIndex(response)
     results = []
     results_known = []
-    kid, ukid = 0, 0
-    if response['fields']['status'] == 'Done':
-        for idi, i in enumerate(response['fields']['data']['message']['results']):
-            if idi in unknown:
-                results.append([])
-                for idj, j in enumerate(i['analyses']):
-                    for idk, k in enumerate(j['edge_bindings'][list(j['edge_bindings'].keys())[0]]):
-                        results[ukid].append(k['id'])
-                ukid+=1
-
-            elif idi in known:
-                results_known.append([])
-                for idj, j in enumerate(i['analyses']):
-                    for idk, k in enumerate(j['edge_bindings'][list(j['edge_bindings'].keys())[0]]):
-                        results_known[kid].append(k['id'])
-                kid+=1
+    if index.status == 'Done':
+        unknown_set = set(unknown)
+        known_set = set(known)
+        for idi in range(len(index.results)):
+            if idi in unknown_set:
+                results.append(list(index.result_edges[idi]))
+            elif idi in known_set:
+                results_known.append(list(index.result_edges[idi]))
     return results, results_known
 
-def result_edge_correlation(results, results_known, df):
-    df_res = pd.DataFrame()
-    res_known = set()
-    res_unknown = set()
-    for idi, i in enumerate(results):
-        for j in i:
-            df_res = pd.concat([df_res, df[df['edge']==j]])
-            res_unknown.add(df.loc[df['edge']==j, 'drug'].iloc[0])
-
-    for idi, i in enumerate(results_known):
-        for j in i:
-            res_known.add(df.loc[df['edge']==j, 'drug'].iloc[0])
+def result_edge_correlation(results, results_known, df, index=None):
+    """
+    Maps the results to the rows of their edges, through the rows of each knowledge graph edge ID.
+
+    Args:
+        results: List: per unknown result, its edge IDs, as returned by extract_results
+        results_known: List: per known result, its edge IDs
+        df: EdgeTable returned by extracting_drug_fda_publ_date
+        index: optional MessageIndex, to find the drugs of the known edges (which have no row in df)
+
+    Returns:
+        df_res: EdgeTable with a row per (unknown result, edge) and the position of the result in results
+            in the 'result' column
+        res_unknown: set of the drugs of the unknown results
+        res_known: set of the drugs of the known results
+    """
+    edge_rows = {}
+    for position, edge_id in enumerate(df['edge_id']):
+        edge_rows.setdefault(edge_id, []).append(position)
+    positions = []
+    result = []
+    for idi, edge_ids in enumerate(results):
+        for edge_id in edge_ids:
+            rows = edge_rows.get(edge_id, ())
+            positions.extend(rows)
+            result.extend([idi] * len(rows))
+    df_res = df.take(positions, result=np.array(result, dtype=np.int64))
+    res_unknown = set(df_res.drugs[np.unique(df_res.drug_codes)])
+
+    known_edges = dict.fromkeys(j for i in results_known for j in i)
+    if index is not None:
+        res_known = {index.edge_drug(j) for j in known_edges}
+    else:
+        res_known = {df.drugs[df.drug_codes[edge_rows[j][0]]] for j in known_edges if j in edge_rows}
     return df_res, res_unknown, res_known
 
 def novelty_score(fda_status, recency, similarity):
@@ -405,87 +642,401 @@ def novelty_score(fda_status, recency, similarity):
             score=(1-similarity)
     return score
 
-def compute_novelty(response):
-    """ INPUT: JSON Response with merged annotated results for a 1-H query
+def novelty_score_vec(fda_status, recency, similarity):
+    """
+    Array version of novelty_score, evaluated on whole columns at once: the NaN branches of
+    novelty_score are expressed as masks.
+
+    Args:
+        array: fda_status, None is treated as NaN
+        array: recency
+        array: similarity
+
+    Returns:
+        np.ndarray: novelty_score of each row, the same as novelty_score row by row
+    """
+    fda_status = np.asarray(fda_status, dtype=float)
+    recency = np.asarray(recency, dtype=float)
+    similarity = np.asarray(similarity, dtype=float)
+
+    has_recency = ~np.isnan(recency)
+    has_similarity = ~np.isnan(similarity)
+    adjusted = has_recency & has_similarity
+    dissimilarity = 1 - similarity
+
+    score = recency
+    score = np.where(adjusted & (dissimilarity > 0.5), score * (0.73 + dissimilarity), score)
+    score = np.where(adjusted & (score > 1), 1.0, score)
+    score = np.where(adjusted & (fda_status == 0), score * 0.85, score)
+    # Without recency the score is based on the similarity only
+    score = np.where(has_recency, score, np.where(has_similarity, dissimilarity, 0.0))
+    return score
+
+def add_scores(df):
+    """
+    Adds the recency and novelty_score columns, computed on whole columns at once.
+
+    Args:
+        df: EdgeTable (or DataFrame) with the fda status, number_of_publ, age_oldest_pub and similarity of each
+            row, modified in place
+
+    Returns: df
+    """
+    # Step 3:
+    # calculating the recency
+    number_of_publ = np.asarray(df['number_of_publ'], dtype=float)
+    age_oldest_pub = np.asarray(df['age_oldest_pub'], dtype=float)
+    df['recency'] = np.where(np.isnan(number_of_publ) | np.isnan(age_oldest_pub), np.nan,
+                             recency_function_exp_vec(number_of_publ, age_oldest_pub, 100, 50))
+    #
+    # # Step 4:
+    # # Calculating the Similarity:
+    # nearest_neighbours = calculate_nn_distance(res_known, res_unknown, 0, 1)
+
+    # df = df.assign(similarity=np.nan)
+
+    # # Step 5:
+    # # Calculating the novelty score:
+    df['novelty_score'] = novelty_score_vec(np.asarray(df['fda status'], dtype=float), np.asarray(df['recency']),
+                                            np.asarray(df['similarity'], dtype=float))
+    return df
 
-    1. load the json file
+def nearest_similarity(similarity_map):
+    """
+    Args: Dict: unknown drug -> [(nearest known drug, similarity)], as returned by molecular_sim
+
+    Returns: Dict: unknown drug -> similarity to its nearest known drug
+    """
+    return {drug: neighbors[0][1] for drug, neighbors in similarity_map.items() if neighbors}
+
+def degraded_factors(df, budget):
+    """
+    Args:
+        df: EdgeTable with the drug and publications of each row
+        budget: budget.Budget the lookups ran under
+
+    Returns: List: per row, the factors scored with their fallback because their lookups did not complete in
+        the budget, comma separated ('' when none)
+    """
+    similarity = np.array([budget.is_unresolved('similarity', drug) for drug in df.drugs], dtype=bool)
+    similarity = similarity[df.drug_codes] if len(df.drugs) else np.zeros(len(df), dtype=bool)
+    recency = df.rows_with_publications(np.array([budget.is_unresolved('recency', x) for x in df.publications],
+                                                 dtype=bool))
+    labels = {(False, False): '', (True, False): 'similarity', (False, True): 'recency',
+              (True, True): 'similarity,recency'}
+    return [labels[flags] for flags in zip(similarity.tolist(), recency.tolist())]
+
+def compute_novelty(response, library=None, level='edge', lean=True, return_metrics=False, per_drug=False,
+                    budget=None):
+    """ INPUT: path of the JSON Response with merged annotated results for a 1-H query
+        lean: load only the parts of the response used for the scoring, see response_loader.load_response
+        library, level, return_metrics, per_drug, budget: see score_response, the budget includes the loading
+
+    OUTPUT: Pandas DataFrame, see score_response
+    """
+    metrics = Metrics() if return_metrics else current_metrics()
+    if budget is not None and not isinstance(budget, Budget):
+        budget = Budget(budget)
+    with use_metrics(metrics):
+        with stage('load'):
+            mergedAnnotatedOutput = load_response(response, lean=lean)
+        df = score_response(mergedAnnotatedOutput, library=library, level=level, per_drug=per_drug, budget=budget)
+    return (df, metrics.as_dict()) if return_metrics else df
+
+def score_response(mergedAnnotatedOutput, library=None, level='edge', return_metrics=False, per_drug=False,
+                   budget=None):
+    """ INPUT: the already parsed JSON Response (Dict) with merged annotated results for a 1-H query
+        library: optional fp_library.FingerprintLibrary, the similarity is then measured against these
+        reference drugs instead of the known results of the response
+        level: 'edge' scores every edge of the unknown results, 'result' keeps the best scoring edge of
+        each unknown result, 'drug' scores each distinct drug once, from the merged edges of the drug
+        (see aggregate_by_drug)
+        per_drug: with level 'edge' or 'result', score each drug once from its merged edges and give every
+        edge the score of its drug; most responses have many more edges than distinct drugs
+        return_metrics: also return the per-stage timings and counters collected while scoring (see metrics),
+        otherwise they go to the collector already active, if any
+        budget: optional latency budget, in seconds or a budget.Budget: the external lookups are given per-call
+        timeouts and retries within it, and what they could not resolve in time is scored with the NaN
+        fallbacks of novelty_score. The output then has a 'degraded' column naming, per row, the factors
+        scored with a fallback (similarity, recency), and df.attrs['degraded'] lists them for the response
+
+    1. index the response
     2. Give the json to extracting_drug_fda_publ_date(response) function to extract the EPC
     3. Apply the recency function of df, to add a new column as recency to the dataframe
     4. Add a new column to the df as similarity which has random number between 0-1
     5. Now the dataframe df is ready for applying the novelty score on it
 
     OUTPUT: Pandas DataFrame  with FDA Status, Recency, Similarity and Novelty score per result
+            (drug, novelty_score) per edge or per drug, or (result, drug, novelty_score) per result
+            and with return_metrics, the Dict: stage -> timings and counters
     """
-    # Step 1
-    mergedAnnotatedOutput = json.load(open(response))
-    if mergedAnnotatedOutput['fields']['status'] == 'Done':
-        if mergedAnnotatedOutput['fields']['data']['message']['results']:
-            known, unknown = find_known_results(mergedAnnotatedOutput)
-            #
-            # # Step 2
+    metrics = Metrics() if return_metrics else current_metrics()
+    if budget is None:
+        budget = current_budget()
+    elif not isinstance(budget, Budget):
+        budget = Budget(budget)
+    with use_metrics(metrics), use_budget(budget):
+        df = _score_response(mergedAnnotatedOutput, library, level, per_drug)
+    return (df, metrics.as_dict()) if return_metrics else df
+
+def score_responses(responses, library=None, level='edge', return_metrics=False, per_drug=False, budget=None):
+    """ INPUT: the responses of the ARAs to the same query, as a List of Dicts or a Dict: ARA -> response, each
+        as score_response takes it
+        library, level, return_metrics, per_drug, budget: see score_response, the budget is for all the responses
 
+    The ARAs return many of the same drugs and publications. All the responses are indexed and their edges
+    extracted first, then the distinct publications and the distinct drugs of all of them are looked up together,
+    once each, and finally each response is scored with these lookups.
+
+    OUTPUT: the scores of each response, as score_response would give them: a List of DataFrames in the order
+            of the responses, or a Dict: ARA -> DataFrame; with return_metrics, also the Dict: stage -> timings
+            and counters of all the responses
+    """
+    metrics = Metrics() if return_metrics else current_metrics()
+    if budget is None:
+        budget = current_budget()
+    elif not isinstance(budget, Budget):
+        budget = Budget(budget)
+    with use_metrics(metrics), use_budget(budget):
+        if isinstance(responses, dict):
+            scores = dict(zip(responses, _score_responses(list(responses.values()), library, level, per_drug)))
+        else:
+            scores = _score_responses(list(responses), library, level, per_drug)
+    return (scores, metrics.as_dict()) if return_metrics else scores
 
-            #start = time.time()
-            df, query_chk = extracting_drug_fda_publ_date(mergedAnnotatedOutput, unknown)
-            #print(f"Time to extract fda status and Publication data:{time.time()-start}")
+def _score_responses(responses, library, level, per_drug):
+    extracted = [extract_edges(response, lookup_publications=False) for response in responses]
+    drug_queries = [x for x in extracted if x is not None and x[4] == 1]
+
+    with stage('publications'):
+        all_publications = distinct_publications(df for index, known, unknown, df, query_chk in drug_queries)
+        incr('items', len(all_publications))
+        publ_years = get_publication_years(all_publications)
+    drugs = []
+    for index, known, unknown, df, query_chk in drug_queries:
+        add_publication_ages(df, publ_years)
+        unknown_ids, known_ids = similarity_drugs(known, unknown, index, library)
+        drugs.extend(unknown_ids + known_ids)
+    with stage('smiles'):
+        drugs = list(dict.fromkeys(drugs))
+        incr('items', len(drugs))
+        smiles = mol_to_smile_molpro(drugs)
+
+    import pandas as pd
+    return [pd.DataFrame() if x is None else _score_extracted(response, library, level, per_drug, *x, smiles=smiles)
+            for response, x in zip(responses, extracted)]
+
+def _score_response(mergedAnnotatedOutput, library, level, per_drug=False):
+    extracted = extract_edges(mergedAnnotatedOutput)
+    if extracted is None:
+        import pandas as pd
+        return pd.DataFrame()
+    return _score_extracted(mergedAnnotatedOutput, library, level, per_drug, *extracted)
+
+def extract_edges(mergedAnnotatedOutput, lookup_publications=True):
+    """
+    Steps 1 and 2: indexes the response, splits its known and unknown results and extracts the attributes of the
+    edges of the unknown results (see extracting_drug_fda_publ_date).
+
+    Returns: (MessageIndex, known, unknown, DataFrame of the edges, query_chk), None when the response has no
+        results
+    """
+    if mergedAnnotatedOutput['fields']['status'] != 'Done' or not mergedAnnotatedOutput['fields']['data']['message']['results']:
+        return None
+    with stage('split'):
+        # A single indexing pass shared by all the steps
+        index = MessageIndex(mergedAnnotatedOutput)
+        known, unknown = find_known_results(mergedAnnotatedOutput, index)
+        incr('items', len(index.results))
+    #
+    # # Step 2
+    with stage('attributes'):
+        df, query_chk = extracting_drug_fda_publ_date(mergedAnnotatedOutput, unknown, index=index,
+                                                      lookup_publications=False)
+        incr('items', len(df))
+    if lookup_publications and query_chk == 1:
+        # Its own stage, outside of attributes so that the lookup time is not counted twice
+        add_publication_ages(df)
     #         # print(df.head())
     #         # print(query_chk)
     #
-            # df.to_excel(f'DATAFRAME.xlsx', header=False, index=False)
-            # df = pd.read_excel('DATAFRAME.xlsx', names=['edge', 'drug', 'fda status', 'publications', 'number_of_publ', 'age_oldest_pub'])
-            # query_chk = 1
-
-            # #
-            # res, res_known = extract_results(mergedAnnotatedOutput, unknown, known)
-    #         # print(len(res_known))
-    #         # print(len(res))
-    #         # # #
-    #         df_res, res_unknown, res_known = result_edge_correlation(res, res_known, df)
-            # print(len(res_unknown))
-            # print(len(res_known))
-            # df = df_res
-            # print(df.head())
-            # print(similarity_map)
-            if query_chk==1:
-                #start = time.time()
+    # df.to_excel(f'DATAFRAME.xlsx', header=False, index=False)
+    # df = pd.read_excel('DATAFRAME.xlsx', names=['edge', 'drug', 'fda status', 'publications', 'number_of_publ', 'age_oldest_pub'])
+    # query_chk = 1
+    return index, known, unknown, df, query_chk
+
+def _score_extracted(mergedAnnotatedOutput, library, level, per_drug, index, known, unknown, df, query_chk,
+                     smiles=None):
+    # Steps 3 to 6 on the output of extract_edges, smiles: see molecular_sim
+    if query_chk==1 and level == 'result':
+        res, res_known = extract_results(mergedAnnotatedOutput, unknown, known, index)
+        df, res_unknown, res_known = result_edge_correlation(res, res_known, df, index)
+        # Position among the unknown results -> index of the result in the response
+        result_ids = np.array([idi for idi in range(len(index.results)) if idi in index.unknown_set], dtype=np.int64)
+        df['result'] = result_ids[df['result']]
+    if query_chk==1:
+        if per_drug or level == 'drug':
+            with stage('aggregation'):
+                edges = df
+                df = aggregate_by_drug(edges)
+                incr('items', len(df))
+        try:
+            similarity_map = molecular_sim(known, unknown, mergedAnnotatedOutput, library, index, smiles)
+            similarity = nearest_similarity(similarity_map)
+            df['similarity'] = np.array([similarity.get(drug, np.nan) for drug in df.drugs], dtype=float)[df.drug_codes]
+        except Exception as e:
+            logger.error("similarity: %s", e)
+            degrade('similarity', df['drug'])
+            df['similarity'] = np.nan
+
+        with stage('scoring'):
+            incr('items', len(df))
+            # Steps 3 to 5: recency, then the novelty score
+            add_scores(df)
+            # df.to_excel(f'DATAFRAME_result.xlsx', header=False, index=False)
+
+            budget = current_budget()
+            columns = ['drug', 'novelty_score']
+            if budget is not None:
+                df['degraded'] = np.array(degraded_factors(df, budget), dtype=object)
+                columns.append('degraded')
+
+            if per_drug and level != 'drug':
+                # Fan the scores of the drugs back out to their edges
+                df = fan_out(edges, df, columns[1:])
+
+            # The output frame, with only the columns returned
+            df = df.to_frame((['result'] if level == 'result' else []) + columns)
+            if budget is not None:
+                df.attrs['degraded'] = budget.degraded
+
+            # # # Step 6
+            # # # Just sort them:
+            df = df.sort_values(by= 'novelty_score', ascending= False)
+            if level == 'result':
+                df = df.drop_duplicates('result')
+    else:
+        df = df.assign(novelty_score=0)
+    # df.to_excel(f'DATAFRAME_NOVELTY.xlsx', header=False, index=False)
+    return df
+
+
+def expand_inputs(inputs, suffix='_scores.json'):
+    """
+    Args:
+        inputs: List of response files, directories (all their .json files) or glob patterns
+        suffix: str: files ending with it are score files and are skipped
+
+    Returns:
+        List of the response files, without duplicates
+    """
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            paths.extend(sorted(glob.glob(os.path.join(item, '*.json'))))
+        elif glob.has_magic(item):
+            paths.extend(sorted(glob.glob(item)))
+        else:
+            paths.append(item)
+    return [path for path in dict.fromkeys(paths) if not path.endswith(suffix)]
+
+
+def output_path(path, output_dir=None, suffix='_scores.json'):
+    name = os.path.splitext(os.path.basename(path))[0] + suffix
+    return os.path.join(output_dir if output_dir else os.path.dirname(path), name)
+
+
+_worker_library = None
+
+
+def _init_worker(library_base):
+    global _worker_library
+    if library_base:
+        from fp_library import FingerprintLibrary, PrunedLibrary
+        _worker_library = PrunedLibrary(FingerprintLibrary(library_base))
+
+
+def score_file(path, out_path, level='edge', per_drug=False, budget=None, stream=False, top=None):
+    """
+    Scores a response file and writes its scores as soon as they are computed.
+
+    stream: write the score records in NDJSON as the drugs are scored (see stream.iter_scores)
+    top: only write the top records, by descending score, in NDJSON
+
+    Returns:
+        (path, number of scored rows or None when there are no results, seconds)
+    """
+    start = time.time()
+    if stream or top:
+        from stream import iter_scores, write_ndjson, TopK
+        if budget is not None:
+            budget = Budget(budget)
+        records = iter_scores(load_response(path), library=_worker_library, level=level, per_drug=per_drug,
+                              budget=budget)
+        if top:
+            records = TopK(top).extend(records).items()
+        rows = write_ndjson(records, out_path)
+        return path, rows or None, time.time() - start
+    temp = compute_novelty(path, library=_worker_library, level=level, per_drug=per_drug, budget=budget)
+    if temp.empty:
+        rows = None
+    else:
+        temp.to_json(out_path, orient='values')
+        rows = len(temp)
+    return path, rows, time.time() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compute the novelty scores of merged ARS responses')
+    parser.add_argument('inputs', nargs='*', default=['mergedAnnotatedOutput.json'],
+                        help='response files, directories or glob patterns')
+    parser.add_argument('--workers', type=int, default=1, help='number of processes scoring files in parallel')
+    parser.add_argument('--output-dir', help='directory of the score files, by default next to each response')
+    parser.add_argument('--level', choices=['edge', 'result', 'drug'], default='edge')
+    parser.add_argument('--per-drug', action='store_true',
+                        help='score each drug once from all its edges and give its score to each of them')
+    parser.add_argument('--budget', type=float,
+                        help='seconds allowed per response, lookups not done in time are scored with fallbacks')
+    parser.add_argument('--library', help='fp_library reference fingerprints to compare against')
+    parser.add_argument('--stream', action='store_true',
+                        help='write the scores in NDJSON (<response>_scores.ndjson) as the drugs are scored')
+    parser.add_argument('--top', type=int, help='only write the TOP best scores, in NDJSON')
+    args = parser.parse_args(argv)
+    suffix = '_scores.ndjson' if args.stream or args.top else '_scores.json'
+
+    start = time.time()
+    paths = expand_inputs(args.inputs)
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    # The workers share the publication / SMILES caches through the cache database
+    _init_worker(args.library)
+    if args.workers <= 1 or len(paths) <= 1:
+        for path in paths:
+            try:
+                report_file(*score_file(path, output_path(path, args.output_dir, suffix), args.level, args.per_drug,
+                                        args.budget, args.stream, args.top))
+            except Exception as e:
+                print(f"Error scoring {path}: {e}")
+    else:
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                                 initargs=(args.library,)) as executor:
+            futures = {executor.submit(score_file, path, output_path(path, args.output_dir, suffix), args.level,
+                                             args.per_drug, args.budget, args.stream, args.top): path
+                       for path in paths}
+            for future in as_completed(futures):
                 try:
-                    similarity_map = molecular_sim(known, unknown, mergedAnnotatedOutput)
-                    df['similarity'] = df.apply(lambda row: similarity_map[row['drug']][0][1] if row['drug'] in similarity_map.keys() else np.nan,axis=1)
+                    report_file(*future.result())
                 except Exception as e:
-                    df = df.assign(similarity=np.nan)
-
-                #print(f"Time to compute Molecular Similarity:{time.time() - start}")
-                # Step 3:
-                # calculating the recency
-                df['recency'] = df.apply(lambda row: recency_function_exp(row['number_of_publ'], row['age_oldest_pub'], 100, 50) if not (np.isnan(row['number_of_publ']) or np.isnan(row['age_oldest_pub'])) else np.nan, axis=1)
-                #
-                # # Step 4:
-                # # Calculating the Similarity:
-                # nearest_neighbours = calculate_nn_distance(res_known, res_unknown, 0, 1)
-
-                # df = df.assign(similarity=np.nan)
-
-                # # Step 5:
-                # # Calculating the novelty score:
-                df['novelty_score'] = df.apply(lambda row: novelty_score(row['fda status'], row['recency'], row['similarity']), axis=1)
-                # df.to_excel(f'DATAFRAME_result.xlsx', header=False, index=False)
-
-                # # # Step 6
-                # # # Just sort them:
-                df = df[['drug', 'novelty_score']].sort_values(by= 'novelty_score', ascending= False)
-            else:
-                df = df.assign(novelty_score=0)
-            # df.to_excel(f'DATAFRAME_NOVELTY.xlsx', header=False, index=False)
-        else:
-            df = pd.DataFrame()
+                    print(f"Error scoring {futures[future]}: {e}")
+    print(f"Total time: {time.time()-start}")
+
+
+def report_file(path, rows, seconds):
+    if rows is None:
+        print(f"No results for {path}")
     else:
-        df = pd.DataFrame()
-    return df
+        print(f"{path}: {rows} scores in {seconds:.1f}s")
+
 
-start = time.time()
-temp = compute_novelty(f'mergedAnnotatedOutput.json')
-if temp.empty:
-    print(f"No results for mergedAnnotatedOutput.json")
-else:
-    temp_json = temp.to_json(f'mergedAnnotatedOutput_scores.json', orient='values')
-print(f"Total time: {time.time()-start}")
+if __name__ == '__main__':
+    main()
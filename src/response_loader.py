@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+
+"""
+Loading of (merged) ARS responses for the novelty score.
+
+The lean mode keeps only what the scoring needs: the status, the query graph, the node / edge bindings of
+the results and, for the knowledge graph edges, their subject, object, sources and FDA / publication
+attributes. With ijson installed the file is streamed, so the full document is never held in memory; without
+it the file is parsed with orjson and pruned right away.
+"""
+
+import orjson
+from message_index import ATTRIBUTE_TYPE_IDS_FDA, ATTRIBUTE_TYPE_IDS_PUB
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+SCORED_ATTRIBUTE_TYPE_IDS = set(ATTRIBUTE_TYPE_IDS_FDA) | set(ATTRIBUTE_TYPE_IDS_PUB)
+
+MESSAGE = 'fields.data.message'
+QUERY_GRAPH = f'{MESSAGE}.query_graph'
+RESULTS = f'{MESSAGE}.results'
+KNOWLEDGE_GRAPH = f'{MESSAGE}.knowledge_graph'
+EDGES = f'{KNOWLEDGE_GRAPH}.edges'
+
+
+def lean_result(result):
+    lean = {'node_bindings': {key: [{'id': binding['id']} for binding in bindings]
+                              for key, bindings in result.get('node_bindings', {}).items()}}
+    if 'analyses' in result:
+        lean['analyses'] = [{'edge_bindings': {key: [{'id': binding['id']} for binding in bindings]
+                                               for key, bindings in analysis['edge_bindings'].items()}}
+                            for analysis in result['analyses']]
+    return lean
+
+
+def lean_edge(edge):
+    lean = {key: edge[key] for key in ('subject', 'object', 'predicate') if key in edge}
+    lean['sources'] = [{'resource_id': source.get('resource_id'), 'resource_role': source.get('resource_role')}
+                       for source in edge.get('sources', [])]
+    if 'attributes' in edge:
+        lean['attributes'] = [{'attribute_type_id': attribute['attribute_type_id'], 'value': attribute.get('value')}
+                              for attribute in edge['attributes'] or []
+                              if attribute.get('attribute_type_id') in SCORED_ATTRIBUTE_TYPE_IDS]
+    return lean
+
+
+def lean_response(response):
+    """
+    Args: Dict: full response
+
+    Returns: Dict: the same response with only the parts used by the novelty score
+    """
+    fields = response['fields']
+    lean = {'fields': {'status': fields.get('status')}}
+    if 'data' in fields:
+        message = (fields['data'] or {}).get('message') or {}
+        lean_message = {}
+        if 'query_graph' in message:
+            lean_message['query_graph'] = message['query_graph']
+        if 'results' in message:
+            lean_message['results'] = [lean_result(result) for result in message['results'] or []]
+        if 'knowledge_graph' in message:
+            edges = (message['knowledge_graph'] or {}).get('edges', {})
+            lean_message['knowledge_graph'] = {'edges': {key: lean_edge(edge) for key, edge in edges.items()}}
+        lean['fields']['data'] = {'message': lean_message}
+    return lean
+
+
+def _stream_lean_response(f):
+    # Single pass over the parser events: the query graph, every result and every edge are built one at a
+    # time with an ObjectBuilder and pruned before the next one is read
+    status = None
+    message = {}
+    has_data = False
+    builder = None
+    depth = 0
+    target = None
+    edge_key = None
+    for prefix, event, value in ijson.parse(f, use_float=True):
+        if builder is not None:
+            builder.event(event, value)
+            if event in ('start_map', 'start_array'):
+                depth += 1
+            elif event in ('end_map', 'end_array'):
+                depth -= 1
+            if depth == 0:
+                if target == 'query_graph':
+                    message['query_graph'] = builder.value
+                elif target == 'result':
+                    message['results'].append(lean_result(builder.value))
+                else:
+                    message['knowledge_graph']['edges'][target] = lean_edge(builder.value)
+                builder = None
+            continue
+
+        if prefix == 'fields.status' and event == 'string':
+            status = value
+        elif prefix == 'fields.data' and event == 'start_map':
+            has_data = True
+        elif prefix == RESULTS and event == 'start_array':
+            message['results'] = []
+        elif prefix == KNOWLEDGE_GRAPH and event == 'start_map':
+            message['knowledge_graph'] = {'edges': {}}
+        elif prefix == EDGES and event == 'map_key':
+            edge_key = value
+        elif event == 'start_map' and (prefix == QUERY_GRAPH or prefix == f'{RESULTS}.item'
+                                       or (edge_key is not None and prefix == f'{EDGES}.{edge_key}')):
+            target = 'query_graph' if prefix == QUERY_GRAPH else 'result' if prefix == f'{RESULTS}.item' else edge_key
+            builder = ijson.ObjectBuilder()
+            builder.event(event, value)
+            depth = 1
+
+    lean = {'fields': {'status': status}}
+    if has_data:
+        lean['fields']['data'] = {'message': message}
+    return lean
+
+
+def load_response(path, lean=True):
+    """
+    Args:
+        path: str: JSON file of the response
+        lean: bool: keep only the parts used by the novelty score, streaming the file when ijson is installed
+
+    Returns:
+        Dict
+    """
+    with open(path, 'rb') as f:
+        if not lean:
+            return orjson.loads(f.read())
+        if ijson is not None:
+            return _stream_lean_response(f)
+        return lean_response(orjson.loads(f.read()))
@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+
+"""
+Long running novelty score service, so that the start-up (imports of rdkit / pandas, connections to the
+upstreams, caches, reference fingerprints) is paid once instead of once per scored response.
+
+The event loop only reads requests and writes answers; the scoring, JSON parsing and fingerprinting included,
+runs in worker processes. Each worker keeps its state warm from one request to the next: the pooled HTTP session,
+the in-memory layer of the SMILES / publication caches (see cache.use_memory_caches), the Morgan fingerprints
+already computed (see mol_similarity.morgan_fingerprint), the reference fingerprint library and the state of the
+PKs it scores incrementally. The requests with a pk always go to the same worker, chosen by a hash of the pk, so
+that it finds the state of the previous versions; the other requests go to the worker with the fewest requests in
+flight.
+
+    python service.py --port 8080 --workers 4 --library drugs
+
+    POST /score?level=edge&per_drug=0&budget=5&pk=...
+        body: a merged ARS response ({"fields": {"status": ..., "data": {"message": ...}}}) or a TRAPI response
+        ({"message": ...}); level, per_drug and budget are those of score_response, all optional. With pk, the
+        response is a new version of the merged response of that PK, and only its new results are processed
+        (see incremental) by the worker of that PK
+        answer: {"scores": [{"drug": ..., "novelty_score": ...}, ...], "degraded": [...], "metrics": {...}}
+    GET /health
+    GET /metrics    stage timings and counters of all the requests served, in the Prometheus text format
+
+The upstreams are read from NOVELTY_MOLEPRO_URL / NOVELTY_PUBLICATIONS_URL / NOVELTY_EFETCH_URL, so the service
+runs fully offline against benchmarks/stubs.py.
+"""
+
+import argparse
+import asyncio
+import importlib
+import logging
+import os
+import urllib.parse
+import zlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import orjson
+from metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+LEVELS = ['edge', 'result', 'drug']
+MAX_BODY_BYTES = int(os.environ.get('NOVELTY_MAX_BODY_BYTES', 1 << 30))
+MEMORY_CACHE_ENTRIES = 1000000
+# The scorer imports pandas, RDKit and the featurization lazily, at the first scored response: the workers import
+# them when they start instead, so that the first request of each worker does not pay for them
+WARM_MODULES = ['pandas', 'rdkit.Chem', 'featurize', 'mol_similarity', 'novelty_score_calculation']
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large',
+           500: 'Internal Server Error'}
+
+_worker_library = None
+
+
+def _init_worker(library_base, memory_entries):
+    """ Runs once in each worker: everything set up here stays warm for the requests the worker serves. """
+    global _worker_library
+    from cache import use_memory_caches
+    from http_client import get_session
+    for module in WARM_MODULES:
+        importlib.import_module(module)
+    use_memory_caches(memory_entries)
+    get_session()
+    if library_base:
+        from fp_library import FingerprintLibrary, PrunedLibrary
+        _worker_library = PrunedLibrary(FingerprintLibrary(library_base))
+
+
+def _ping():
+    return os.getpid()
+
+
+class BadRequest(ValueError):
+    """ The body is not a response that can be scored, answered with a 400 """
+
+
+def check_response(response):
+    """
+    Checks the shape of a merged ARS response before it is scored, so that only a malformed request is answered
+    with a 400 and any other error with a 500.
+
+    Raises: BadRequest: when fields.status is missing, or when a finished response has no data.message with
+        results
+    """
+    fields = response.get('fields') if isinstance(response, dict) else None
+    if not isinstance(fields, dict) or 'status' not in fields:
+        raise BadRequest('not a merged ARS or TRAPI response: no fields.status')
+    if fields['status'] == 'Done':
+        data = fields.get('data')
+        message = data.get('message') if isinstance(data, dict) else None
+        if not isinstance(message, dict):
+            raise BadRequest('not a merged ARS or TRAPI response: no data.message')
+        if not isinstance(message.get('results', []), (list, type(None))):
+            raise BadRequest('message.results must be a list')
+
+
+def _score(body, level, per_drug, budget, pk=None):
+    """
+    Runs in a worker.
+
+    Returns: (List of the score records, List of the degraded factors, Dict: stage -> timings and counters)
+    """
+    from novelty_score_calculation import score_response
+    from response_loader import lean_response
+    response = orjson.loads(body)
+    if isinstance(response, dict) and 'fields' not in response:
+        # A TRAPI response, not wrapped by the ARS
+        response = {'fields': {'status': 'Done', 'data': response}}
+    check_response(response)
+    if pk:
+        from incremental import score_pk
+        df, stages = score_pk(pk, lean_response(response), library=_worker_library, level=level, per_drug=per_drug,
+                              budget=budget, return_metrics=True)
+    else:
+        df, stages = score_response(lean_response(response), library=_worker_library, level=level,
+                                    per_drug=per_drug, budget=budget, return_metrics=True)
+    return df.to_dict(orient='records'), df.attrs.get('degraded', []), stages
+
+
+class HTTPError(Exception):
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class NoveltyService:
+    """
+    Args:
+        workers: int: scoring processes, 0 scores in a thread of the service process (debugging, tests)
+        library: str: base path of an fp_library to compare against, instead of the known results
+        memory_entries: int: entries of each cache kept in memory by each worker
+    """
+
+    def __init__(self, workers=1, library=None, memory_entries=MEMORY_CACHE_ENTRIES):
+        self.workers = workers
+        self.metrics = Metrics()
+        self.server = None
+        initargs = (library, memory_entries)
+        # A single-process executor per worker, so that a request can be sent to a given worker
+        if workers > 0:
+            self.executors = [ProcessPoolExecutor(max_workers=1, initializer=_init_worker, initargs=initargs)
+                              for _ in range(workers)]
+        else:
+            self.executors = [ThreadPoolExecutor(max_workers=1, initializer=_init_worker, initargs=initargs)]
+        # Requests sent to each worker and not answered yet, only touched by the event loop
+        self.in_flight = [0] * len(self.executors)
+
+    def worker_for(self, pk=None):
+        """ Returns: int: the worker of the PK, the least busy worker without a PK """
+        if pk:
+            # A hash stable across restarts and processes, unlike hash()
+            return zlib.crc32(pk.encode()) % len(self.executors)
+        return min(range(len(self.executors)), key=self.in_flight.__getitem__)
+
+    async def start(self, host='127.0.0.1', port=8080):
+        loop = asyncio.get_running_loop()
+        # Start the workers now, so that the first requests do not pay for their start-up
+        await asyncio.gather(*(loop.run_in_executor(executor, _ping) for executor in self.executors))
+        self.server = await asyncio.start_server(self.handle, host, port)
+        return self
+
+    @property
+    def port(self):
+        return self.server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        for executor in self.executors:
+            executor.shutdown(wait=True)
+
+    async def handle(self, reader, writer):
+        """ One connection: requests are answered in turn while the client keeps the connection alive. """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, version = request_line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get('content-length', 0) or 0)
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                if length > MAX_BODY_BYTES:
+                    await self.respond(writer, 413, {'error': f'body larger than {MAX_BODY_BYTES} bytes'}, False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+                try:
+                    status, payload = await self.dispatch(method, target, body)
+                except HTTPError as e:
+                    status, payload = e.status, {'error': str(e)}
+                except Exception as e:
+                    logger.exception("%s %s", method, target)
+                    status, payload = 500, {'error': str(e)}
+                await self.respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ValueError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, writer, status, payload, keep_alive):
+        if isinstance(payload, str):
+            body, content_type = payload.encode(), 'text/plain; version=0.0.4'
+        else:
+            body, content_type = orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY), 'application/json'
+        head = (f'HTTP/1.1 {status} {REASONS.get(status, "")}\r\nContent-Type: {content_type}\r\n'
+                f'Content-Length: {len(body)}\r\nConnection: {"keep-alive" if keep_alive else "close"}\r\n\r\n')
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+    async def dispatch(self, method, target, body):
+        url = urllib.parse.urlsplit(target)
+        if url.path == '/health':
+            return 200, {'status': 'ok', 'workers': self.workers}
+        if url.path == '/metrics':
+            return 200, self.metrics.to_prometheus()
+        if url.path != '/score':
+            raise HTTPError(404, f'no such path {url.path}')
+        if method != 'POST':
+            raise HTTPError(405, 'POST a response to /score')
+        return 200, await self.score(body, urllib.parse.parse_qs(url.query))
+
+    async def score(self, body, query):
+        level = query.get('level', ['edge'])[0]
+        if level not in LEVELS:
+            raise HTTPError(400, f'level must be one of {LEVELS}')
+        per_drug = query.get('per_drug', ['0'])[0].lower() in ('1', 'true', 'yes')
+        try:
+            budget = float(query['budget'][0]) if 'budget' in query else None
+        except ValueError:
+            raise HTTPError(400, 'budget must be a number of seconds')
+        pk = query.get('pk', [None])[0]
+        if not body:
+            raise HTTPError(400, 'POST a response to /score')
+
+        loop = asyncio.get_running_loop()
+        worker = self.worker_for(pk)
+        self.in_flight[worker] += 1
+        try:
+            records, degraded, stages = await loop.run_in_executor(self.executors[worker], _score, body, level,
+                                                                   per_drug, budget, pk)
+        except orjson.JSONDecodeError as e:
+            raise HTTPError(400, f'invalid JSON: {e}')
+        except BadRequest as e:
+            raise HTTPError(400, str(e))
+        finally:
+            self.in_flight[worker] -= 1
+        for name, entry in stages.items():
+            for counter, value in entry.items():
+                self.metrics.add(name, counter, value)
+        return {'scores': records, 'degraded': degraded, 'metrics': stages}
+
+
+async def serve(host, port, workers, library):
+    service = await NoveltyService(workers=workers, library=library).start(host, port)
+    print(f"Novelty score service on http://{host}:{service.port} with {workers} workers")
+    try:
+        await service.serve_forever()
+    finally:
+        await service.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Novelty score HTTP service')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='scoring processes, 0 to score in the service process')
+    parser.add_argument('--library', help='fp_library reference fingerprints to compare against')
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, args.library))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
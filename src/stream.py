@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+
+"""
+Streaming scores: iter_scores() yields the score of each edge (result, drug) of a response as soon as the factors of
+its drug are resolved, instead of building, sorting and returning the whole table at the end like score_response.
+The drugs are processed in batches, in the order of their first edge: the publications and SMILES of a batch are
+looked up, its drugs compared with the known drugs (resolved first, once) and its rows scored, then its records
+are yielded. The first batch is small so that the first records come early, the next ones grow, and the lookups
+of the next few batches are sent while a batch is scored and its records consumed.
+
+    with open('scores.ndjson', 'wb') as f:
+        write_ndjson(iter_scores(response), f)
+    best = TopK(100).extend(iter_scores(response)).items()
+
+The records are (drug, edge, novelty_score, factors): edge is the knowledge graph edge ID with level 'edge', the
+index of the result with level 'result' and None with level 'drug'; factors holds the fda status, number_of_publ,
+age_oldest_pub, recency and similarity the score was computed from, and the degraded factors under a budget.
+The records are in the order of the drugs, not sorted by score: TopK keeps the best k of them in O(k) memory.
+"""
+
+import heapq
+import itertools
+import logging
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import orjson
+from extr_smile_molpro_by_id import mol_to_smile_molpro, NO_SMILES
+from mol_similarity import FingerprintIndex, find_nearest_neighbors
+from novelty_score_calculation import (extract_edges, extract_results, result_edge_correlation, similarity_drugs,
+                                       get_publication_years, add_publication_ages, aggregate_by_drug, add_scores,
+                                       nearest_similarity, degraded_factors, fan_out)
+from budget import Budget, use_budget, current_budget, degrade
+from metrics import current_metrics, use_metrics, stage, incr, in_context
+
+logger = logging.getLogger(__name__)
+
+BATCH_DRUGS = 32
+MAX_BATCH_DRUGS = 256
+PREFETCH = 4
+FACTORS = ['fda status', 'number_of_publ', 'age_oldest_pub', 'recency', 'similarity']
+
+ScoreRecord = namedtuple('ScoreRecord', ['drug', 'edge', 'novelty_score', 'factors'])
+
+
+def _factors(rows, i, degraded=None):
+    factors = {name: float(rows[name][i]) for name in FACTORS}
+    if degraded is not None:
+        factors['degraded'] = degraded
+    return factors
+
+
+def _batches(df, batch_drugs, max_batch_drugs):
+    # (drugs, their row positions, their publications not in an earlier batch), the batches grow from batch_drugs
+    # to max_batch_drugs, so that the first records come early and the later ones with fewer requests
+    groups = df.drug_groups()
+    batches = []
+    seen = set()
+    start = 0
+    size = batch_drugs
+    while start < len(groups):
+        batch = groups[start:start + size]
+        positions = np.concatenate([rows for _, rows in batch])
+        new = [x for x in df.take(positions).distinct_publications() if x not in seen]
+        seen.update(new)
+        batches.append((list(df.drugs[[code for code, _ in batch]]), positions, new))
+        start += size
+        size = min(2 * size, max_batch_drugs)
+    return batches
+
+
+def _lookup(batch, publications, unknown_set, known_smiles):
+    # The external lookups of a batch: (publication ID -> year, drug -> SMILES or None if the lookup failed)
+    with stage('publications'):
+        incr('items', len(publications))
+        publ_years = get_publication_years(publications) if publications else {}
+    queries = [drug for drug in batch if drug in unknown_set]
+    try:
+        with stage('smiles'):
+            incr('items', len(queries))
+            smiles = {drug: known_smiles[drug] for drug in queries if drug in known_smiles}
+            missing = [drug for drug in queries if drug not in smiles]
+            if missing:
+                smiles.update(mol_to_smile_molpro(missing))
+    except Exception as e:
+        logger.error("similarity: %s", e)
+        smiles = None
+    return publ_years, smiles
+
+
+def iter_scores(response, library=None, level='edge', per_drug=False, budget=None, batch_drugs=BATCH_DRUGS,
+                max_batch_drugs=MAX_BATCH_DRUGS, prefetch=PREFETCH):
+    """
+    Args:
+        response: Dict: the parsed merged response, see score_response
+        library, level, per_drug, budget: see score_response
+        batch_drugs: int: drugs of the first batch, the next ones are twice as large up to max_batch_drugs
+        max_batch_drugs: int
+        prefetch: int: batches whose lookups are sent ahead of the one being scored
+
+    Yields: ScoreRecord, per edge, result or drug depending on level, the same scores as score_response
+    """
+    metrics = current_metrics()
+    if budget is None:
+        budget = current_budget()
+    elif not isinstance(budget, Budget):
+        budget = Budget(budget)
+
+    # The collector and the budget are only active while a batch is computed, not while the caller holds a record
+    with use_metrics(metrics), use_budget(budget):
+        extracted = extract_edges(response, lookup_publications=False)
+        if extracted is None:
+            return
+        index, known, unknown, df, query_chk = extracted
+        if query_chk != 1:
+            records = [ScoreRecord(entity, edge, 0.0, {}) for edge, entity in zip(df['edge'], df['result'])]
+        else:
+            records = None
+            if level == 'result':
+                res, res_known = extract_results(response, unknown, known, index)
+                df, _, _ = result_edge_correlation(res, res_known, df, index)
+                result_ids = np.array([idi for idi in range(len(index.results)) if idi in index.unknown_set],
+                                      dtype=np.int64)
+                df['result'] = result_ids[df['result']]
+                # Drugs of each result still to be scored, the result is yielded once they all are
+                remaining = {}
+                for result, _ in dict.fromkeys(zip(df['result'].tolist(), df.drug_codes.tolist())):
+                    remaining[result] = remaining.get(result, 0) + 1
+                best = {}
+
+            unknown_ids, known_ids = similarity_drugs(known, unknown, index, library)
+            unknown_set = set(unknown_ids)
+            # The known drugs first, each batch of unknown drugs is compared with all of them
+            with stage('smiles'):
+                known_ids = list(dict.fromkeys(known_ids))
+                incr('items', len(known_ids))
+                known_smiles = mol_to_smile_molpro(known_ids) if known_ids else {}
+            if budget is not None and any(budget.is_unresolved('similarity', key) for key in known_ids):
+                # The nearest known drug may be one of those whose SMILES are missing
+                degrade('similarity', unknown_ids)
+            if library is not None:
+                known_index = library
+            else:
+                with stage('fingerprinting'):
+                    known_index = FingerprintIndex({key: value for key, value in known_smiles.items()
+                                                    if value != NO_SMILES})
+                    incr('items', len(known_index))
+                    for key, error in known_index.invalid.items():
+                        logger.warning("Invalid SMILES string for %s: %s", key, error)
+
+            batches = iter(_batches(df, batch_drugs, max_batch_drugs))
+    if records is not None:
+        yield from records
+        return
+
+    executor = ThreadPoolExecutor(max_workers=max(1, prefetch))
+    queue = deque()
+
+    def submit(batch):
+        if batch is not None:
+            with use_metrics(metrics), use_budget(budget):
+                queue.append((batch, executor.submit(in_context(_lookup), batch[0], batch[2], unknown_set,
+                                                     known_smiles)))
+
+    publ_years = {}
+    try:
+        for batch in itertools.islice(batches, max(1, prefetch)):
+            submit(batch)
+        while queue:
+            (batch, positions, _), future = queue.popleft()
+            # The lookups of the next batches are sent while this one is scored and its records consumed
+            submit(next(batches, None))
+            with use_metrics(metrics), use_budget(budget):
+                batch_years, smiles = future.result()
+                publ_years.update(batch_years)
+                rows = add_publication_ages(df.take(positions), publ_years)
+                if smiles is None:
+                    degrade('similarity', batch)
+                    similarity = {}
+                else:
+                    similarity = nearest_similarity(find_nearest_neighbors(smiles, known_index, 0, 1))
+
+                with stage('scoring'):
+                    if per_drug or level == 'drug':
+                        drug_rows = aggregate_by_drug(rows)
+                    else:
+                        drug_rows = rows
+                    drug_rows['similarity'] = np.array([similarity.get(drug, np.nan) for drug in drug_rows.drugs],
+                                                       dtype=float)[drug_rows.drug_codes]
+                    add_scores(drug_rows)
+                    degraded = degraded_factors(drug_rows, budget) if budget is not None else [None] * len(drug_rows)
+                    if level == 'drug':
+                        rows = drug_rows
+                    elif per_drug:
+                        # Fan the scores of the drugs back out to their edges
+                        drug_rows['degraded'] = np.array(degraded, dtype=object)
+                        rows = fan_out(rows, drug_rows, FACTORS + ['novelty_score', 'degraded'])
+                        degraded = rows['degraded'].tolist()
+                    else:
+                        rows = drug_rows
+                    incr('items', len(rows))
+
+                    records = []
+                    drugs = rows['drug']
+                    scores = rows['novelty_score'].tolist()
+                    if level == 'result':
+                        results = rows['result'].tolist()
+                        for i, (result, factors) in enumerate(zip(results, degraded)):
+                            if result not in best or scores[i] > best[result].novelty_score:
+                                best[result] = ScoreRecord(drugs[i], result, scores[i], _factors(rows, i, factors))
+                        for result, _ in dict.fromkeys(zip(results, rows.drug_codes.tolist())):
+                            remaining[result] -= 1
+                            if not remaining[result]:
+                                records.append(best.pop(result))
+                    else:
+                        edge_ids = rows['edge_id'] if level == 'edge' else [None] * len(rows)
+                        for i, factors in enumerate(degraded):
+                            records.append(ScoreRecord(drugs[i], edge_ids[i], scores[i], _factors(rows, i, factors)))
+            yield from records
+    finally:
+        # The lookups not started are dropped, the running ones complete before the generator is closed
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+class TopK:
+    """
+    The k records with the highest novelty score among those added, kept in a bounded heap instead of sorting
+    all of them. Records of equal score keep the order they were added in.
+
+    Args:
+        k: int
+    """
+
+    def __init__(self, k):
+        self.k = k
+        self._heap = []
+        self._count = itertools.count()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def add(self, record):
+        item = (record.novelty_score, -next(self._count), record)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, item)
+        elif item[:2] > self._heap[0][:2]:
+            heapq.heapreplace(self._heap, item)
+
+    def extend(self, records):
+        for record in records:
+            self.add(record)
+        return self
+
+    def items(self):
+        """ Returns: List of the records, by descending novelty score """
+        return [item[2] for item in sorted(self._heap, key=lambda item: item[:2], reverse=True)]
+
+
+def write_ndjson(records, f):
+    """
+    Writes each record as a JSON object on its own line, as soon as it is produced.
+
+    Args:
+        records: Iterable of ScoreRecord
+        f: binary file, or the path of the file to write
+
+    Returns: int: number of records written
+    """
+    if isinstance(f, str):
+        with open(f, 'wb') as out:
+            return write_ndjson(records, out)
+    count = 0
+    for record in records:
+        f.write(orjson.dumps(record._asdict(), option=orjson.OPT_SERIALIZE_NUMPY) + b'\n')
+        f.flush()
+        count += 1
+    return count
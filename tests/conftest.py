@@ -0,0 +1,22 @@
+import os
+import sys
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'src'))
+sys.path.insert(0, os.path.join(HERE, '..', 'benchmarks'))
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    """ Every test gets its own empty cache database, the user's one is never read nor written. """
+    import cache
+    import factor_store
+    directory = str(tmp_path / 'cache')
+    monkeypatch.setenv('NOVELTY_CACHE_DIR', directory)
+    monkeypatch.setattr(cache, 'CACHE_DIR', directory)
+    monkeypatch.setattr(cache, '_caches', {})
+    # Nor is the factor store of NOVELTY_FACTOR_STORE
+    monkeypatch.setattr(factor_store, '_store', None)
+    monkeypatch.setattr(factor_store, '_store_path', '')
+    return directory
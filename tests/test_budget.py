@@ -0,0 +1,33 @@
+import time
+import pytest
+from budget import Budget, BudgetExhausted, call_timeout, DEFAULT_CALL_TIMEOUT, use_budget
+from novelty_score_calculation import score_response
+from stubs import StubServices
+from synthetic import make_response
+
+
+def test_call_timeout_stays_within_the_budget():
+    assert call_timeout() == DEFAULT_CALL_TIMEOUT
+    budget = Budget(2.0, retries=1)
+    with use_budget(budget):
+        # Split over the attempts, so that a stalled first attempt leaves time for the retry
+        assert call_timeout() <= 1.0
+        budget.deadline = time.monotonic() + 0.5
+        assert call_timeout() <= 0.5
+        budget.deadline = time.monotonic()
+        with pytest.raises(BudgetExhausted):
+            call_timeout()
+
+
+def test_slow_upstream_degrades_the_scores_instead_of_blocking():
+    response = make_response(n_results=50, seed=2)
+    with StubServices(latency=2.0):
+        start = time.monotonic()
+        df = score_response(response, budget=0.5)
+        elapsed = time.monotonic() - start
+    assert elapsed < 1.5
+    assert df.attrs['degraded'] == ['recency', 'similarity']
+    # Edges without publications have no recency to degrade
+    assert set(df['degraded']) == {'similarity', 'similarity,recency'}
+    # The fallback branches of novelty_score still give every edge a score
+    assert df['novelty_score'].notna().all()
@@ -0,0 +1,78 @@
+import logging
+import time
+import cache
+from cache import SQLiteCache, NullCache, MemoryCache, get_cache, ACCESS_GRANULARITY
+
+
+def test_negative_entries_expire(tmp_path):
+    years = SQLiteCache(str(tmp_path / 'cache.sqlite'), 'years', negative_ttl=60)
+    years.set_many({'PMID:1': 2001, 'PMID:2': None})
+    assert years.get_many(['PMID:1', 'PMID:2', 'PMID:3']) == {'PMID:1': 2001, 'PMID:2': None}
+
+    conn = years._connection()
+    with conn:
+        conn.execute('UPDATE "years" SET created = ?', (time.time() - 120,))
+    # The positive entry never expires, the negative one has to be looked up again
+    assert years.get_many(['PMID:1', 'PMID:2']) == {'PMID:1': 2001}
+
+
+def test_recent_hits_do_not_write(tmp_path):
+    years = SQLiteCache(str(tmp_path / 'cache.sqlite'), 'years')
+    years.set_many({'PMID:1': 2001, 'PMID:2': None})
+    conn = years._connection()
+    writes = conn.total_changes
+    assert years.get_many(['PMID:1', 'PMID:2', 'PMID:3']) == {'PMID:1': 2001, 'PMID:2': None}
+    assert conn.total_changes == writes
+
+    old = time.time() - 2 * ACCESS_GRANULARITY
+    with conn:
+        conn.execute('UPDATE "years" SET accessed = ?', (old,))
+    years.get_many(['PMID:1', 'PMID:2'])
+    accessed = conn.execute('SELECT MIN(accessed) FROM "years"').fetchone()[0]
+    assert accessed > old
+
+
+def test_eviction_keeps_the_table_bounded(tmp_path):
+    smiles = SQLiteCache(str(tmp_path / 'cache.sqlite'), 'smiles', max_entries=10)
+    for i in range(25):
+        smiles.set(f'CHEBI:{i}', 'C' * (i + 1))
+    count = smiles._connection().execute('SELECT COUNT(*) FROM "smiles"').fetchone()[0]
+    assert count <= 10
+    # The least recently used entries go first
+    assert smiles.get('CHEBI:0') is None
+    assert smiles.get('CHEBI:24') == 'C' * 25
+
+
+def test_empty_cache_dir_disables_the_caches(monkeypatch):
+    monkeypatch.setattr(cache, 'CACHE_DIR', '')
+    disabled = get_cache('years')
+    assert isinstance(disabled, NullCache)
+    disabled.set('PMID:1', 2001)
+    assert disabled.get_many(['PMID:1']) == {}
+
+
+def test_unusable_cache_dir_is_logged(tmp_path, monkeypatch, caplog):
+    # A file where the cache directory should be
+    (tmp_path / 'file').write_text('')
+    monkeypatch.setattr(cache, 'CACHE_DIR', str(tmp_path / 'file'))
+    with caplog.at_level(logging.WARNING, logger='cache'):
+        assert isinstance(get_cache('years'), NullCache)
+    assert caplog.records[0].args[0] == 'years'
+
+
+def test_memory_layer_expires_negative_entries_with_the_database(tmp_path):
+    years = SQLiteCache(str(tmp_path / 'cache.sqlite'), 'years', negative_ttl=60)
+    years.set_many({'PMID:1': 2001, 'PMID:2': None})
+    conn = years._connection()
+    with conn:
+        conn.execute('UPDATE "years" SET created = ?', (time.time() - 50,))
+    memory = MemoryCache(years, 10)
+    # Negative entries are kept in memory too
+    assert memory.get_many(['PMID:1', 'PMID:2']) == {'PMID:1': 2001, 'PMID:2': None}
+    with conn:
+        conn.execute('DELETE FROM "years"')
+    assert memory.get_many(['PMID:1', 'PMID:2']) == {'PMID:1': 2001, 'PMID:2': None}
+    # Read 50 s after it was created, the negative entry has 10 s left in memory as in the database
+    _, expires = memory._entries['PMID:2']
+    assert abs(expires - (time.time() + 10)) < 2
+    assert memory._entries['PMID:1'] == (2001, None)
@@ -0,0 +1,112 @@
+import json
+import numpy as np
+import pandas as pd
+import pytest
+import extr_smile_molpro_by_id
+import novelty_score_calculation
+from edge_table import EdgeTable
+from message_index import MessageIndex
+from novelty_score_calculation import (aggregate_by_drug, compute_novelty, expand_inputs, main, result_edge_correlation,
+                                      score_response)
+from trapi import edge, response
+
+SMILES = {'CHEBI:1': 'CC(=O)Oc1ccccc1C(=O)O', 'CHEBI:2': 'CC(C)Cc1ccc(cc1)C(C)C(=O)O',
+          'CHEBI:3': 'CN1C=NC2=C1C(=O)N(C(=O)N2C)C', 'CHEBI:4': 'CC(=O)Nc1ccc(O)cc1', 'CHEBI:5': 'O=C(O)c1ccccc1O'}
+RESPONSE = response([
+    {'e0': edge('CHEBI:1', 'infores:chembl', ['PMID:1'], 'FDA Approval')},
+    {'e1': edge('CHEBI:2', 'infores:aragorn', ['PMID:2', 'PMID:3'], 'FDA Clinical Research Phase 2'),
+     'e2': edge('CHEBI:2', 'infores:arax', ['PMID:4'])},
+    {'e3': edge('CHEBI:3', 'infores:robokop', ['PMID:5'], 'FDA Approval')},
+    {'e4': edge('CHEBI:4', 'infores:drugcentral')},
+    {'e5': edge('CHEBI:5', 'infores:improving-agent', ['PMID:6', 'PMID:1'])},
+])
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """ Fake Text Mining Provider and MolePro. """
+    def get_publication_info(pub_id):
+        ids = pub_id.split(',')
+        return {'_meta': {'n_results': len(ids)}, 'results': {x: {'pub_year': str(2024 - 3 * int(x[5:]))} for x in ids}}
+
+    def mol_to_smile_molpro_chunk(molecules):
+        return {mol: SMILES[mol] for mol in molecules}
+
+    monkeypatch.setattr(novelty_score_calculation, 'get_publication_info', get_publication_info)
+    monkeypatch.setattr(extr_smile_molpro_by_id, 'mol_to_smile_molpro_chunk', mol_to_smile_molpro_chunk)
+
+
+@pytest.fixture
+def response_file(tmp_path):
+    path = tmp_path / 'response.json'
+    path.write_text(json.dumps(RESPONSE))
+    return str(path)
+
+
+def test_result_level_keeps_the_best_edge_of_each_unknown_result(upstream, response_file):
+    edges = compute_novelty(response_file)
+    results = compute_novelty(response_file, level='result')
+    assert list(results.columns) == ['result', 'drug', 'novelty_score']
+    # Unknown results only, identified by their index in the response
+    assert sorted(results['result']) == [1, 2, 4]
+    best = edges.groupby('drug')['novelty_score'].max()
+    for row in results.itertuples():
+        assert row.drug == MessageIndex(RESPONSE).result_drug(row.result)
+        assert row.novelty_score == best[row.drug]
+    assert results['novelty_score'].is_monotonic_decreasing
+
+
+def test_result_edge_correlation_maps_edges_to_results():
+    index = MessageIndex(RESPONSE)
+    df = EdgeTable.from_rows(['CHEBI:2', 'CHEBI:2', 'CHEBI:3', 'CHEBI:5'], [None] * 4,
+                             edge_id=['e1', 'e2', 'e3', 'e5'])
+    df_res, res_unknown, res_known = result_edge_correlation([['e1', 'e2'], ['e3'], ['e5']], [['e0'], ['e4']], df,
+                                                             index)
+    assert list(zip(df_res['result'], df_res['edge_id'])) == [(0, 'e1'), (0, 'e2'), (1, 'e3'), (2, 'e5')]
+    assert res_unknown == {'CHEBI:2', 'CHEBI:3', 'CHEBI:5'}
+    # Known edges have no row, their drugs come from the index
+    assert res_known == {'CHEBI:1', 'CHEBI:4'}
+
+
+def test_lean_and_full_loads_give_the_same_scores(upstream, response_file):
+    pd.testing.assert_frame_equal(compute_novelty(response_file), compute_novelty(response_file, lean=False))
+
+
+def test_score_response_takes_the_parsed_response(upstream, response_file):
+    pd.testing.assert_frame_equal(score_response(RESPONSE), compute_novelty(response_file, lean=False))
+    assert score_response(response([], status='Running')).empty
+
+
+def test_main_writes_a_score_file_per_response(upstream, tmp_path, capsys):
+    inputs = tmp_path / 'responses'
+    inputs.mkdir()
+    (inputs / 'a.json').write_text(json.dumps(RESPONSE))
+    (inputs / 'b.json').write_text(json.dumps(response([], status='Running')))
+    (inputs / 'a_scores.json').write_text('[]')
+    assert expand_inputs([str(inputs), str(inputs / '*.json')]) == [str(inputs / 'a.json'), str(inputs / 'b.json')]
+
+    main([str(inputs), '--output-dir', str(tmp_path / 'scores')])
+    assert [path.name for path in (tmp_path / 'scores').iterdir()] == ['a_scores.json']
+    scores = json.loads((tmp_path / 'scores' / 'a_scores.json').read_text())
+    assert scores == json.loads(compute_novelty(str(inputs / 'a.json')).to_json(orient='values'))
+    assert f"No results for {inputs / 'b.json'}" in capsys.readouterr().out
+
+
+def test_aggregate_by_drug_merges_the_edges_of_each_drug():
+    edges = EdgeTable.from_rows(['CHEBI:2', 'CHEBI:3', 'CHEBI:2'], [['PMID:1', 'PMID:2'], None, ['PMID:2', 'PMID:3']],
+                                **{'fda status': [1.0, np.nan, 0.0], 'age_oldest_pub': [10, np.nan, 30]})
+    drugs = aggregate_by_drug(edges)
+    assert list(drugs['drug']) == ['CHEBI:2', 'CHEBI:3']
+    assert drugs['fda status'][0] == 0.0
+    assert [drugs.row_publications(i) for i in range(len(drugs))] == [['PMID:1', 'PMID:2', 'PMID:3'], []]
+    assert drugs['number_of_publ'].tolist() == [3.0, 0.0]
+    assert drugs['age_oldest_pub'][0] == 30
+    assert drugs['number_of_edges'].tolist() == [2, 1]
+
+
+def test_per_drug_scores_are_given_to_every_edge_of_the_drug(upstream):
+    drugs = score_response(RESPONSE, level='drug').set_index('drug')['novelty_score']
+    assert sorted(drugs.index) == ['CHEBI:2', 'CHEBI:3', 'CHEBI:5']
+    edges = score_response(RESPONSE, per_drug=True)
+    assert len(edges) == len(score_response(RESPONSE))
+    assert (edges['novelty_score'] == edges['drug'].map(drugs)).all()
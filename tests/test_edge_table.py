@@ -0,0 +1,63 @@
+import numpy as np
+from edge_table import EdgeTable, EdgeTableBuilder
+
+DRUGS = ['CHEBI:2', 'CHEBI:3', 'CHEBI:2', 'CHEBI:5', 'CHEBI:3']
+PUBLICATIONS = [['PMID:1', 'PMID:2'], None, ['PMID:2', 'PMID:3'], ['PMID:4'], ['PMID:1']]
+FDA_STATUS = [1.0, np.nan, 0.0, np.nan, 1.0]
+YEARS = {'PMID:1': 2000, 'PMID:2': 2010, 'PMID:3': 1990}
+
+
+def table():
+    return EdgeTable.from_rows(DRUGS, PUBLICATIONS, edge=np.arange(5), **{'fda status': FDA_STATUS})
+
+
+def rows(t, columns=('drug', 'fda status')):
+    return [tuple(None if isinstance(x, float) and np.isnan(x) else x for x in row)
+            for row in zip(*[t[name] for name in columns], [t.row_publications(i) for i in range(len(t))])]
+
+
+def test_builder_and_from_rows_give_the_same_table():
+    builder = EdgeTableBuilder()
+    for i, (drug, publications, fda_status) in enumerate(zip(DRUGS, PUBLICATIONS, FDA_STATUS)):
+        builder.add(i, f'e{i}', drug, fda_status, publications or [])
+    built = builder.build()
+    assert rows(built) == rows(table())
+    assert list(built['edge_id']) == [f'e{i}' for i in range(5)]
+    assert list(built['number_of_publ']) == [2.0, 0.0, 2.0, 1.0, 1.0]
+    assert built.distinct_publications() == ['PMID:1', 'PMID:2', 'PMID:3', 'PMID:4']
+
+
+def test_take_and_concat_keep_the_publications_of_each_row():
+    t = table()
+    taken = t.take([4, 0, 0, 1], similarity=[0.1, 0.2, 0.3, 0.4])
+    assert rows(taken, ('drug', 'edge', 'similarity')) == [
+        ('CHEBI:3', 4, 0.1, ['PMID:1']), ('CHEBI:2', 0, 0.2, ['PMID:1', 'PMID:2']),
+        ('CHEBI:2', 0, 0.3, ['PMID:1', 'PMID:2']), ('CHEBI:3', 1, 0.4, [])]
+
+    other = EdgeTable.from_rows(['CHEBI:9', 'CHEBI:2'], [['PMID:9', 'PMID:3'], None], edge=np.array([5, 6]),
+                                **{'fda status': [0.0, 1.0]})
+    merged = EdgeTable.concat([t, other])
+    assert rows(merged) == rows(t) + rows(other)
+    assert len(merged.drugs) == 4
+    assert len(merged.publications) == 5
+
+
+def test_oldest_publication_ages():
+    ages = table().oldest_publication_ages(YEARS, 2020)
+    # PMID:4 is not found
+    np.testing.assert_array_equal(ages, [20, np.nan, 30, np.nan, 20])
+    # The IDs match whatever their case and prefix
+    spelled = {'pmid:1': 2000, 'PubMed:2': 2010, 'PMID:3': 1990}
+    np.testing.assert_array_equal(table().oldest_publication_ages(spelled, 2020), ages)
+
+
+def test_aggregate_by_drug():
+    t = table()
+    t['age_oldest_pub'] = t.oldest_publication_ages(YEARS, 2020)
+    drugs = t.aggregate_by_drug()
+    assert rows(drugs, ('drug', 'fda status', 'age_oldest_pub', 'number_of_edges')) == [
+        ('CHEBI:2', 0.0, 30.0, 2, ['PMID:1', 'PMID:2', 'PMID:3']), ('CHEBI:3', 1.0, 20.0, 2, ['PMID:1']),
+        ('CHEBI:5', None, None, 1, ['PMID:4'])]
+    assert list(t.drug_positions(drugs)) == [0, 1, 0, 2, 1]
+    assert [(t.drugs[code], list(positions)) for code, positions in t.drug_groups()] == [
+        ('CHEBI:2', [0, 2]), ('CHEBI:3', [1, 4]), ('CHEBI:5', [3])]
@@ -0,0 +1,32 @@
+import io
+from eutils import iter_pmc_years, iter_pubmed_years, split_publication_ids
+
+PUBMED = b"""<?xml version="1.0" ?>
+<PubmedArticleSet>
+  <PubmedArticle><MedlineCitation><PMID>1</PMID><Article><Journal><JournalIssue>
+    <PubDate><Year>1999</Year></PubDate></JournalIssue></Journal></Article></MedlineCitation></PubmedArticle>
+  <PubmedArticle><MedlineCitation><PMID>2</PMID><DateCompleted><Year>2003</Year></DateCompleted>
+    <Article><Journal><JournalIssue><PubDate><MedlineDate>2002 Winter</MedlineDate></PubDate>
+    </JournalIssue></Journal></Article></MedlineCitation></PubmedArticle>
+  <PubmedArticle><MedlineCitation><PMID>3</PMID></MedlineCitation></PubmedArticle>
+</PubmedArticleSet>
+"""
+PMC = b"""<?xml version="1.0" ?>
+<pmc-articleset>
+  <article><front><article-meta><article-id pub-id-type="pmc">PMC456</article-id>
+    <pub-date pub-type="epub"><year>2015</year></pub-date></article-meta></front></article>
+  <article><front><article-meta><article-id pub-id-type="pmcid">789</article-id></article-meta></front></article>
+</pmc-articleset>
+"""
+
+
+def test_article_years():
+    # The year of the PubDate, otherwise the one of DateCompleted; None when there is neither
+    assert list(iter_pubmed_years(io.BytesIO(PUBMED))) == [('1', 1999), ('2', 2003), ('3', None)]
+    assert list(iter_pmc_years(io.BytesIO(PMC))) == [('456', 2015), ('789', None)]
+
+
+def test_split_publication_ids():
+    pubmed, pmc = split_publication_ids(['PMID:1', 'pmid:1', 'PUBMED:2', 'PMC:PMC456', 'PMC789', 'DOI:10.1/x'])
+    assert pubmed == {'1': ['PMID:1', 'pmid:1'], '2': ['PUBMED:2']}
+    assert pmc == {'456': ['PMC:PMC456'], '789': ['PMC789']}
@@ -0,0 +1,44 @@
+import pytest
+from rdkit import Chem
+from rdkit.Chem import AllChem
+import extr_smile_molpro_by_id
+import novelty_score_calculation
+from extr_smile_molpro_by_id import mol_to_smile_molpro, NO_SMILES
+from factor_store import FactorStore, build_store, use_store
+from novelty_score_calculation import get_publication_years
+
+
+@pytest.fixture
+def store_base(tmp_path):
+    (tmp_path / 'smiles.tsv').write_text('# CURIE SMILES\nCHEBI:1\tCC(=O)Oc1ccccc1C(=O)O\nCHEBI:2\t\n'
+                                         'CHEBI:3 CC(=O)Nc1ccc(O)cc1\nCHEBI:4\tC1CC\n')
+    (tmp_path / 'years.tsv').write_text('PMID:1\t1999\nPMID:2\t0\nPMC:PMC3 2010\n')
+    (tmp_path / 'fda.tsv').write_text('CHEBI:1\tFDA Approval\nCHEBI:3\tFDA Clinical Research Phase 2\n')
+    base = str(tmp_path / 'store' / 'factors')
+    counts = build_store(base, str(tmp_path / 'smiles.tsv'), str(tmp_path / 'years.tsv'), str(tmp_path / 'fda.tsv'))
+    # The invalid SMILES is stored, but has no fingerprint
+    assert counts == {'smiles': 4, 'fingerprints': 2, 'publication_year': 3, 'fda_status': 2}
+    return base
+
+
+def test_lookups(store_base):
+    store = FactorStore(store_base)
+    assert store.smiles(['CHEBI:1', 'CHEBI:2', 'CHEBI:5', 'CHEBI:10000000000000']) == {
+        'CHEBI:1': 'CC(=O)Oc1ccccc1C(=O)O', 'CHEBI:2': ''}
+    assert store.publication_years(['PMID:1', 'PMID:2', 'PMC:PMC3', 'PMID:4']) == {
+        'PMID:1': 1999, 'PMID:2': None, 'PMC:PMC3': 2010}
+    assert store.fda_status(['CHEBI:1', 'CHEBI:2', 'CHEBI:3']) == {'CHEBI:1': 0.0, 'CHEBI:3': 1.0}
+    smiles = 'CC(=O)Nc1ccc(O)cc1'
+    assert store.fingerprint(smiles) == AllChem.GetMorganFingerprint(Chem.MolFromSmiles(smiles), 2)
+    assert store.fingerprint('C1CC') is None
+
+
+def test_store_is_read_before_the_services(store_base, monkeypatch):
+    requested = []
+    monkeypatch.setattr(novelty_score_calculation, 'get_publication_info', lambda pub_id: requested.append(pub_id))
+    monkeypatch.setattr(extr_smile_molpro_by_id, 'mol_to_smile_molpro_chunk',
+                        lambda molecules: requested.extend(molecules) or {})
+    use_store(store_base)
+    assert get_publication_years(['PMID:1', 'PMID:2', 'PMC:PMC3']) == {'PMID:1': 1999, 'PMC:PMC3': 2010}
+    assert mol_to_smile_molpro(['CHEBI:1', 'CHEBI:2']) == {'CHEBI:1': 'CC(=O)Oc1ccccc1C(=O)O', 'CHEBI:2': NO_SMILES}
+    assert requested == []
@@ -0,0 +1,113 @@
+import numpy as np
+import pytest
+from rdkit import Chem, DataStructs
+from rdkit.Chem import AllChem
+import fp_library
+from fp_library import FingerprintLibrary, PrunedLibrary, build_library
+from mol_similarity import find_nearest_neighbors
+
+DRUGS = [('CC(=O)Oc1ccccc1C(=O)O', 'CHEBI:15365'), ('CC(C)Cc1ccc(cc1)C(C)C(=O)O', 'CHEBI:5855'),
+         ('CN1C=NC2=C1C(=O)N(C(=O)N2C)C', 'CHEBI:27732'), ('CC(=O)Nc1ccc(O)cc1', 'CHEBI:46195')]
+
+
+def bit_vector(smiles):
+    return AllChem.GetMorganFingerprintAsBitVect(Chem.MolFromSmiles(smiles), 2, nBits=2048)
+
+
+def test_library_scores_as_rdkit_bit_vectors(tmp_path):
+    smiles_file = tmp_path / 'drugs.smi'
+    lines = [f'{smiles} {key}' for smiles, key in DRUGS]
+    # Comments, lines without ID and invalid SMILES are skipped
+    smiles_file.write_text('\n'.join(['# SMILES ID', 'CCO'] + lines[:2] + ['C1CC CHEBI:0'] + lines[2:]) + '\n')
+    base = str(tmp_path / 'drugs')
+    assert build_library(str(smiles_file), base) == len(DRUGS)
+
+    library = FingerprintLibrary(base)
+    assert sorted(library.keys) == sorted(key for _, key in DRUGS)
+    query = 'O=C(O)c1ccccc1O'
+    neighbors = library.search(library.fingerprint(Chem.MolFromSmiles(query)), 0, len(DRUGS))
+    expected = DataStructs.BulkTanimotoSimilarity(bit_vector(query), [bit_vector(smiles) for smiles, _ in DRUGS])
+    assert dict(neighbors) == {key: similarity for (_, key), similarity in zip(DRUGS, expected)}
+    assert [similarity for _, similarity in neighbors] == sorted(expected, reverse=True)
+    assert library.search(library.fingerprint(Chem.MolFromSmiles(query)), 0.99, 2) == []
+
+
+def test_find_nearest_neighbors_searches_the_library(tmp_path):
+    smiles_file = tmp_path / 'drugs.smi'
+    smiles_file.write_text(''.join(f'{smiles} {key}\n' for smiles, key in DRUGS))
+    build_library(str(smiles_file), str(tmp_path / 'drugs'))
+    library = FingerprintLibrary(str(tmp_path / 'drugs'))
+    neighbors = find_nearest_neighbors({'CHEBI:1': 'CC(=O)Nc1ccc(O)cc1'}, library, 0, 1)
+    assert neighbors == {'CHEBI:1': [('CHEBI:46195', 1.0)]}
+
+
+NBITS = 128
+# Bits set in each molecule: duplicates and different molecules with the same similarity to the queries give
+# ties, on both sides of the bit count of the queries and spread over several buckets
+MOLECULES = [range(0, 8), range(0, 4), range(0, 16), range(4, 12), range(0, 8), range(0, 6), range(8, 16),
+             range(0, 2), range(0, 12), range(2, 10), range(0, 4), range(0, 24), [], range(0, 8)]
+QUERIES = [range(0, 8), range(0, 4), range(4, 12), range(100, 110), []]
+
+
+def pack(bits):
+    row = np.zeros(NBITS, dtype=np.uint8)
+    row[list(bits)] = 1
+    return np.packbits(row).view(np.uint64)
+
+
+def write_library(base, molecules, sort):
+    fps = np.vstack([pack(bits) for bits in molecules])
+    counts = np.array([len(bits) for bits in molecules], dtype=np.uint16)
+    order = np.argsort(counts, kind='stable') if sort else np.arange(len(molecules))
+    np.save(f'{base}.fps.npy', fps[order])
+    np.save(f'{base}.counts.npy', counts[order])
+    with open(f'{base}.ids.txt', 'w') as f:
+        f.write(''.join(f'MOL:{i}\n' for i in order))
+    return FingerprintLibrary(base)
+
+
+@pytest.fixture(params=[True, False], ids=['sorted', 'unsorted'])
+def library(request, tmp_path, monkeypatch):
+    # A step per bucket, so that the bound is checked between all of them
+    monkeypatch.setattr(fp_library, 'PRUNE_STEP_ROWS', 1)
+    return write_library(str(tmp_path / 'library'), MOLECULES, request.param)
+
+
+@pytest.mark.parametrize('num_neighbors', [1, 2, 3, 5, len(MOLECULES), len(MOLECULES) + 5])
+@pytest.mark.parametrize('cutoff', [0.0, 0.5, 1.0])
+def test_pruned_search_matches_the_exhaustive_one(library, cutoff, num_neighbors):
+    pruned = PrunedLibrary(library)
+    for query in QUERIES:
+        expected = library.search(pack(query), cutoff, num_neighbors)
+        assert pruned.search(pack(query), cutoff, num_neighbors) == expected
+
+
+def test_ties_are_kept_in_row_order(library):
+    # MOL:0, MOL:4 and MOL:13 are the same molecule; MOL:1 and MOL:10 too
+    pruned = PrunedLibrary(library)
+    assert [key for key, _ in pruned.search(pack(range(0, 8)), 0.0, 3)] == ['MOL:0', 'MOL:4', 'MOL:13']
+    neighbors = pruned.search(pack(range(0, 4)), 0.0, len(MOLECULES) + 5)
+    assert neighbors[:2] == [('MOL:1', 1.0), ('MOL:10', 1.0)]
+    assert len(neighbors) == len(MOLECULES)
+
+
+def test_bound_skips_the_buckets_out_of_reach(library, monkeypatch):
+    scored = []
+    exhaustive = fp_library.tanimoto
+
+    def tanimoto(query_fp, fps, counts):
+        scored.append(len(fps))
+        return exhaustive(query_fp, fps, counts)
+
+    monkeypatch.setattr(fp_library, 'tanimoto', tanimoto)
+    PrunedLibrary(library).search(pack(range(0, 8)), 0.0, 3)
+    # The three exact matches are in the bucket of the query (8 bits, 6 molecules), no other bucket can reach 1.0
+    assert sum(scored) == 6
+
+
+def test_search_many_merges_the_shards_in_query_order(library):
+    pruned = PrunedLibrary(library)
+    queries = [pack(query) for query in QUERIES] * 3
+    expected = [library.search(query_fp, 0.0, len(MOLECULES) + 5) for query_fp in queries]
+    assert pruned.search_many(queries, 0.0, len(MOLECULES) + 5) == expected
+    assert pruned.search_many(queries, 0.0, len(MOLECULES) + 5, workers=2, chunk_size=2) == expected
@@ -0,0 +1,54 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+import pytest
+import http_client
+from http_client import HostScheduler, request, set_rate_limit
+from stubs import StubServices
+
+
+@pytest.fixture(autouse=True)
+def schedulers(monkeypatch):
+    monkeypatch.setattr(http_client, '_schedulers', {})
+    monkeypatch.setattr(http_client, 'RATE_LIMITS', dict(http_client.RATE_LIMITS))
+
+
+def test_token_bucket_spaces_the_requests():
+    scheduler = HostScheduler(rate=20)
+    start = time.monotonic()
+    for _ in range(6):
+        scheduler.acquire()
+        scheduler.release()
+    assert time.monotonic() - start >= 5 / 20 * 0.9
+
+
+def test_concurrency_is_halved_on_throttling_and_grows_back():
+    scheduler = HostScheduler(max_concurrency=8)
+    for expected in [4, 2, 1, 1]:
+        scheduler.acquire()
+        scheduler.release(throttled=True)
+        assert scheduler.concurrency == expected
+    for _ in range(10):
+        scheduler.acquire()
+        scheduler.release()
+    assert 4 < scheduler.concurrency <= 8
+
+
+def test_identical_requests_in_flight_are_sent_once():
+    with StubServices(latency=0.3) as stubs:
+        url = f'{stubs.url}/publications?pubids=PMID:1'
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            responses = list(executor.map(lambda _: request('GET', url), range(5)))
+    assert [response.status_code for response in responses] == [200] * 5
+    assert stubs.requests['publications'] == 1
+
+
+def test_requests_stay_within_the_rate_limit_of_the_host():
+    with StubServices(rate_limit=10) as stubs:
+        # A little below the limit of the host, whose window does not start on the same clock
+        set_rate_limit(urlsplit(stubs.url).netloc, 8)
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            responses = list(executor.map(lambda i: request('GET', f'{stubs.url}/publications?pubids=PMID:{i}'),
+                                          range(10)))
+    assert [response.status_code for response in responses] == [200] * 10
+    assert 'throttled' not in stubs.requests
@@ -0,0 +1,37 @@
+from known import find_known_results
+from message_index import MessageIndex
+from trapi import edge, response
+
+RESPONSE = response([
+    {'e0': edge('CHEBI:1', 'infores:chembl'), 'e1': edge('CHEBI:1', 'infores:drugcentral')},
+    {'e2': edge('CHEBI:2', 'infores:aragorn', ['PMID:1'])},
+    {'e3': edge('PUBCHEM.COMPOUND:3', 'infores:arax', subject=False),
+     'e4': edge('PUBCHEM.COMPOUND:3', 'infores:robokop')},
+    {'e5': edge('CHEBI:4', 'infores:ctd')},
+])
+
+
+def test_known_and_unknown_results():
+    index = MessageIndex(RESPONSE)
+    assert index.complete
+    # One entry per edge of the result, as find_known_results always returned
+    assert index.known == [0, 0, 3]
+    assert index.unknown == [1, 2, 2]
+    assert find_known_results(RESPONSE, index) == (index.known, index.unknown)
+    assert find_known_results(RESPONSE) == (index.known, index.unknown)
+
+
+def test_edges_and_drugs():
+    index = MessageIndex(RESPONSE)
+    assert index.result_edges == [['e0', 'e1'], ['e2'], ['e3', 'e4'], ['e5']]
+    assert index.result_scored_edges == [['e0'], ['e2'], ['e3'], ['e5']]
+    assert index.edge_drug('e3') == 'PUBCHEM.COMPOUND:3'
+    assert index.edge_drug('e2') == 'CHEBI:2'
+    assert [index.result_drug(i) for i in range(4)] == ['CHEBI:1', 'CHEBI:2', 'PUBCHEM.COMPOUND:3', 'CHEBI:4']
+    assert index.query == ('biolink:Disease', 'biolink:ChemicalEntity', 1)
+
+
+def test_incomplete_message():
+    index = MessageIndex({'fields': {'status': 'Running', 'data': {'message': {'results': []}}}})
+    assert not index.complete
+    assert (index.known, index.unknown, index.edges) == ([], [], {})
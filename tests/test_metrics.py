@@ -0,0 +1,34 @@
+import time
+from metrics import Metrics, use_metrics, stage
+
+
+def test_prometheus_exports_stage_time_as_a_counter():
+    metrics = Metrics()
+    with use_metrics(metrics):
+        for _ in range(2):
+            with stage('scoring'):
+                pass
+    text = metrics.to_prometheus()
+    assert '# TYPE novelty_stage_seconds_total counter' in text
+    assert 'novelty_stage_seconds_total{stage="scoring"}' in text
+    assert 'novelty_stage_calls_total{stage="scoring"} 2' in text
+    assert 'gauge' not in text
+
+
+def test_publication_lookup_is_not_counted_in_the_attributes_stage(monkeypatch):
+    import novelty_score_calculation
+    from trapi import edge, response
+
+    def get_publication_years(pub_ids, **kwargs):
+        time.sleep(0.2)
+        return {x: 2000 for x in pub_ids}
+
+    monkeypatch.setattr(novelty_score_calculation, 'get_publication_years', get_publication_years)
+    metrics = Metrics()
+    with use_metrics(metrics):
+        extracted = novelty_score_calculation.extract_edges(response([
+            {'e0': edge('CHEBI:1', 'infores:aragorn', ['PMID:1'])}, {'e1': edge('CHEBI:2', 'infores:chembl')}]))
+    assert extracted[3]['age_oldest_pub'][0] > 0
+    stages = metrics.as_dict()
+    assert stages['publications']['wall_time'] >= 0.2
+    assert stages['attributes']['wall_time'] < 0.2
@@ -0,0 +1,58 @@
+import logging
+from rdkit import Chem, DataStructs
+from rdkit.Chem import AllChem
+from mol_similarity import FingerprintIndex, find_nearest_neighbors
+
+KNOWN = {'CHEBI:15365': 'CC(=O)Oc1ccccc1C(=O)O', 'CHEBI:5855': 'CC(C)Cc1ccc(cc1)C(C)C(=O)O',
+         'CHEBI:27732': 'CN1C=NC2=C1C(=O)N(C(=O)N2C)C', 'CHEBI:46195': 'CC(=O)Nc1ccc(O)cc1',
+         'CHEBI:0': 'No SMILES could be found'}
+UNKNOWN = {'CHEBI:1': 'O=C(O)c1ccccc1O', 'CHEBI:2': 'CC(=O)Nc1ccc(O)cc1', 'CHEBI:3': 'No SMILES could be found'}
+
+
+def similarity(smiles, other):
+    fps = [AllChem.GetMorganFingerprint(Chem.MolFromSmiles(x), 2) for x in (smiles, other)]
+    return DataStructs.TanimotoSimilarity(*fps)
+
+
+def test_nearest_neighbors_match_the_pairwise_similarities():
+    neighbors = find_nearest_neighbors(UNKNOWN, KNOWN, 0, 2)
+    # Molecules without SMILES are left out on both sides
+    assert set(neighbors) == {'CHEBI:1', 'CHEBI:2'}
+    for key, found in neighbors.items():
+        expected = sorted(((known, similarity(UNKNOWN[key], smiles)) for known, smiles in KNOWN.items()
+                           if known != 'CHEBI:0'), key=lambda x: -x[1])[:2]
+        assert found == expected
+    assert neighbors['CHEBI:2'][0] == ('CHEBI:46195', 1.0)
+
+
+def test_search_applies_the_cutoff():
+    index = FingerprintIndex({key: value for key, value in KNOWN.items() if key != 'CHEBI:0'})
+    query_fp = AllChem.GetMorganFingerprint(Chem.MolFromSmiles(UNKNOWN['CHEBI:2']), 2)
+    assert index.search(query_fp, 0.99, 3) == [('CHEBI:46195', 1.0)]
+    assert len(index.search(query_fp, 0, 10)) == len(index)
+    # A prebuilt index is used as is
+    assert find_nearest_neighbors(UNKNOWN, index, 0.99, 3)['CHEBI:2'] == [('CHEBI:46195', 1.0)]
+
+
+def test_invalid_smiles_are_logged_and_left_out(caplog):
+    known = {'CHEBI:1': 'CCO', 'CHEBI:2': 'not a smiles'}
+    unknown = {'CHEBI:3': 'CCN', 'CHEBI:4': 'C1CC'}
+    with caplog.at_level(logging.WARNING, logger='mol_similarity'):
+        neighbors = find_nearest_neighbors(unknown, known, 0, 1, workers=1)
+    assert list(neighbors) == ['CHEBI:3']
+    assert neighbors['CHEBI:3'][0][0] == 'CHEBI:1'
+    invalid = sorted(record.args[0] for record in caplog.records)
+    assert invalid == ['CHEBI:2', 'CHEBI:4']
+
+
+def test_parallel_fingerprinting_gives_the_same_neighbors(monkeypatch):
+    import featurize
+    monkeypatch.setattr(featurize, 'MIN_PARALLEL', 1)
+    known = dict(KNOWN, **{'CHEBI:9': 'not a smiles'})
+    serial = find_nearest_neighbors(UNKNOWN, known, 0, 3, workers=1)
+    assert find_nearest_neighbors(UNKNOWN, known, 0, 3, workers=2) == serial
+    index = FingerprintIndex(known, workers=2)
+    assert index.keys == ['CHEBI:15365', 'CHEBI:5855', 'CHEBI:27732', 'CHEBI:46195']
+    assert list(index.invalid) == ['CHEBI:0', 'CHEBI:9']
+    keys, fps, invalid = featurize.featurize_counts(known, workers=2, chunk_size=2)
+    assert keys == index.keys and fps == index.fps and invalid == index.invalid
@@ -0,0 +1,43 @@
+import pytest
+import cache
+from novelty_score_calculation import score_response, score_responses
+from stubs import StubServices
+from synthetic import make_response
+
+
+@pytest.fixture(scope='module')
+def synthetic_response():
+    return make_response(n_results=200, seed=1)
+
+
+def test_synthetic_response_is_scored_against_the_stubs(synthetic_response):
+    with StubServices() as stubs:
+        cold = score_response(synthetic_response)
+        requests = dict(stubs.requests)
+        # Everything is cached now
+        warm = score_response(synthetic_response)
+        assert stubs.requests == requests
+    assert {'by_id', 'collection', 'publications', 'efetch.fcgi'} <= set(requests)
+    assert not cold.empty
+    assert cold['novelty_score'].notna().any()
+    assert cold.equals(warm)
+
+
+def test_responses_of_all_aras_share_their_lookups(monkeypatch):
+    # Overlapping ARAs: the same pools of drugs and publications
+    responses = {f'ara{seed}': make_response(n_results=100, n_drugs=20, n_publications=200, seed=seed)
+                 for seed in range(3)}
+    # Without a persistent cache, only the sharing within score_responses saves requests
+    monkeypatch.setattr(cache, 'CACHE_DIR', '')
+    with StubServices() as stubs:
+        separate = {ara: score_response(response) for ara, response in responses.items()}
+        separate_requests = sum(stubs.requests.values())
+        stubs.requests.clear()
+        together = score_responses(responses)
+        together_requests = sum(stubs.requests.values())
+        as_list = score_responses(list(responses.values()))
+    assert list(together) == list(responses)
+    for ara, scores in zip(responses, as_list):
+        assert together[ara].equals(separate[ara])
+        assert scores.equals(separate[ara])
+    assert together_requests < separate_requests
@@ -0,0 +1,105 @@
+import pytest
+import novelty_score_calculation
+from cache import get_cache
+from novelty_score_calculation import get_publication_years
+from stubs import StubServices
+from synthetic import year_for
+
+IDS = [f'PMID:{i}' for i in range(1, 251)]
+# Unknown to the Text Mining Provider
+NOT_FOUND = {'PMID:7', 'PMID:70'}
+
+
+def year(pub_id):
+    return 1950 + int(pub_id.split(':')[1]) % 70
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    """ Fake Text Mining Provider: records the IDs of each request. """
+    requests = []
+
+    def get_publication_info(pub_id):
+        ids = pub_id.split(',')
+        requests.append(ids)
+        results = {x: {'pub_year': str(year(x))} for x in ids if x not in NOT_FOUND}
+        results.update({f'{x}_not_found': {} for x in ids if x in NOT_FOUND})
+        return {'_meta': {'n_results': len(results)}, 'results': results}
+
+    monkeypatch.setattr(novelty_score_calculation, 'get_publication_info', get_publication_info)
+    # EFetch does not know them either
+    monkeypatch.setattr(novelty_score_calculation, 'get_publication_years_efetch', lambda ids: ({}, set(ids)))
+    return requests
+
+
+def test_ids_are_deduplicated_and_chunked(provider):
+    years = get_publication_years(IDS + IDS[::-1], chunk_size=100, max_workers=2)
+    assert sorted(len(ids) for ids in provider) == [50, 100, 100]
+    assert sorted(x for ids in provider for x in ids) == sorted(IDS)
+    assert years == {x: year(x) for x in IDS if x not in NOT_FOUND}
+
+
+def test_no_request_without_ids(provider):
+    assert get_publication_years([]) == {}
+    assert provider == []
+
+
+def test_answers_are_cached(provider):
+    years = get_publication_years(IDS, chunk_size=100)
+    assert len(provider) == 3
+    # Found and not found publications are both cached: nothing is requested again
+    assert get_publication_years(IDS, chunk_size=100) == years
+    assert len(provider) == 3
+    assert get_cache('publication_year').get_many(NOT_FOUND) == dict.fromkeys(NOT_FOUND)
+
+
+def test_publications_not_found_are_looked_up_in_efetch(provider, monkeypatch):
+    efetch_requests = []
+
+    def get_publication_years_efetch(pub_ids):
+        efetch_requests.append(list(pub_ids))
+        return {'PMID:7': 1977}, set(pub_ids)
+
+    monkeypatch.setattr(novelty_score_calculation, 'get_publication_years_efetch', get_publication_years_efetch)
+    years = get_publication_years(IDS)
+    assert efetch_requests == [sorted(NOT_FOUND, key=IDS.index)]
+    assert years['PMID:7'] == 1977
+    assert 'PMID:70' not in years
+    # The EFetch answers are cached with the ones of the Text Mining Provider
+    assert get_cache('publication_year').get_many(NOT_FOUND) == {'PMID:7': 1977, 'PMID:70': None}
+    assert get_publication_years(IDS, eutils_fallback=False) == years
+
+
+def test_efetch_answers_are_cached():
+    # Unknown to the stub Text Mining Provider, looked up again with EFetch
+    ids = [f'PMID:{i}' for i in range(1, 200)]
+    with StubServices() as stubs:
+        years = get_publication_years(ids)
+    assert stubs.requests['efetch.fcgi'] > 0
+    assert set(years) == set(ids)
+    assert get_cache('publication_year').get_many(ids) == years
+
+
+def test_failed_efetch_is_not_cached_as_not_found():
+    ids = [f'PMID:{i}' for i in range(1, 200)]
+    unknown = [x for x in ids if not year_for(x)]
+    with StubServices(failing=['efetch.fcgi']) as stubs:
+        years = get_publication_years(ids)
+    assert stubs.requests['efetch.fcgi'] > 0
+    assert set(years) == set(ids) - set(unknown)
+    cached = get_cache('publication_year').get_many(ids)
+    assert not set(unknown) & set(cached)
+    assert cached == years
+
+
+def test_years_are_given_for_the_ids_as_sent(monkeypatch):
+    # The provider answers with its own spelling of the IDs
+    answers = {'PMID:5': 2001, 'PMC456': 2010}
+
+    def get_publication_info(pub_id):
+        results = {key: {'pub_year': str(value)} for key, value in answers.items()}
+        return {'_meta': {'n_results': len(results)}, 'results': results}
+
+    monkeypatch.setattr(novelty_score_calculation, 'get_publication_info', get_publication_info)
+    years = get_publication_years(['pmid:5', 'PMID:5', 'PMC:PMC456'], eutils_fallback=False)
+    assert years == {'pmid:5': 2001, 'PMID:5': 2001, 'PMC:PMC456': 2010}
@@ -0,0 +1,61 @@
+import copy
+import json
+import pytest
+import response_loader
+from response_loader import load_response, lean_response
+from trapi import edge, response
+
+
+def full_response():
+    full = response([
+        {'e0': edge('CHEBI:1', 'infores:chembl', ['PMID:1'], 'FDA Approval')},
+        {'e1': edge('CHEBI:2', 'infores:aragorn', ['PMID:2', 'PMC:PMC3']), 'e2': edge('CHEBI:2', 'infores:arax')},
+    ])
+    message = full['fields']['data']['message']
+    # Parts the scoring does not read
+    message['knowledge_graph']['nodes']['CHEBI:1']['attributes'] = [{'attribute_type_id': 'biolink:xref',
+                                                                     'value': ['DRUGBANK:1'] * 50}]
+    message['knowledge_graph']['edges']['e0']['attributes'].append(
+        {'attribute_type_id': 'biolink:has_supporting_study_result', 'value': 'x' * 1000, 'attributes': []})
+    message['knowledge_graph']['edges']['e2']['attributes'] = []
+    del message['knowledge_graph']['edges']['e1']['attributes']
+    for result in message['results']:
+        result['node_bindings']['sn'][0]['attributes'] = []
+        result['analyses'][0]['score'] = 0.5
+    message['auxiliary_graphs'] = {'a0': {'edges': ['e0']}}
+    return full
+
+
+@pytest.fixture
+def response_file(tmp_path):
+    path = tmp_path / 'response.json'
+    path.write_text(json.dumps(full_response()))
+    return str(path)
+
+
+def test_lean_response_keeps_the_scored_parts():
+    lean = lean_response(full_response())
+    message = lean['fields']['data']['message']
+    assert set(message) == {'query_graph', 'results', 'knowledge_graph'}
+    assert set(message['knowledge_graph']) == {'edges'}
+    assert message['knowledge_graph']['edges']['e0']['attributes'] == [
+        {'attribute_type_id': 'biolink:publications', 'value': ['PMID:1']},
+        {'attribute_type_id': 'biolink:FDA_approval_status', 'value': 'FDA Approval'}]
+    assert message['results'][1] == {'node_bindings': {'sn': [{'id': 'CHEBI:2'}], 'on': [{'id': 'MONDO:0005148'}]},
+                                     'analyses': [{'edge_bindings': {'t_edge': [{'id': 'e1'}, {'id': 'e2'}]}}]}
+
+
+def test_streamed_and_parsed_loads_are_equal(response_file, monkeypatch):
+    pytest.importorskip('ijson')
+    streamed = load_response(response_file)
+    monkeypatch.setattr(response_loader, 'ijson', None)
+    assert streamed == load_response(response_file)
+    assert streamed == lean_response(full_response())
+    assert load_response(response_file, lean=False) == full_response()
+
+
+def test_responses_without_message(tmp_path):
+    for fields in [{'status': 'Running'}, {'status': 'Error', 'data': {'message': {}}}]:
+        path = tmp_path / 'response.json'
+        path.write_text(json.dumps({'fields': copy.deepcopy(fields)}))
+        assert load_response(str(path)) == lean_response({'fields': fields})
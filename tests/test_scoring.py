@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from edge_table import EdgeTable
+from novelty_score_calculation import (add_scores, recency_function_exp, recency_function_exp_vec, novelty_score,
+                                       novelty_score_vec)
+from synthetic import random_columns
+
+COLUMNS = ['recency', 'novelty_score']
+
+
+def assert_same_scores(actual, expected):
+    for column in COLUMNS:
+        np.testing.assert_array_equal(np.asarray(actual[column], dtype=float),
+                                      expected[column].to_numpy(dtype=float), err_msg=column)
+
+
+def scalar_scores(df):
+    df = df.copy()
+    df['recency'] = df.apply(lambda row: recency_function_exp(row['number_of_publ'], row['age_oldest_pub'], 100, 50), axis=1)
+    df['novelty_score'] = df.apply(lambda row: novelty_score(row['fda status'], row['recency'], row['similarity']), axis=1)
+    return df
+
+
+def vector_scores(df):
+    df = df.copy()
+    df['recency'] = recency_function_exp_vec(df['number_of_publ'].to_numpy(), df['age_oldest_pub'].to_numpy(), 100, 50)
+    df['novelty_score'] = novelty_score_vec(df['fda status'].to_numpy(dtype=float), df['recency'].to_numpy(),
+                                            df['similarity'].to_numpy(dtype=float))
+    return df
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_vectorized_scores_match_the_scalar_ones(seed):
+    df = random_columns(64, np.random.default_rng(seed))
+    assert_same_scores(vector_scores(df), scalar_scores(df))
+
+
+def pipeline_scores(df):
+    # The row-wise scoring of the pipeline before add_scores: no recency without both publication factors
+    df = df.copy()
+    df['recency'] = df.apply(lambda row: recency_function_exp(row['number_of_publ'], row['age_oldest_pub'], 100, 50)
+                             if not (np.isnan(row['number_of_publ']) or np.isnan(row['age_oldest_pub'])) else np.nan,
+                             axis=1)
+    df['novelty_score'] = df.apply(lambda row: novelty_score(row['fda status'], row['recency'], row['similarity']),
+                                   axis=1)
+    return df
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_add_scores_on_frames_and_edge_tables(seed):
+    df = random_columns(64, np.random.default_rng(seed))
+    expected = pipeline_scores(df)
+    assert_same_scores(add_scores(df.copy()), expected)
+
+    table = EdgeTable.from_rows([f'CHEBI:{i % 7}' for i in range(len(df))], [None] * len(df),
+                                **{name: df[name].to_numpy() for name in df.columns})
+    assert_same_scores(add_scores(table), expected)
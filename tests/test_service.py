@@ -0,0 +1,80 @@
+import asyncio
+import json
+import logging
+import service
+from service import NoveltyService
+from stubs import StubServices
+from synthetic import make_response
+
+
+def test_versions_of_a_pk_are_scored_by_its_worker():
+    versions = [json.dumps(make_response(n, n_drugs=20, n_publications=200)).encode() for n in (100, 110)]
+    pks = ['pk-1', 'pk-2', 'pk-3', 'pk-4']
+
+    async def run():
+        scorer = NoveltyService(workers=2)
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(executor, service._ping) for executor in scorer.executors))
+        try:
+            # The versions of the PKs interleaved, as the ARS would send them
+            return [(await scorer.score(body, {'pk': [pk], 'level': ['result']}))['metrics']['split']['items']
+                    for body in versions for pk in pks]
+        finally:
+            await scorer.close()
+
+    with StubServices():
+        new_results = asyncio.run(run())
+    assert new_results == [100] * len(pks) + [10] * len(pks)
+
+
+def test_worker_of_a_pk_is_stable():
+    scorer = NoveltyService(workers=3)
+    try:
+        workers = {pk: scorer.worker_for(pk) for pk in (f'pk-{i}' for i in range(50))}
+        assert all(scorer.worker_for(pk) == worker for pk, worker in workers.items())
+        assert set(workers.values()) == {0, 1, 2}
+        scorer.in_flight[:] = [2, 0, 1]
+        assert scorer.worker_for(None) == 1
+    finally:
+        for executor in scorer.executors:
+            executor.shutdown()
+
+
+def post_scores(bodies):
+    """ Status and answer of a /score request per body, to a service scoring in a thread """
+    async def post(port, body):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(f'POST /score HTTP/1.1\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode()
+                     + body)
+        answer = await reader.read()
+        writer.close()
+        head, _, payload = answer.partition(b'\r\n\r\n')
+        return int(head.split()[1]), json.loads(payload)
+
+    async def run():
+        scorer = await NoveltyService(workers=0).start(port=0)
+        try:
+            return [await post(scorer.port, body) for body in bodies]
+        finally:
+            await scorer.close()
+
+    return asyncio.run(run())
+
+
+def test_malformed_requests_are_answered_with_a_400():
+    bodies = [b'{"fields"', b'[]', b'{"fields": {"data": {}}}', b'{"fields": {"status": "Done", "data": {}}}',
+              b'{"message": {"results": 1}}']
+    assert [status for status, _ in post_scores(bodies)] == [400] * len(bodies)
+
+
+def test_internal_errors_are_answered_with_a_500_and_logged(monkeypatch, caplog):
+    import novelty_score_calculation
+
+    def score_response(response, **kwargs):
+        raise KeyError('edges')
+
+    monkeypatch.setattr(novelty_score_calculation, 'score_response', score_response)
+    with caplog.at_level(logging.ERROR, logger='service'):
+        [(status, answer)] = post_scores([json.dumps(make_response(10)).encode()])
+    assert status == 500 and 'edges' in answer['error']
+    assert caplog.records[0].exc_info[0] is KeyError
@@ -0,0 +1,41 @@
+import pytest
+import extr_smile_molpro_by_id
+from extr_smile_molpro_by_id import mol_to_smile_molpro, NO_SMILES
+
+MOLECULES = [f'CHEBI:{i}' for i in range(450)]
+# Known to MolePro but without SMILES
+WITHOUT_SMILES = {'CHEBI:3', 'CHEBI:300'}
+
+
+@pytest.fixture
+def molepro(monkeypatch):
+    """ Fake MolePro: records the molecules of each request. """
+    requests = []
+
+    def mol_to_smile_molpro_chunk(molecules):
+        requests.append(list(molecules))
+        return {mol: (NO_SMILES if mol in WITHOUT_SMILES else 'C' * (1 + int(mol.split(':')[1]) % 5))
+                for mol in molecules}
+
+    monkeypatch.setattr(extr_smile_molpro_by_id, 'mol_to_smile_molpro_chunk', mol_to_smile_molpro_chunk)
+    return requests
+
+
+def test_molecules_are_deduplicated_and_chunked(molepro):
+    molecules = MOLECULES[::-1] + MOLECULES[:100]
+    smiles = mol_to_smile_molpro(molecules, chunk_size=200, max_workers=2)
+    assert sorted(len(chunk) for chunk in molepro) == [50, 200, 200]
+    # The order of the input molecules is kept
+    assert list(smiles) == MOLECULES[::-1]
+    assert smiles['CHEBI:3'] == NO_SMILES
+    assert smiles['CHEBI:7'] == 'CCC'
+
+
+def test_answers_are_cached(molepro):
+    smiles = mol_to_smile_molpro(MOLECULES)
+    requests = len(molepro)
+    # Molecules without SMILES are cached too, and come back as NO_SMILES
+    assert mol_to_smile_molpro(MOLECULES) == smiles
+    assert len(molepro) == requests
+    mol_to_smile_molpro(MOLECULES + ['CHEBI:1000'])
+    assert molepro[-1] == ['CHEBI:1000']
@@ -0,0 +1,46 @@
+import io
+import json
+import random
+import numpy as np
+import pytest
+from novelty_score_calculation import score_response
+from stream import ScoreRecord, TopK, iter_scores, write_ndjson
+from stubs import StubServices
+from synthetic import make_response
+
+
+@pytest.fixture(scope='module')
+def synthetic_response():
+    return make_response(n_results=300, seed=3)
+
+
+def rounded(pairs):
+    return sorted((key, None if np.isnan(score) else round(score, 12)) for key, score in pairs)
+
+
+@pytest.mark.parametrize('level', ['edge', 'result', 'drug'])
+def test_streamed_scores_are_the_ones_of_score_response(synthetic_response, level):
+    key = 'result' if level == 'result' else 'drug'
+    with StubServices():
+        # Small batches, so that the response spans many of them
+        records = list(iter_scores(synthetic_response, level=level, batch_drugs=2, max_batch_drugs=8))
+        df = score_response(synthetic_response, level=level)
+    streamed = [(record.edge if level == 'result' else record.drug, record.novelty_score) for record in records]
+    assert rounded(streamed) == rounded(zip(df[key], df['novelty_score']))
+
+
+def test_top_k_keeps_the_best_records_in_order():
+    rng = random.Random(0)
+    records = [ScoreRecord(f'CHEBI:{i}', None, rng.choice([0.1, 0.5, 0.9, rng.random()]), {}) for i in range(500)]
+    expected = sorted(records, key=lambda record: -record.novelty_score)[:20]
+    assert TopK(20).extend(records).items() == expected
+    assert len(TopK(1000).extend(records)) == len(records)
+
+
+def test_write_ndjson_writes_a_line_per_record():
+    records = [ScoreRecord('CHEBI:1', 'e0', 0.5, {'recency': np.nan}), ScoreRecord('CHEBI:2', 'e1', 0.25, {})]
+    f = io.BytesIO()
+    assert write_ndjson(iter(records), f) == 2
+    lines = [json.loads(line) for line in f.getvalue().splitlines()]
+    assert lines == [{'drug': 'CHEBI:1', 'edge': 'e0', 'novelty_score': 0.5, 'factors': {'recency': None}},
+                     {'drug': 'CHEBI:2', 'edge': 'e1', 'novelty_score': 0.25, 'factors': {}}]
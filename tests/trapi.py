@@ -0,0 +1,58 @@
+"""
+Small merged TRAPI responses, as returned by the ARS, for a disease -> chemical 1-hop query on DISEASE.
+"""
+
+DISEASE = 'MONDO:0005148'
+
+
+def edge(drug, source, publications=(), fda=None, subject=True):
+    """
+    Args:
+        drug: str: CURIE of the drug
+        source: str: primary knowledge source, e.g. infores:chembl (known) or infores:aragorn (inferred)
+        publications: Iterable of publication IDs
+        fda: optional value of the FDA approval status attribute
+        subject: bool: the drug is the subject of the edge, otherwise its object
+
+    Returns:
+        Dict: knowledge graph edge
+    """
+    attributes = []
+    if publications:
+        attributes.append({'attribute_type_id': 'biolink:publications', 'value': list(publications)})
+    if fda is not None:
+        attributes.append({'attribute_type_id': 'biolink:FDA_approval_status', 'value': fda})
+    return {'subject': drug if subject else DISEASE, 'object': DISEASE if subject else drug,
+            'predicate': 'biolink:treats', 'attributes': attributes,
+            'sources': [{'resource_id': source, 'resource_role': 'primary_knowledge_source'},
+                        {'resource_id': 'infores:aragorn', 'resource_role': 'aggregator_knowledge_source'}]}
+
+
+def response(results, status='Done'):
+    """
+    Args:
+        results: List: per result, a Dict: edge ID -> edge bound to the query edge; the drug of the result is the
+            one of its first edge
+
+    Returns:
+        Dict: merged response
+    """
+    edges = {}
+    trapi_results = []
+    for result in results:
+        edges.update(result)
+        first = next(iter(result.values()))
+        drug = first['subject'] if first['object'] == DISEASE else first['object']
+        trapi_results.append({
+            'node_bindings': {'sn': [{'id': drug}], 'on': [{'id': DISEASE}]},
+            'analyses': [{'resource_id': 'infores:ars', 'edge_bindings': {'t_edge': [{'id': x} for x in result]}}],
+        })
+    nodes = {x: {'categories': ['biolink:SmallMolecule']} for e in edges.values() for x in (e['subject'], e['object'])}
+    nodes[DISEASE] = {'categories': ['biolink:Disease']}
+    return {'fields': {'status': status, 'data': {'message': {
+        'query_graph': {'nodes': {'on': {'ids': [DISEASE], 'categories': ['biolink:Disease']},
+                                  'sn': {'categories': ['biolink:ChemicalEntity']}},
+                        'edges': {'t_edge': {'subject': 'sn', 'object': 'on', 'predicates': ['biolink:treats']}}},
+        'knowledge_graph': {'nodes': nodes, 'edges': edges},
+        'results': trapi_results,
+    }}}}